@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput and learning curve of parallel trainers with synced local copies
+of the global network (default) against hogwild trainers that read and
+update the global variables directly (--hogwild).
+
+Every trainer thread fits the base value head to the values of a fixed
+random teacher network on random states, so both designs optimize the same
+objective without an environment. The value error of the global network on
+held out states is printed as the learning curve, followed by the steps per
+second, the graph size and the build time of each design.
+
+  python benchmark_hogwild.py --threads 8 --seconds 30
+
+For curves on a real task run main.py with and without --hogwild and compare
+the tensorboard scores.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+
+from model.fc_model import UnrealModel
+from train.rmsprop_applier import RMSPropApplier
+
+
+def _teacher_values(states, seed=0):
+  # fixed random two layer network
+  random = np.random.RandomState(seed)
+  w1 = random.normal(0., 1. / np.sqrt(states.shape[1]), [states.shape[1], 32])
+  w2 = random.normal(0., 1. / np.sqrt(32), [32])
+  return np.tanh(states.dot(w1)).dot(w2).astype(np.float32)
+
+
+def _build(args, hogwild):
+  start = time.time()
+  global_net = UnrealModel(args.action_size, args.obs_size, -1, 0., args.device,
+                           flat_params=args.flat_params, resource_variables=hogwild)
+  grad_applier = RMSPropApplier(learning_rate=args.learning_rate, clip_norm=40.0, device=args.device)
+  trainers = []
+  for k in range(args.threads):
+    local_net = UnrealModel(args.action_size, args.obs_size, k+1, 0., args.device, value_lambda=1.,
+                            flat_params=args.flat_params,
+                            shared_network=global_net if hogwild else None)
+    local_net.prepare_loss()
+    apply_gradients, _ = grad_applier.minimize_local(local_net.total_loss, global_net.get_vars(),
+                                                     local_net.get_vars())
+    trainers.append((local_net, apply_gradients, local_net.sync_from(global_net)))
+  init_op = tf.global_variables_initializer()
+  return global_net, trainers, init_op, time.time() - start
+
+
+def _train(sess, trainer, states, values, args, steps, stop):
+  local_net, apply_gradients, sync = trainer
+  random = np.random.RandomState()
+  actions = np.zeros([args.batch_size, args.action_size], dtype=np.float32)
+  actions[:, 0] = 1.
+  advantages = np.zeros([args.batch_size], dtype=np.float32)
+  while not stop.is_set():
+    sess.run(sync)
+    batch = random.randint(len(states), size=args.batch_size)
+    sess.run(apply_gradients,
+             feed_dict={local_net.base_input: states[batch],
+                        local_net.base_a: actions,
+                        local_net.base_adv: advantages,
+                        local_net.base_r: values[batch]})
+    steps.append(1)
+
+
+def _run(args, hogwild):
+  random = np.random.RandomState(1)
+  states = random.random_sample([4096, args.obs_size]).astype(np.float32)
+  values = _teacher_values(states)
+  eval_states = random.random_sample([512, args.obs_size]).astype(np.float32)
+  eval_values = _teacher_values(eval_states)
+  last_action_rewards = np.zeros([len(eval_states), args.action_size+1], dtype=np.float32)
+
+  with tf.Graph().as_default():
+    global_net, trainers, init_op, build_time = _build(args, hogwild)
+    num_ops = len(tf.get_default_graph().get_operations())
+    num_params = sum(int(np.prod(v.get_shape().as_list())) for v in tf.global_variables())
+    with tf.Session() as sess:
+      sess.run(init_op)
+      steps = []
+      stop = threading.Event()
+      threads = [threading.Thread(target=_train, args=(sess, trainer, states, values, args, steps, stop))
+                 for trainer in trainers]
+      start = time.time()
+      for thread in threads:
+        thread.start()
+      curve = []
+      while time.time() - start < args.seconds:
+        time.sleep(args.log_interval)
+        predicted = global_net.run_base_values(sess, eval_states, last_action_rewards)
+        curve.append((time.time() - start, len(steps), float(np.mean(np.square(predicted - eval_values)))))
+      stop.set()
+      for thread in threads:
+        thread.join()
+      elapsed = time.time() - start
+  return {"steps_per_second": len(steps) / elapsed, "curve": curve, "build_time": build_time,
+          "ops": num_ops, "params": num_params}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--obs_size", type=int, default=128)
+  parser.add_argument("--action_size", type=int, default=6)
+  parser.add_argument("--threads", type=int, default=4)
+  parser.add_argument("--batch_size", type=int, default=32)
+  parser.add_argument("--learning_rate", type=float, default=0.0005)
+  parser.add_argument("--seconds", type=float, default=20.)
+  parser.add_argument("--log_interval", type=float, default=2.)
+  parser.add_argument("--flat_params", action="store_true")
+  parser.add_argument("--hogwild", action="store_true", help="only run the hogwild design")
+  parser.add_argument("--device", default="/cpu:0")
+  args = parser.parse_args()
+
+  designs = [("hogwild", True)] if args.hogwild else [("local copies", False), ("hogwild", True)]
+  results = [(name, _run(args, hogwild)) for name, hogwild in designs]
+
+  for name, result in results:
+    print("{}:".format(name))
+    for elapsed, steps, error in result["curve"]:
+      print("  {:6.1f}s {:8d} steps  value mse {:.5f}".format(elapsed, steps, error))
+  for name, result in results:
+    print("{:14s} {:8.1f} steps/s  {:6d} graph ops  {:8d} variable floats  {:5.2f}s build".format(
+      name, result["steps_per_second"], result["ops"], result["params"], result["build_time"]))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Per-step actor latency of the training build of UnrealModel (policy and value
+through the dropout trunk) against the inference build used by the runners
+(inference_only=True: no dropout, no summaries, in-graph action sampling).
+
+  python benchmark_inference.py --obs_size 128 --action_size 6 --steps 5000
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+
+from model.fc_model import UnrealModel
+
+
+def _count_ops(graph, scope_name):
+  return len([op for op in graph.get_operations() if op.name.startswith(scope_name + "/")])
+
+
+def _time_steps(run_step, states, steps, warmup=100):
+  for i in range(warmup):
+    run_step(states[i % len(states)])
+  start = time.time()
+  for i in range(steps):
+    run_step(states[i % len(states)])
+  return (time.time() - start) / steps
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--obs_size", type=int, default=128)
+  parser.add_argument("--action_size", type=int, default=6)
+  parser.add_argument("--batch_size", type=int, default=1, help="states per actor step")
+  parser.add_argument("--steps", type=int, default=5000)
+  parser.add_argument("--device", default="/cpu:0")
+  args = parser.parse_args()
+
+  global_net = UnrealModel(args.action_size, args.obs_size, -1, 0.001, args.device)
+  train_net = UnrealModel(args.action_size, args.obs_size, "bench_train", 0.001, args.device)
+  inference_net = UnrealModel(args.action_size, args.obs_size, "bench_inference", 0.001, args.device,
+                              inference_only=True)
+  syncs = [train_net.sync_from(global_net), inference_net.sync_from(global_net)]
+
+  random = np.random.RandomState(0)
+  states = random.random_sample([64, args.batch_size, args.obs_size]).astype(np.float32)
+  last_action_rewards = np.zeros([args.batch_size, args.action_size+1], dtype=np.float32)
+
+  with tf.Session() as sess:
+    sess.run(tf.global_variables_initializer())
+    sess.run(syncs)
+
+    def train_step(batch):
+      # the actor fetch of the training build
+      sess.run([train_net.base_pi, train_net.base_v],
+               feed_dict={train_net.base_input: batch,
+                          train_net.base_last_action_reward_input: last_action_rewards})
+
+    def inference_step(batch):
+      inference_net.run_base_actions_and_values(sess, batch, last_action_rewards)
+
+    results = [("training build", train_net, _time_steps(train_step, states, args.steps)),
+               ("inference build", inference_net, _time_steps(inference_step, states, args.steps))]
+
+  graph = tf.get_default_graph()
+  for name, net, latency in results:
+    print("{:16s} {:8.1f} us/step  {:5d} graph ops".format(
+      name, latency * 1e6, _count_ops(graph, "net_{}".format(net._thread_index))))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+
+class EnvGroup(object):
+  """
+  A group of environments that is stepped together.
+  Actions for all members are sent with step_async() and the results are
+  collected with step_wait(), so the caller can do other work (e.g. inference
+  for another group) while the worker processes step their emulators.
+  """
+  def __init__(self, envs):
+    self.envs = envs
+
+  def __len__(self):
+    return len(self.envs)
+
+  def reset(self):
+    states = []
+    last_action_rewards = []
+    for env in self.envs:
+      state, last_action_reward = env.reset()
+      states.append(state)
+      last_action_rewards.append(last_action_reward)
+    return states, last_action_rewards
+
+  def reset_env(self, index):
+    return self.envs[index].reset()
+
+  def step_async(self, actions):
+    for env, action in zip(self.envs, actions):
+      env.step_async(action)
+
+  def step_wait(self):
+    states = []
+    rewards = []
+    terminals = []
+    pixel_changes = []
+    for env in self.envs:
+      state, reward, terminal, pixel_change = env.step_wait()
+      states.append(state)
+      rewards.append(reward)
+      terminals.append(terminal)
+      pixel_changes.append(pixel_change)
+    return states, rewards, terminals, pixel_changes
+
+  def stop(self):
+    for env in self.envs:
+      env.stop()
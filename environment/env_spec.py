@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import threading
+import logging
+import numpy as np
+from collections import namedtuple
+
+logger = logging.getLogger("StRADRL.env_spec")
+
+# default on-disk cache, next to checkpoints and logs
+SPEC_CACHE_FILE = "/tmp/StRADRL/env_specs.json"
+
+EnvSpec = namedtuple("EnvSpec", ["action_size", "obs_shape", "obs_dtype"])
+
+_specs = {}
+_lock = threading.Lock()
+
+
+def get_env_spec(env_type, env_name, cache_file=SPEC_CACHE_FILE, **probe_kwargs):
+  """
+  Return the EnvSpec of an environment.
+  Each (env_type, env_name) is probed once; the result is cached in-process
+  and in cache_file so later runs don't start a throwaway emulator.
+  probe_kwargs (e.g. the maze size) are passed to the probe and are part of
+  the cache key.
+  """
+  key = ":".join(["{}:{}".format(env_type, env_name)] +
+                 ["{}={}".format(k, v) for k, v in sorted(probe_kwargs.items())])
+  with _lock:
+    if key in _specs:
+      return _specs[key]
+
+    cached = _load(cache_file)
+    if key in cached:
+      entry = cached[key]
+      spec = EnvSpec(entry["action_size"], tuple(entry["obs_shape"]), entry["obs_dtype"])
+    else:
+      logger.debug("probing environment spec of {}".format(key))
+      spec = _probe(env_type, env_name, **probe_kwargs)
+      cached[key] = {"action_size": spec.action_size,
+                     "obs_shape": list(spec.obs_shape),
+                     "obs_dtype": spec.obs_dtype}
+      _save(cache_file, cached)
+    _specs[key] = spec
+    return spec
+
+
+def _probe(env_type, env_name, **probe_kwargs):
+  if env_type in ('maze', 'maze_batch', 'tf_maze'):
+    from . import maze_environment_pro
+    action_size, obs_shape, obs_dtype = maze_environment_pro.MazeEnvironment.probe_spec(**probe_kwargs)
+  elif env_type == 'synthetic':
+    from . import synthetic_environment
+    action_size, obs_shape, obs_dtype = synthetic_environment.SyntheticEnvironment.probe_spec(**probe_kwargs)
+  elif env_type == 'lab':
+    from . import lab_environment
+    action_size, obs_shape, obs_dtype = lab_environment.LabEnvironment.probe_spec(env_name, **probe_kwargs)
+  elif env_type == 'replay':
+    from . import replay_environment
+    action_size, obs_shape, obs_dtype = replay_environment.ReplayEnvironment.probe_spec(env_name)
+  elif env_type == 'mujoco':
+    from . import mujoco_environment
+    action_size, obs_shape, obs_dtype = mujoco_environment.MujocoEnvironment.probe_spec()
+  else:
+    from . import gym_environment
+    action_size, obs_shape, obs_dtype = gym_environment.GymEnvironment.probe_spec(env_name)
+  return EnvSpec(int(action_size), tuple(int(d) for d in obs_shape), np.dtype(obs_dtype).name)
+
+
+def _load(cache_file):
+  if cache_file is None or not os.path.exists(cache_file):
+    return {}
+  try:
+    with open(cache_file, 'r') as f:
+      return json.load(f)
+  except ValueError:
+    logger.warn("ignoring corrupt environment spec cache {}".format(cache_file))
+    return {}
+
+
+def _save(cache_file, specs):
+  if cache_file is None:
+    return
+  cache_dir = os.path.dirname(cache_file)
+  if cache_dir and not os.path.exists(cache_dir):
+    os.makedirs(cache_dir)
+  # write to a temporary file first so concurrent runs never read a partial file
+  tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+  with open(tmp_file, 'w') as f:
+    json.dump(specs, f, indent=2, sort_keys=True)
+  os.rename(tmp_file, cache_file)
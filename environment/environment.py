@@ -3,62 +3,99 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
 import numpy as np
 import cv2
 
+from environment import env_spec
+
+
+def repeat_step(env, action, action_repeat=1, max_pool_frames=False):
+  """
+  Step a gym style env action_repeat times with the same action inside the
+  worker process, summing the rewards. With max_pool_frames the returned
+  observation is the element-wise max over the last two frames.
+  """
+  reward = 0
+  last_obs = None
+  for i in range(action_repeat):
+    if max_pool_frames and i == action_repeat - 1 and i > 0:
+      last_obs = obs
+    obs, r, terminal, _ = env.step(action)
+    reward += r
+    if terminal:
+      break
+  if last_obs is not None:
+    obs = np.maximum(obs, last_obs)
+  return obs, reward, terminal
+
 
 class Environment(object):
   # cached action size
   action_size = -1
   # cached obs size
   obs_size = -1
+  # number of crashed or hung env workers that were replaced
+  worker_restarts = 0
+  _restart_lock = threading.Lock()
   
   @staticmethod
-  def create_environment(env_type, env_name):
+  def create_environment(env_type, env_name, **kwargs):
+    # kwargs are passed to the backend (e.g. action_repeat for worker based
+    # environments, size and wall_density for the maze)
     if env_type == 'maze':
       from . import maze_environment_pro
-      return maze_environment_pro.MazeEnvironment()
+      return maze_environment_pro.MazeEnvironment(**kwargs)
     elif env_type == 'lab':
       from . import lab_environment
-      return lab_environment.LabEnvironment(env_name)
+      return lab_environment.LabEnvironment(env_name, **kwargs)
+    elif env_type == 'synthetic':
+      from . import synthetic_environment
+      return synthetic_environment.SyntheticEnvironment(**kwargs)
+    elif env_type == 'replay':
+      # env_name is the path of a recording
+      from . import replay_environment
+      return replay_environment.ReplayEnvironment(env_name)
     elif env_type == 'mujoco':
       from . import mujoco_environment
-      return mujoco_environment.MujocoEnvironment()
+      return mujoco_environment.MujocoEnvironment(**kwargs)
     else:
       from . import gym_environment
-      return gym_environment.GymEnvironment(env_name)
+      return gym_environment.GymEnvironment(env_name, **kwargs)
   
   @staticmethod
-  def get_action_size(env_type, env_name):
+  def count_worker_restart():
+    with Environment._restart_lock:
+      Environment.worker_restarts += 1
+
+  @staticmethod
+  def get_spec(env_type, env_name, **probe_kwargs):
+    return env_spec.get_env_spec(env_type, env_name, **probe_kwargs)
+
+  @staticmethod
+  def get_action_size(env_type, env_name, **probe_kwargs):
     if Environment.action_size >= 0:
       return Environment.action_size
 
-    if env_type == 'maze':
-      from . import maze_environment_pro
-      Environment.action_size = \
-        maze_environment_pro.MazeEnvironment.get_action_size()
-    elif env_type == 'lab':
-      from . import lab_environment
-      Environment.action_size = \
-        lab_environment.LabEnvironment.get_action_size(env_name)
-    elif env_type == 'mujoco':
-      from . import mujoco_environment
-      Environment.action_size = \
-        mujoco_environment.MujocoEnvironment.get_action_size()
-    else:
-      from . import gym_environment
-      Environment.action_size = \
-        gym_environment.GymEnvironment.get_action_size(env_name)
+    Environment.action_size = Environment.get_spec(env_type, env_name, **probe_kwargs).action_size
     return Environment.action_size
     
   @staticmethod
-  def get_obs_size(env_type, env_name):
+  def get_obs_size(env_type, env_name, preprocessing=None, **probe_kwargs):
     if Environment.obs_size >= 0:
       return Environment.obs_size
     
-    from . import gym_environment
-    Environment.obs_size = \
-      gym_environment.GymEnvironment.get_obs_size(env_name)
+    spec = Environment.get_spec(env_type, env_name, **probe_kwargs)
+    obs_shape = spec.obs_shape
+    if preprocessing is None and env_type == 'lab':
+      # lab workers always preprocess, by default to the RGB or depth channels of visinput
+      from . import lab_environment
+      visinput = probe_kwargs.get("visinput", lab_environment.DEFAULT_VISINPUT)
+      preprocessing = lab_environment.LabEnvironment.default_preprocessing(len(visinput[0]))
+    if preprocessing is not None:
+      # the networks see the observations after the worker side preprocessing
+      obs_shape, _ = preprocessing.output_spec(spec.obs_shape, spec.obs_dtype)
+    Environment.obs_size = int(np.prod(obs_shape))
     return Environment.obs_size
 
   def __init__(self):
@@ -67,6 +104,13 @@ class Environment(object):
   def process(self, action):
     pass
 
+  def step_async(self, action):
+    # Environments without a worker process are stepped in step_wait()
+    self._pending_action = action
+
+  def step_wait(self):
+    return self.process(self._pending_action)
+
   def reset(self):
     pass
 
@@ -7,9 +7,37 @@ import unittest
 import numpy as np
 
 from environment.environment import Environment
+from environment.preprocessing import Pipeline
 
 
 class TestEnvironment(unittest.TestCase):
+  def tearDown(self):
+    Environment.obs_size = -1
+
+  def test_obs_size_after_preprocessing(self):
+    Environment.obs_size = -1
+    pipeline = Pipeline.parse("channels:0:1:2,cast:float32")
+    obs_size = Environment.get_obs_size("synthetic", "", preprocessing=pipeline,
+                                        obs_size=12, action_size=4, cache_file=None)
+    self.assertEqual( obs_size, 3 )
+    # the trainers read the cached size without the pipeline
+    self.assertEqual( Environment.get_obs_size("synthetic", ""), 3 )
+
+  def test_lab_obs_size(self):
+    try:
+      import deepmind_lab
+    except ImportError:
+      print("Failed to import lab. Skipping lab observation size testing.")
+      return
+    # the depth channel of a 64x48 frame, derived from visinput
+    obs_size = Environment.get_obs_size("lab", "nav_maze_static_01", visinput=("D", 48, 64), cache_file=None)
+    self.assertEqual( obs_size, 48 * 64 )
+    Environment.obs_size = -1
+    pipeline = Pipeline.parse("channels:0:1:2:3,cast:float32")
+    obs_size = Environment.get_obs_size("lab", "nav_maze_static_01", preprocessing=pipeline,
+                                        visinput=("RGBD", 48, 64), cache_file=None)
+    self.assertEqual( obs_size, 48 * 64 * 4 )
+
   def test_lab(self):
     has_lab = True
     try:
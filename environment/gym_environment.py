@@ -4,12 +4,16 @@ from __future__ import division
 from __future__ import print_function
 
 from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+import time
 import numpy as np
-import cv2
 import gym
 import logging
 
 from environment import environment
+from environment import env_spec
+from environment.shared_obs import SharedObservation
+from environment import worker_timing
 
 COMMAND_RESET     = 0
 COMMAND_ACTION    = 1
@@ -18,15 +22,18 @@ COMMAND_RENDER    = 3
 
 logger = logging.getLogger("StRADRL.gym_environment")
 
-"""
-def preprocess_frame(observation):
-  # observation shape = (210, 160, 3)
-  observation = observation.astype(np.float32)
-  resized_observation = cv2.resize(observation, (84, 84))
-  resized_observation = resized_observation / 255.0
-  return resized_observation
-"""
-def worker(conn, env_name):
+# worker restarts tried by reset() before giving up
+MAX_RESET_RESTARTS = 3
+
+
+class WorkerError(Exception):
+  pass
+
+
+def worker(conn, env_name, shared_obs, action_repeat, max_pool_frames, auto_reset, timing, preprocessing):
+  # observations are written to shared_obs, the pipe only carries control messages
+  # preprocessing (a preprocessing.Pipeline or None) runs here, off the actor thread
+  timer = worker_timing.CommandTimer() if timing else None
   env = gym.make(env_name)
   env.reset()
   conn.send(0)
@@ -34,25 +41,38 @@ def worker(conn, env_name):
   while True:
     command, arg = conn.recv()
 
+    if timer:
+      timer.start()
+
     if command == COMMAND_RESET:
       obs = env.reset()
-      #state = preprocess_frame(obs)
-      state = obs
-      conn.send(state)
+      if preprocessing:
+        obs = preprocessing.process_obs(obs)
+      shared_obs.write(obs)
+      if timer:
+        timer.stop("reset")
+      conn.send(timer.flush() if timer else 0)
     elif command == COMMAND_ACTION:
-      reward = 0
-      for i in range(1):
-        obs, r, terminal, _ = env.step(arg)
-        reward += r
-        if terminal:
-          break
-      #state = preprocess_frame(obs)
-      state = obs
-      conn.send([state, reward, terminal])
+      obs, reward, terminal = environment.repeat_step(env, arg, action_repeat, max_pool_frames)
+      if terminal and auto_reset:
+        # start the next episode right away, the runner discards the terminal frame
+        obs = env.reset()
+      if preprocessing:
+        obs = preprocessing.process_obs(obs)
+        reward = preprocessing.process_reward(reward)
+      shared_obs.write(obs)
+      if timer:
+        timer.stop("step")
+        conn.send([reward, terminal, timer.flush()])
+      else:
+        conn.send([reward, terminal])
     elif command == COMMAND_TERMINATE:
       break
     elif command == COMMAND_RENDER:
         env.render()
+        if timer:
+          # render has no reply, the sample goes out with the next one
+          timer.stop("render")
     else:
       print("bad command: {}".format(command))
   env.close()
@@ -62,31 +82,107 @@ def worker(conn, env_name):
 
 class GymEnvironment(environment.Environment):
   @staticmethod
-  def get_action_size(env_name):
+  def probe_spec(env_name):
+    # action size, observation shape and dtype from a single throwaway env
     env = gym.make(env_name)
     action_size = env.action_space.n
+    obs = np.asarray(env.reset())
     env.close()
-    return action_size
-    
-  @staticmethod  
-  def get_obs_size(env_name):
-    env = gym.make(env_name)
-    obs_size = np.size(env.reset())
-    env.close()
-    return obs_size
+    return action_size, obs.shape, obs.dtype
   
-  def __init__(self, env_name):
+  def __init__(self, env_name, action_repeat=1, max_pool_frames=False, auto_reset=False, step_timeout=0,
+               reset_timeout=0, timing=False, preprocessing=None):
     environment.Environment.__init__(self)
 
-    self.conn, child_conn = Pipe()
-    self.proc = Process(target=worker, args=(child_conn, env_name))
-    self.proc.start()
-    self.conn.recv()
+    self.auto_reset = auto_reset
+    # a step and a start or reset of the worker are timed out separately,
+    # resets (and gym.make) may be much slower than a healthy step
+    self.step_timeout = step_timeout
+    self.reset_timeout = reset_timeout
+    self.timing = timing
+    self._reset_state = None
+    spec = env_spec.get_env_spec('gym', env_name)
+    obs_shape, obs_dtype = spec.obs_shape, spec.obs_dtype
+    if preprocessing:
+      obs_shape, obs_dtype = preprocessing.output_spec(obs_shape, obs_dtype)
+    self.shared_obs = SharedObservation(obs_shape, obs_dtype)
+    self._worker_args = (env_name, self.shared_obs, action_repeat, max_pool_frames, auto_reset, timing,
+                         preprocessing)
+    self._start_worker()
     self.reset()
 
+  def _start_worker(self):
+    self.conn, child_conn = Pipe()
+    self.proc = Process(target=worker, args=(child_conn,) + self._worker_args)
+    try:
+      self.proc.start()
+    finally:
+      # only the worker holds the child end, so the pipe reports EOF once it exits
+      child_conn.close()
+    try:
+      self._recv(self.reset_timeout)
+    except WorkerError:
+      # don't leave a hung worker behind
+      if self.proc.is_alive():
+        self.proc.terminate()
+      self.proc.join()
+      self.conn.close()
+      raise
+
+  def _restart_worker(self, reason):
+    # replace a dead or hung worker, the current episode is lost
+    logger.warn("gym worker {} ({}), restarting".format(reason, self.proc.pid))
+    if self.proc.pid is not None:
+      # not set if the previous restart failed to start the process
+      if self.proc.is_alive():
+        self.proc.terminate()
+      self.proc.join()
+    self.conn.close()
+    self._reset_state = None
+    environment.Environment.count_worker_restart()
+    self._start_worker()
+
+  def _step_timeout(self):
+    if self.step_timeout <= 0:
+      return 0
+    if self.auto_reset:
+      # the worker resets right away after a terminal step
+      return self.step_timeout + self.reset_timeout if self.reset_timeout > 0 else 0
+    return self.step_timeout
+
+  def _recv(self, timeout):
+    # wait for a reply, the worker exiting (its sentinel) or the timeout (0 = no limit),
+    # so a dead or hung worker is noticed instead of blocking on the pipe forever
+    try:
+      ready = wait([self.conn, self.proc.sentinel], timeout if timeout > 0 else None)
+      if self.conn in ready:
+        return self.conn.recv()
+    except (EOFError, IOError, OSError):
+      raise WorkerError("closed the pipe")
+    if ready:
+      raise WorkerError("died")
+    raise WorkerError("timed out after {} sec".format(timeout))
+
   def reset(self):
-    self.conn.send([COMMAND_RESET, 0])
-    self.last_state = self.conn.recv()
+    if self._reset_state is not None:
+      # the worker already reset after the terminal step
+      self.last_state, self._reset_state = self._reset_state, None
+    else:
+      error = None
+      for restarts in range(MAX_RESET_RESTARTS + 1):
+        try:
+          if error is not None:
+            self._restart_worker(error)
+          self.conn.send([COMMAND_RESET, 0])
+          samples = self._recv(self.reset_timeout)
+          break
+        except (WorkerError, IOError, OSError) as e:
+          error = e
+      else:
+        raise WorkerError("reset failed after {} worker restarts ({})".format(MAX_RESET_RESTARTS, error))
+      self.last_state = self.shared_obs.read()
+      if self.timing:
+        worker_timing.record(samples)
     
     self.last_action = 0
     self.last_reward = 0
@@ -96,28 +192,58 @@ class GymEnvironment(environment.Environment):
     return self.last_state, last_action_reward
 
   def stop(self):
-    self.conn.send([COMMAND_TERMINATE, 0])
-    ret = self.conn.recv()
+    try:
+      self.conn.send([COMMAND_TERMINATE, 0])
+      self._recv(self.step_timeout)
+    except (WorkerError, IOError, OSError):
+      self.proc.terminate()
     self.conn.close()
     self.proc.join()
     logger.warn("gym environment stopped")
 
   def process(self, action_oh):
+    self.step_async(action_oh)
+    return self.step_wait()
+
+  def step_async(self, action_oh):
+    # send the action without waiting for the worker to step the emulator
     action = np.argmax(action_oh)
-    self.conn.send([COMMAND_ACTION, action])
+    if self.timing:
+      self._sent_time = time.time()
     try:
-        state, reward, terminal = self.conn.recv()
-    except TypeError:
-        logger.warn("!! Received single int value, environment probably terminated !!")
-        logger.warn("Closing now")
-        self.conn.close()
-        self.proc.join()
-        logger.warn("gym environment stopped")
+      self.conn.send([COMMAND_ACTION, action])
+    except (IOError, OSError):
+      # the failure is handled when the result is collected
+      pass
+    self.last_action = action
+
+  def step_wait(self):
+    try:
+      reply = self._recv(self._step_timeout())
+    except WorkerError as e:
+      try:
+        self._restart_worker(e)
+      except (WorkerError, IOError, OSError) as restart_error:
+        # the episode is lost either way, the next reset() tries another restart
+        raise WorkerError("step failed (worker {}) and the restarted worker failed to start ({})".format(
+          e, restart_error))
+      # truncate the episode, the runner resets after a terminal step
+      return self.last_state, 0, True, []
+    reward, terminal = reply[0], reply[1]
+    if self.timing:
+      # round trip = emulator step + IPC + waiting for the worker
+      samples = reply[2]
+      samples["round_trip"] = [time.time() - self._sent_time]
+      worker_timing.record(samples)
+    if terminal and self.auto_reset:
+      self._reset_state = self.shared_obs.read()
+      state = self.last_state
+    else:
+      state = self.shared_obs.read()
     
     #pixel_change = self._calc_pixel_change(state, self.last_state)
     pixel_change = []
     self.last_state = state
-    self.last_action = action
     self.last_reward = reward
     return state, reward, terminal, pixel_change
     
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from multiprocessing import Process, Pipe
+import numpy as np
+import gym
+import logging
+
+from environment import env_spec
+from environment.environment import repeat_step
+from environment.shared_obs import SharedObservation
+
+COMMAND_RESET     = 0
+COMMAND_ACTION    = 1
+COMMAND_TERMINATE = 2
+COMMAND_RESET_ONE = 3
+
+logger = logging.getLogger("StRADRL.gym_vec_environment")
+
+
+def worker(conn, env_name, num_envs, shared_obs, action_repeat, max_pool_frames, auto_reset, preprocessing):
+  # hosts num_envs gym instances; observations of all of them are written
+  # to the stacked shared_obs slot, the pipe only carries control messages
+  envs = [gym.make(env_name) for _ in range(num_envs)]
+  # the envs of a worker share one preprocessing pipeline
+  process_obs = preprocessing.process_obs if preprocessing else (lambda obs: obs)
+  conn.send(0)
+
+  while True:
+    command, arg = conn.recv()
+
+    if command == COMMAND_RESET:
+      for i, env in enumerate(envs):
+        shared_obs.array[i] = process_obs(env.reset())
+      conn.send(0)
+    elif command == COMMAND_RESET_ONE:
+      shared_obs.array[arg] = process_obs(envs[arg].reset())
+      conn.send(0)
+    elif command == COMMAND_ACTION:
+      rewards = np.zeros([num_envs], dtype=np.float32)
+      terminals = np.zeros([num_envs], dtype=np.bool_)
+      for i, env in enumerate(envs):
+        obs, rewards[i], terminals[i] = repeat_step(env, arg[i], action_repeat, max_pool_frames)
+        if terminals[i] and auto_reset:
+          # start the next episode right away, the runner discards the terminal frame
+          obs = env.reset()
+        shared_obs.array[i] = process_obs(obs)
+        if preprocessing:
+          rewards[i] = preprocessing.process_reward(rewards[i])
+      conn.send([rewards, terminals])
+    elif command == COMMAND_TERMINATE:
+      break
+    else:
+      print("bad command: {}".format(command))
+  for env in envs:
+    env.close()
+  conn.send(0)
+  conn.close()
+
+
+class GymVecEnvironment(object):
+  """
+  Vectorized gym backend with the EnvGroup interface.
+  num_workers processes host envs_per_worker environments each and step them
+  in one batch per command, so the number of processes can be matched to the
+  number of cores independently of the number of environments.
+  Results are returned as arrays stacked over all environments.
+  """
+  def __init__(self, env_name, num_workers, envs_per_worker, action_repeat=1, max_pool_frames=False,
+               auto_reset=False, preprocessing=None):
+    spec = env_spec.get_env_spec('gym', env_name)
+    obs_shape, obs_dtype = spec.obs_shape, spec.obs_dtype
+    if preprocessing:
+      obs_shape, obs_dtype = preprocessing.output_spec(obs_shape, obs_dtype)
+    self.action_size = spec.action_size
+    self.envs_per_worker = envs_per_worker
+    self.num_envs = num_workers * envs_per_worker
+    self.auto_reset = auto_reset
+    self._reset_pending = np.zeros([self.num_envs], dtype=np.bool_)
+
+    self.shared_obs = []
+    self.conns = []
+    self.procs = []
+    for _ in range(num_workers):
+      shared_obs = SharedObservation((envs_per_worker,) + obs_shape, obs_dtype)
+      conn, child_conn = Pipe()
+      proc = Process(target=worker, args=(child_conn, env_name, envs_per_worker, shared_obs,
+                                          action_repeat, max_pool_frames, auto_reset, preprocessing))
+      proc.start()
+      self.shared_obs.append(shared_obs)
+      self.conns.append(conn)
+      self.procs.append(proc)
+    for conn in self.conns:
+      conn.recv()
+    self.reset()
+
+  def __len__(self):
+    return self.num_envs
+
+  def _read_states(self):
+    return np.concatenate([shared_obs.array for shared_obs in self.shared_obs])
+
+  def reset(self):
+    for conn in self.conns:
+      conn.send([COMMAND_RESET, 0])
+    for conn in self.conns:
+      conn.recv()
+    self.last_states = self._read_states()
+    self._reset_pending[:] = False
+    last_action_rewards = np.zeros([self.num_envs, self.action_size+1])
+    return self.last_states, last_action_rewards
+
+  def reset_env(self, index):
+    w, i = divmod(index, self.envs_per_worker)
+    if self._reset_pending[index]:
+      # the worker already reset after the terminal step
+      self._reset_pending[index] = False
+      state = self.last_states[index]
+    else:
+      self.conns[w].send([COMMAND_RESET_ONE, i])
+      self.conns[w].recv()
+      state = self.shared_obs[w].read()[i]
+      self.last_states[index] = state
+    return state, np.zeros([self.action_size+1])
+
+  def step_async(self, actions_oh):
+    # send the actions of all workers before collecting any result
+    actions = np.argmax(np.asarray(actions_oh), axis=1)
+    for w, conn in enumerate(self.conns):
+      conn.send([COMMAND_ACTION, actions[w*self.envs_per_worker:(w+1)*self.envs_per_worker]])
+
+  def step_wait(self):
+    results = [conn.recv() for conn in self.conns]
+    rewards = np.concatenate([r for r, _ in results])
+    terminals = np.concatenate([t for _, t in results])
+    self.last_states = self._read_states()
+    if self.auto_reset:
+      self._reset_pending = terminals.copy()
+    pixel_changes = [[]] * self.num_envs
+    return self.last_states, rewards, terminals, pixel_changes
+
+  def stop(self):
+    for conn in self.conns:
+      conn.send([COMMAND_TERMINATE, 0])
+    for conn, proc in zip(self.conns, self.procs):
+      conn.recv()
+      conn.close()
+      proc.join()
+    logger.warn("gym vec environment stopped")
@@ -4,11 +4,15 @@ from __future__ import division
 from __future__ import print_function
 
 from multiprocessing import Process, Pipe
+import time
 import numpy as np
 import deepmind_lab
 import logging
 
 from environment import environment
+from environment.shared_obs import SharedObservation
+from environment import worker_timing
+from environment.preprocessing import Pipeline, ChannelSelect, Cast
 
 logger = logging.getLogger('StRADRL.lab_environment')
 
@@ -16,7 +20,10 @@ COMMAND_RESET     = 0
 COMMAND_ACTION    = 1
 COMMAND_TERMINATE = 2
 
-def worker(conn, env_name, visinput):
+def worker(conn, env_name, visinput, shared_obs, action_repeat, max_pool_frames, auto_reset, timing,
+           preprocessing):
+  # preprocessed observations are written to shared_obs, the pipe only carries control messages
+  timer = worker_timing.CommandTimer() if timing else None
   level = env_name
   h = visinput[1]
   w = visinput[2]
@@ -32,22 +39,44 @@ def worker(conn, env_name, visinput):
   
   while True:
     command, arg = conn.recv()
+    if timer:
+      timer.start()
 
     if command == COMMAND_RESET:
       env.reset()
       #logger.warn("episode was reset")
-      obs = env.observations()['RGBD_INTERLACED']
-      conn.send(obs)
+      shared_obs.write(preprocessing.process_obs(env.observations()['RGBD_INTERLACED']))
+      if timer:
+        timer.stop("reset")
+      conn.send(timer.flush() if timer else 0)
     elif command == COMMAND_ACTION:
       #logger.debug(arg)
-      reward = env.step(arg, num_steps=4)
+      if max_pool_frames and action_repeat > 1:
+        # step all but the last frame in the emulator, then pool the last two
+        reward = env.step(arg, num_steps=action_repeat-1)
+        last_obs = env.observations()['RGBD_INTERLACED'] if env.is_running() else None
+        if last_obs is not None:
+          reward += env.step(arg, num_steps=1)
+      else:
+        reward = env.step(arg, num_steps=action_repeat)
+        last_obs = None
       #logger.debug(env.is_running())
       terminal = not env.is_running()
       if not terminal:
         obs = env.observations()['RGBD_INTERLACED']
+        if last_obs is not None:
+          obs = np.maximum(obs, last_obs)
+        shared_obs.write(preprocessing.process_obs(obs))
+      elif auto_reset:
+        # start the next episode right away and send its first frame instead
+        env.reset()
+        shared_obs.write(preprocessing.process_obs(env.observations()['RGBD_INTERLACED']))
+      reward = preprocessing.process_reward(reward)
+      if timer:
+        timer.stop("step")
+        conn.send([reward, terminal, timer.flush()])
       else:
-        obs = 0
-      conn.send([obs, reward, terminal])
+        conn.send([reward, terminal])
     elif command == COMMAND_TERMINATE:
       break
     else:
@@ -61,6 +90,15 @@ def _action(*entries):
   return np.array(entries, dtype=np.intc)
 
 
+# (channels, height, width) of the observations, "RGB", "D" or "RGBD"
+DEFAULT_VISINPUT = ("RGB", 84, 84)
+
+
+def _frame_shape(visinput):
+  # RGBD_INTERLACED frames as the level renders them
+  return (visinput[1], visinput[2], 4)
+
+
 class LabEnvironment(environment.Environment):
   ACTION_LIST = [
     _action(-30,   0,  0,  0, 0, 0, 0), # look_left
@@ -79,23 +117,48 @@ class LabEnvironment(environment.Environment):
   @staticmethod
   def get_action_size(env_name):
     return len(LabEnvironment.ACTION_LIST)
+
+  @staticmethod
+  def probe_spec(env_name, visinput=DEFAULT_VISINPUT):
+    # the raw RGBD frame of visinput, no need to start the level; the workers
+    # always preprocess it (see default_preprocessing)
+    return LabEnvironment.get_action_size(env_name), _frame_shape(visinput), np.uint8
+  
+  @staticmethod
+  def default_preprocessing(num_ch):
+    # RGB or depth channel of the RGBD_INTERLACED frame, scaled to [0,1]
+    channels = [3] if num_ch == 1 else [0, 1, 2]
+    return Pipeline([ChannelSelect(channels), Cast(np.float32, 1/255.)])
   
-  def __init__(self, env_name, visinput):
+  def __init__(self, env_name, visinput, action_repeat=4, max_pool_frames=False, auto_reset=False,
+               timing=False, preprocessing=None):
     environment.Environment.__init__(self)
     
-    self.num_ch = len(visinput[0])
+    if preprocessing is None:
+      preprocessing = LabEnvironment.default_preprocessing(len(visinput[0]))
+    self.auto_reset = auto_reset
+    self.timing = timing
+    self._reset_state = None
+    obs_shape, obs_dtype = preprocessing.output_spec(_frame_shape(visinput), np.uint8)
+    self.shared_obs = SharedObservation(obs_shape, obs_dtype)
     self.conn, child_conn = Pipe()
-    self.proc = Process(target=worker, args=(child_conn, env_name, visinput))
+    self.proc = Process(target=worker, args=(child_conn, env_name, visinput, self.shared_obs,
+                                             action_repeat, max_pool_frames, auto_reset, timing,
+                                             preprocessing))
     self.proc.start()
     self.conn.recv()
 
 
   def reset(self):
-    self.conn.send([COMMAND_RESET, 0])
-    obs = self.conn.recv()
-    #logger.debug("obs: {}".format(obs))
-    
-    self.last_state = self._preprocess_frame(obs, self.num_ch)
+    if self._reset_state is not None:
+      # the worker already reset after the terminal step
+      self.last_state, self._reset_state = self._reset_state, None
+    else:
+      self.conn.send([COMMAND_RESET, 0])
+      samples = self.conn.recv()
+      if self.timing:
+        worker_timing.record(samples)
+      self.last_state = self.shared_obs.read()
     
     logger.debug("processed obs shape: {}".format(self.last_state.shape))
     self.last_action = 0
@@ -112,26 +175,34 @@ class LabEnvironment(environment.Environment):
     logger.info("lab environment stopped")
 
   def process(self, action):
+    self.step_async(action)
+    return self.step_wait()
+
+  def step_async(self, action):
+    # send the action without waiting for the worker to step the level
     real_action = LabEnvironment.ACTION_LIST[action]
+    if self.timing:
+      self._sent_time = time.time()
     self.conn.send([COMMAND_ACTION, real_action])
-    obs, reward, terminal = self.conn.recv()
+    self.last_action = action
+
+  def step_wait(self):
+    reply = self.conn.recv()
+    reward, terminal = reply[0], reply[1]
+    if self.timing:
+      # round trip = level step + IPC + waiting for the worker
+      samples = reply[2]
+      samples["round_trip"] = [time.time() - self._sent_time]
+      worker_timing.record(samples)
     if not terminal:
-      state = self._preprocess_frame(obs, self.num_ch)
+      state = self.shared_obs.read()
     else:
+      if self.auto_reset:
+        self._reset_state = self.shared_obs.read()
       state = self.last_state
     
     pixel_change = self._calc_pixel_change(state, self.last_state)
     self.last_state = state
-    self.last_action = action
     self.last_reward = reward
     return state, reward, terminal, pixel_change
-    
-  def _preprocess_frame(self, image, channels=3):
-    if channels == 1:
-        image = image[...,3:]
-    elif channels == 3:
-        image = image[...,:3]
-    image = image.astype(np.float32)
-    image = image / 255.0
-    return image
 
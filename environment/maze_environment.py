@@ -6,46 +6,42 @@ from __future__ import print_function
 import numpy as np
 
 from environment import environment
+from environment import maze_generator
 
 class MazeEnvironment(environment.Environment):
+  """
+  Maze with a fixed start and a fixed goal, rendered with 12x12 pixels per
+  cell. The layout comes from maze_generator like in maze_environment_pro;
+  the goal is sampled once per maze instead of once per episode.
+  """
   @staticmethod
   def get_action_size():
     return 4
+
+  @staticmethod
+  def probe_spec(size=7):
+    return MazeEnvironment.get_action_size(), (size*12, size*12, 3), np.float64
   
-  def __init__(self):
+  def __init__(self, size=7, wall_density=0., seed=None):
     environment.Environment.__init__(self)
     
-    self._map_data = \
-                     "--+---G" \
-                     "--+-+++" \
-                     "S-+---+" \
-                     "--+++--" \
-                     "--+-+--" \
-                     "--+----" \
-                     "-----++" 
+    self._size = size
+    self._layout = maze_generator.generate_maze(size, wall_density, seed)
+    self._random = np.random.RandomState(seed)
     
     self._setup()
     self.reset()
 
   def _setup(self):
-    image = np.zeros( (84, 84, 3), dtype=float )
+    image = np.zeros( (self._size*12, self._size*12, 3), dtype=float )
 
-    start_pos = (-1, -1)
-    goal_pos  = (-1, -1)
-  
-    for y in range(7):
-      for x in range(7):
-        p = self._get_pixel(x,y)
-        if p == '+':
-          self._put_pixel(image, x, y, 0)
-        elif p == 'S':
-          start_pos = (x, y)
-        elif p == 'G':
-          goal_pos = (x, y)
+    for y, x in np.argwhere(self._layout.walls):
+      self._put_pixel(image, x, y, 0)
 
     self._maze_image = image
-    self._start_pos = start_pos
-    self._goal_pos = goal_pos
+    self._start_pos = self._layout.start
+    self._goal_pos = maze_generator.sample_goals(self._layout.walls, self._start_pos, 1,
+                                                 random=self._random)[0]
     
   def reset(self):
     self.x = self._start_pos[0]
@@ -62,12 +58,8 @@ class MazeEnvironment(environment.Environment):
       for j in range(12):
         image[12*y + j, 12*x + i, channel] = 1.0
         
-  def _get_pixel(self, x, y):
-    data_pos = y * 7 + x
-    return self._map_data[data_pos]
-
   def _is_wall(self, x, y):
-    return self._get_pixel(x, y) == '+'
+    return self._layout.walls[y, x]
 
   def _clamp(self, n, minn, maxn):
     if n < minn:
@@ -80,8 +72,8 @@ class MazeEnvironment(environment.Environment):
     new_x = self.x + dx
     new_y = self.y + dy
 
-    new_x, clamped_x = self._clamp(new_x, 0, 6)
-    new_y, clamped_y = self._clamp(new_y, 0, 6)
+    new_x, clamped_x = self._clamp(new_x, 0, self._size-1)
+    new_y, clamped_y = self._clamp(new_y, 0, self._size-1)
 
     hit_wall = False
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from environment import maze_generator
+
+# dx, dy of UP, DOWN, LEFT, RIGHT (same action order as MazeEnvironment)
+MOVES = np.array([[0, -1], [0, 1], [-1, 0], [1, 0]], dtype=np.int32)
+
+
+class MazeBatchEnvironment(object):
+    """
+    N mazes of maze_environment_pro.MazeEnvironment stepped at once.
+    Agent and goal positions are held in [N, 2] arrays; moves, clamping and
+    rewards are computed with vectorized operations and the observations are
+    rendered into a preallocated [N, size, size, 3] buffer.
+    step() returns that buffer itself (valid until the next step) for
+    benchmarks, step_async()/step_wait() implement the EnvGroup interface and
+    return copies that can be stored in rollouts.
+    """
+    def __init__(self, num_envs, size=7, wall_density=0., pixel_change=True, seed=None):
+        self.num_envs = num_envs
+        self.size = size
+        self.action_size = len(MOVES)
+        self.pixel_change = pixel_change
+        self._random = np.random.RandomState(seed)
+
+        # all mazes share one layout
+        layout = maze_generator.generate_maze(size, wall_density, seed)
+        self._walls = layout.walls
+        self._maze_image = np.zeros([size, size, 3])
+        self._maze_image[..., 0] = self._walls
+        # all cells as [size*size, 2] (x, y) for vectorized goal sampling
+        ys, xs = np.divmod(np.arange(size * size), size)
+        self._cells = np.stack([xs, ys], axis=1)
+
+        self._index = np.arange(num_envs)
+        self._agent_pos = np.tile(layout.start, [num_envs, 1])
+        self._goal_pos = np.zeros([num_envs, 2], dtype=np.int64)
+        self._obs = np.zeros([num_envs, size, size, 3])
+        self._last_obs = np.zeros([num_envs, size, size, 3])
+        self._pixel_changes = np.zeros([num_envs, size, size, 3])
+        self._rewards = np.zeros([num_envs])
+        self._pending_actions = None
+        self.reset()
+
+    def __len__(self):
+        return self.num_envs
+
+    def _set_goals(self, index):
+        # pick a random free cell at distance >= 2 for each maze in index
+        diff = self._cells[np.newaxis] - self._agent_pos[index][:, np.newaxis]
+        distance = np.sum(diff * diff, axis=2)
+        free = ~self._walls.reshape(-1)[np.newaxis]
+        valid = (distance >= 4) & free
+        scores = np.where(valid, self._random.random_sample(valid.shape), -1.)
+        # like maze_generator.sample_goals, the farthest free cell if no cell is far enough
+        scores = np.where(np.any(valid, axis=1)[:, np.newaxis], scores, np.where(free, distance, -1))
+        self._goal_pos[index] = self._cells[np.argmax(scores, axis=1)]
+
+    def _render(self):
+        self._obs[:] = self._maze_image
+        self._obs[self._index, self._agent_pos[:, 1], self._agent_pos[:, 0], 1] = 1.0
+        self._obs[self._index, self._goal_pos[:, 1], self._goal_pos[:, 0], 2] = 1.0
+
+    def reset(self):
+        self._set_goals(self._index)
+        self._render()
+        self._last_obs[:] = self._obs
+        last_action_rewards = np.zeros([self.num_envs, self.action_size+1])
+        return self._obs.copy(), last_action_rewards
+
+    def reset_env(self, index):
+        self._set_goals(np.array([index]))
+        self._obs[index] = self._maze_image
+        self._obs[index, self._agent_pos[index, 1], self._agent_pos[index, 0], 1] = 1.0
+        self._obs[index, self._goal_pos[index, 1], self._goal_pos[index, 0], 2] = 1.0
+        self._last_obs[index] = self._obs[index]
+        return self._obs[index].copy(), np.zeros([self.action_size+1])
+
+    def step(self, actions):
+        """
+        step all mazes with [N] action indices (or [N, action_size] one-hot)
+        """
+        actions = np.asarray(actions)
+        if actions.ndim > 1:
+            actions = np.argmax(actions, axis=1)
+        new_pos = self._agent_pos + MOVES[actions]
+        clamped = np.clip(new_pos, 0, self.size - 1)
+        hit = np.any(clamped != new_pos, axis=1)
+        hit_wall = self._walls[clamped[:, 1], clamped[:, 0]]
+        self._agent_pos = np.where(hit_wall[:, np.newaxis], self._agent_pos, clamped)
+        hit |= hit_wall
+
+        terminals = np.all(self._agent_pos == self._goal_pos, axis=1)
+        self._rewards[:] = 0.
+        self._rewards[hit] = -1.
+        self._rewards[terminals] = 1.
+
+        self._last_obs, self._obs = self._obs, self._last_obs
+        self._render()
+        if self.pixel_change:
+            np.subtract(self._obs, self._last_obs, out=self._pixel_changes)
+        return self._obs, self._rewards, terminals, self._pixel_changes
+
+    def step_async(self, actions):
+        # stepping is cheap enough to happen in step_wait()
+        self._pending_actions = actions
+
+    def step_wait(self):
+        obs, rewards, terminals, pixel_changes = self.step(self._pending_actions)
+        if not self.pixel_change:
+            return obs.copy(), rewards.copy(), terminals, [[]] * self.num_envs
+        return obs.copy(), rewards.copy(), terminals, pixel_changes.copy()
+
+    def stop(self):
+        pass
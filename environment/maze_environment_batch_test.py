@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+from environment.maze_environment_batch import MazeBatchEnvironment
+from environment.maze_environment_pro import MazeEnvironment
+
+
+class TestMazeBatchEnvironment(unittest.TestCase):
+  def test_shapes(self):
+    env = MazeBatchEnvironment(16, seed=0)
+    states, last_action_rewards = env.reset()
+    self.assertTrue( states.shape == (16,7,7,3) )
+    self.assertTrue( last_action_rewards.shape == (16,5) )
+    # one agent and one goal pixel per maze
+    self.assertTrue( np.all(np.sum(states, axis=(1,2,3)) == 2) )
+
+    states, rewards, terminals, pixel_changes = env.step(np.zeros(16, dtype=np.int32))
+    self.assertTrue( states.shape == (16,7,7,3) )
+    self.assertTrue( rewards.shape == (16,) )
+    self.assertTrue( terminals.shape == (16,) )
+    self.assertTrue( pixel_changes.shape == (16,7,7,3) )
+
+  def test_matches_single_maze(self):
+    env = MazeBatchEnvironment(4, seed=0)
+    mazes = [MazeEnvironment() for _ in range(4)]
+    # use the goals of the batched env in the single mazes
+    for i, maze in enumerate(mazes):
+      maze._goals = [tuple(env._goal_pos[i])]
+      maze.last_state = maze._get_current_image()
+
+    random = np.random.RandomState(1)
+    for _ in range(20):
+      actions = random.randint(4, size=4)
+      states, rewards, terminals, _ = env.step(actions)
+      for i, maze in enumerate(mazes):
+        state, reward, terminal, _ = maze.process(actions[i])
+        self.assertTrue( np.all(states[i] == state) )
+        self.assertEqual( rewards[i], reward )
+        self.assertEqual( terminals[i], terminal )
+        if terminal:
+          env.reset_env(i)
+          maze._goals = [tuple(env._goal_pos[i])]
+          maze.last_state = maze._get_current_image()
+
+  def test_goals_in_tiny_maze(self):
+    # no free cell of a 2x2 maze is at distance >= 2 from the start (1, 1), the
+    # goal falls back to the farthest free cell instead of the walled cell 0
+    env = MazeBatchEnvironment(8, size=2, seed=0)
+    env._walls[0, 0] = True
+    env.reset()
+    self.assertTrue( np.all(env._goal_pos == [1, 0]) )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,68 +6,59 @@ from __future__ import print_function
 import numpy as np
 
 from environment import environment
+from environment import maze_generator
 
 class MazeEnvironment(environment.Environment):
     @staticmethod
     def get_action_size():
         return 4
-    
-    def __init__(self):
+
+    @staticmethod
+    def probe_spec(size=7, cell_size=1):
+        return MazeEnvironment.get_action_size(), (size*cell_size, size*cell_size, 3), np.float64
+
+    def __init__(self, size=7, wall_density=0., num_goals=1, seed=None, cell_size=1):
         environment.Environment.__init__(self)
-                
-        self._map_data = \
-                         "-------" \
-                         "-------" \
-                         "-------" \
-                         "---S---" \
-                         "-------" \
-                         "-------" \
-                         "-------" 
-        
+
+        # the default layout is the empty 7x7 maze with the start in the center
+        self._size = size
+        self._cell_size = cell_size
+        self._num_goals = num_goals
+        self._random = np.random.RandomState(seed)
+        self._layout = maze_generator.generate_maze(size, wall_density, seed)
+
         self._setup()
         self.reset()
 
-    def _set_goal(self):
-        goal_pos = self._agent_pos
-        while np.linalg.norm(np.array(goal_pos) - np.array(self._agent_pos)) < 2:
-            gx = int(7*np.random.random())
-            gy = int(7*np.random.random())
-            goal_pos = (gx,gy)
-        return goal_pos
+    def _set_goals(self):
+        return maze_generator.sample_goals(self._layout.walls, self._agent_pos, self._num_goals,
+                                           random=self._random)
 
     def _setup(self):
-        image = np.zeros( (7, 7, 3), dtype=float )
-      
-        for y in range(7):
-            for x in range(7):
-              p = self._get_pixel(x,y)
-              if p == '+':
-                  image = self._put_pixel(image, x, y, 0)
-              elif p == 'S':
-                  start_pos = (x, y)
-                  
+        image = np.zeros( (self._size*self._cell_size, self._size*self._cell_size, 3), dtype=float )
+
+        for y, x in np.argwhere(self._layout.walls):
+            self._put_pixel(image, x, y, 0)
+
         self._maze_image = image
-        self._agent_pos = start_pos
-        
+        self._agent_pos = self._layout.start
+
     def reset(self):
-        self._goal_pos = self._set_goal()
+        self._goals = self._set_goals()
         self.last_state = self._get_current_image()
         self.last_action = 0
         self.last_reward = 0
         last_action_reward = np.zeros([self.action_size+1])
-        
+
         return self.last_state, last_action_reward
-        
+
     def _put_pixel(self, img, x, y, channel):
-        img[y, x, channel] = 1.0
+        c = self._cell_size
+        img[c*y:c*(y+1), c*x:c*(x+1), channel] = 1.0
         return img
-            
-    def _get_pixel(self, x, y):
-        data_pos = y * 7 + x
-        return self._map_data[data_pos]
 
     def _is_wall(self, x, y):
-        return self._get_pixel(x, y) == '+'
+        return self._layout.walls[y, x]
 
     def _clamp(self, n, minn, maxn):
         if n < minn:
@@ -75,13 +66,13 @@ class MazeEnvironment(environment.Environment):
         elif n > maxn:
             return maxn, True
         return n, False
-    
+
     def _move(self, dx, dy):
         new_x = self._agent_pos[0] + dx
         new_y = self._agent_pos[1] + dy
 
-        new_x, clamped_x = self._clamp(new_x, 0, 6)
-        new_y, clamped_y = self._clamp(new_y, 0, 6)
+        new_x, clamped_x = self._clamp(new_x, 0, self._size-1)
+        new_y, clamped_y = self._clamp(new_y, 0, self._size-1)
 
         hit_wall = False
 
@@ -97,8 +88,9 @@ class MazeEnvironment(environment.Environment):
         image = np.array(self._maze_image)
         # draw the agent
         self._put_pixel(image, self._agent_pos[0], self._agent_pos[1], 1)
-        # draw the goal
-        self._put_pixel(image, self._goal_pos[0], self._goal_pos[1], 2)
+        # draw the goals
+        for goal in self._goals:
+            self._put_pixel(image, goal[0], goal[1], 2)
         return image
 
     def process(self, action):
@@ -116,8 +108,9 @@ class MazeEnvironment(environment.Environment):
         self._agent_pos, hit = self._move(dx, dy)
 
         image = self._get_current_image()
-        
-        terminal = (self._agent_pos == self._goal_pos)
+
+        # reaching any of the goals ends the episode
+        terminal = (self._agent_pos in self._goals)
 
         if terminal:
             reward = 1
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from environment import maze_generator
+
+# dx, dy of UP, DOWN, LEFT, RIGHT (same action order as MazeEnvironment)
+MOVES = [[0, -1], [0, 1], [-1, 0], [1, 0]]
+
+
+class MazeRolloutGraph(object):
+    """
+    maze_environment_pro.MazeEnvironment dynamics in TensorFlow.
+    The dynamics are rolled out together with the base policy of model in a
+    tf.while_loop, so num_steps steps of num_mazes mazes (states, actions,
+    rewards, values, terminals and behaviour probabilities) are produced by a
+    single sess.run. Agent and goal positions live in graph variables and
+    carry over to the next rollout. All mazes share one layout from
+    maze_generator.generate_maze(size, wall_density, seed), which enters the
+    graph as a constant.
+    epsilon=None samples the actions from the policy (boltzmann), otherwise
+    epsilon-greedy is used.
+    """
+    def __init__(self, model, num_mazes, num_steps, device, epsilon=None, size=7, wall_density=0., seed=None,
+                 name="tf_maze"):
+        self.num_mazes = num_mazes
+        self.num_steps = num_steps
+        self.size = size
+        self.action_size = len(MOVES)
+        self._model = model
+        self._epsilon = epsilon
+        self._seed = seed
+        layout = maze_generator.generate_maze(size, wall_density, seed)
+
+        # all cells as [size*size, 2] (x, y) for goal sampling
+        ys, xs = np.divmod(np.arange(size * size), size)
+        cells = np.stack([xs, ys], axis=1).astype(np.int32)
+
+        with tf.device(device), tf.variable_scope(name):
+            self._cells = tf.constant(cells)
+            self._moves = tf.constant(MOVES, dtype=tf.int32)
+            # [size*size] walls indexed y * size + x, also the first image channel
+            self._walls = tf.constant(layout.walls.reshape(-1))
+            self._wall_image = tf.constant(layout.walls.reshape(-1).astype(np.float32))
+            start = np.tile(layout.start, [num_mazes, 1]).astype(np.int32)
+            self.agent_pos = tf.Variable(start, trainable=False, name="agent_pos")
+            self.goal_pos = tf.Variable(self._new_goals(tf.constant(start)), trainable=False, name="goal_pos")
+            self._create_rollout_ops()
+
+    def _new_goals(self, agent_pos):
+        # a random free cell at distance >= 2 from the agent for each maze
+        diff = self._cells[tf.newaxis] - agent_pos[:, tf.newaxis]
+        distance = tf.reduce_sum(diff * diff, axis=2)
+        free = tf.tile(tf.logical_not(self._walls)[tf.newaxis], [tf.shape(distance)[0], 1])
+        valid = tf.logical_and(distance >= 4, free)
+        scores = tf.where(valid, tf.random_uniform(tf.shape(valid), seed=self._seed), -tf.ones(tf.shape(valid)))
+        # like maze_generator.sample_goals, the farthest free cell if no cell is far enough
+        farthest = tf.where(free, tf.cast(distance, tf.float32), -tf.ones(tf.shape(valid)))
+        any_valid = tf.tile(tf.reduce_any(valid, axis=1, keep_dims=True), [1, tf.shape(valid)[1]])
+        scores = tf.where(any_valid, scores, farthest)
+        return tf.gather(self._cells, tf.argmax(scores, axis=1))
+
+    def _render(self, agent_pos, goal_pos):
+        # [N, size*size*3] observation, flattened like the numpy [size, size, 3] image
+        n_cells = self.size * self.size
+        agent = tf.one_hot(agent_pos[:, 1] * self.size + agent_pos[:, 0], n_cells)
+        goal = tf.one_hot(goal_pos[:, 1] * self.size + goal_pos[:, 0], n_cells)
+        walls = tf.tile(self._wall_image[tf.newaxis], [tf.shape(agent)[0], 1])
+        image = tf.stack([walls, agent, goal], axis=2)
+        return tf.reshape(image, [-1, n_cells * 3])
+
+    def _act(self, state):
+        pi_linear, value = self._model.base_policy_and_value(state)
+        pi = tf.nn.softmax(pi_linear)
+        if self._epsilon is None:
+            action = tf.cast(tf.reshape(tf.multinomial(pi_linear, 1), [-1]), tf.int32)
+            prob = tf.reduce_sum(pi * tf.one_hot(action, self.action_size), axis=1)
+        else:
+            greedy = tf.cast(tf.argmax(pi_linear, axis=1), tf.int32)
+            random_action = tf.random_uniform([self.num_mazes], maxval=self.action_size, dtype=tf.int32)
+            action = tf.where(tf.random_uniform([self.num_mazes]) < self._epsilon, random_action, greedy)
+            is_greedy = tf.cast(tf.equal(action, greedy), tf.float32)
+            prob = (1. - self._epsilon) * is_greedy + self._epsilon / self.action_size
+        return action, value, prob
+
+    def _step(self, agent_pos, goal_pos, action):
+        new_pos = agent_pos + tf.gather(self._moves, action)
+        clamped = tf.clip_by_value(new_pos, 0, self.size - 1)
+        hit = tf.reduce_any(tf.not_equal(clamped, new_pos), axis=1)
+        # moves into a wall leave the agent where it was
+        hit_wall = tf.gather(self._walls, clamped[:, 1] * self.size + clamped[:, 0])
+        agent_pos = tf.where(hit_wall, agent_pos, clamped)
+        hit = tf.logical_or(hit, hit_wall)
+        terminal = tf.reduce_all(tf.equal(agent_pos, goal_pos), axis=1)
+        reward = tf.where(terminal, tf.ones([self.num_mazes]),
+                          tf.where(hit, -tf.ones([self.num_mazes]), tf.zeros([self.num_mazes])))
+        # finished mazes get a new goal, the agent stays where it is
+        goal_pos = tf.where(terminal, self._new_goals(agent_pos), goal_pos)
+        return agent_pos, goal_pos, reward, terminal
+
+    def _create_rollout_ops(self):
+        def body(t, agent_pos, goal_pos, states, actions, rewards, values, terminals, probs):
+            state = self._render(agent_pos, goal_pos)
+            action, value, prob = self._act(state)
+            agent_pos, goal_pos, reward, terminal = self._step(agent_pos, goal_pos, action)
+            return (t + 1, agent_pos, goal_pos,
+                    states.write(t, state), actions.write(t, action), rewards.write(t, reward),
+                    values.write(t, value), terminals.write(t, terminal), probs.write(t, prob))
+
+        arrays = [tf.TensorArray(dtype, size=self.num_steps)
+                  for dtype in [tf.float32, tf.int32, tf.float32, tf.float32, tf.bool, tf.float32]]
+        loop_vars = [tf.constant(0), self.agent_pos.read_value(), self.goal_pos.read_value()] + arrays
+        outputs = tf.while_loop(lambda t, *_: t < self.num_steps, body, loop_vars)
+        _, agent_pos, goal_pos = outputs[:3]
+        states, actions, rewards, values, terminals, probs = [array.stack() for array in outputs[3:]]
+
+        # state after the last step and its value for bootstrapping
+        final_states = self._render(agent_pos, goal_pos)
+        _, bootstrap_values = self._model.base_policy_and_value(final_states)
+
+        with tf.control_dependencies([states, actions, rewards, values, terminals, probs, bootstrap_values]):
+            update_pos = tf.group(tf.assign(self.agent_pos, agent_pos), tf.assign(self.goal_pos, goal_pos))
+        # outputs are [num_steps, num_mazes, ...], final states and bootstrap values [num_mazes, ...]
+        self.rollout_ops = [states, tf.one_hot(actions, self.action_size), rewards, values, terminals, probs,
+                            final_states, bootstrap_values, update_pos]
+
+    def run_rollout(self, sess):
+        return sess.run(self.rollout_ops)[:-1]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from collections import namedtuple, deque
+
+# walls: [size, size] bool array indexed [y, x], start: (x, y),
+# goals: fixed goal cells [(x, y), ...] (empty for sampled goals)
+MazeLayout = namedtuple("MazeLayout", ["walls", "start", "goals"])
+
+
+def parse_maze(map_data, size=7):
+  """
+  Layout of a map string with '+' for walls, 'S' for the start and 'G' for
+  goal cells.
+  """
+  cells = np.array(list(map_data)).reshape(size, size)
+  start = np.argwhere(cells == 'S')
+  start = (int(start[0][1]), int(start[0][0])) if len(start) > 0 else (-1, -1)
+  goals = [(int(x), int(y)) for y, x in np.argwhere(cells == 'G')]
+  return MazeLayout(cells == '+', start, goals)
+
+
+def generate_maze(size=7, wall_density=0., seed=None):
+  """
+  Random NxN layout with the start in the center.
+  Each cell is a wall with probability wall_density. Free cells that can't
+  be reached from the start are walled up, so every free cell is reachable.
+  wall_density=0 gives the empty maze of maze_environment_pro.
+  """
+  random = np.random.RandomState(seed)
+  start = (size // 2, size // 2)
+  walls = random.random_sample([size, size]) < wall_density
+  walls[start[1], start[0]] = False
+
+  # flood fill from the start
+  reachable = np.zeros([size, size], dtype=bool)
+  reachable[start[1], start[0]] = True
+  frontier = deque([start])
+  while frontier:
+    x, y = frontier.popleft()
+    for nx, ny in ((x, y-1), (x, y+1), (x-1, y), (x+1, y)):
+      if 0 <= nx < size and 0 <= ny < size and not walls[ny, nx] and not reachable[ny, nx]:
+        reachable[ny, nx] = True
+        frontier.append((nx, ny))
+  return MazeLayout(~reachable, start, [])
+
+
+def sample_goals(walls, agent_pos, num_goals=1, min_distance=2, random=np.random):
+  """
+  num_goals distinct free cells at euclidean distance >= min_distance from
+  agent_pos, as a list of (x, y). Falls back to the farthest free cells in
+  layouts too small for the distance.
+  """
+  ys, xs = np.nonzero(~walls)
+  distance = np.hypot(xs - agent_pos[0], ys - agent_pos[1])
+  candidates = np.nonzero(distance >= min_distance)[0]
+  if len(candidates) < num_goals:
+    candidates = np.argsort(-distance)[:num_goals]
+  chosen = random.choice(candidates, num_goals, replace=False)
+  return [(int(xs[i]), int(ys[i])) for i in chosen]
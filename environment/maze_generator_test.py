@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+from environment.maze_generator import generate_maze, sample_goals
+
+
+class TestMazeGenerator(unittest.TestCase):
+  def test_empty_maze(self):
+    layout = generate_maze(7, 0.)
+    self.assertFalse( np.any(layout.walls) )
+    self.assertEqual( layout.start, (3, 3) )
+
+  def test_free_cells_are_reachable(self):
+    layout = generate_maze(15, 0.35, seed=1)
+    self.assertTrue( layout.walls.shape == (15,15) )
+    self.assertFalse( layout.walls[7, 7] )
+    # walk all free cells from the start
+    seen = set([layout.start])
+    stack = [layout.start]
+    while stack:
+      x, y = stack.pop()
+      for nx, ny in ((x, y-1), (x, y+1), (x-1, y), (x+1, y)):
+        if 0 <= nx < 15 and 0 <= ny < 15 and not layout.walls[ny, nx] and (nx, ny) not in seen:
+          seen.add((nx, ny))
+          stack.append((nx, ny))
+    self.assertEqual( len(seen), np.sum(~layout.walls) )
+
+  def test_goals(self):
+    layout = generate_maze(9, 0.2, seed=2)
+    goals = sample_goals(layout.walls, layout.start, 3, random=np.random.RandomState(0))
+    self.assertEqual( len(set(goals)), 3 )
+    for x, y in goals:
+      self.assertFalse( layout.walls[y, x] )
+      self.assertTrue( np.hypot(x - layout.start[0], y - layout.start[1]) >= 2 )
+
+
+if __name__ == '__main__':
+  unittest.main()
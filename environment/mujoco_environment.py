@@ -4,11 +4,15 @@ from __future__ import division
 from __future__ import print_function
 
 from multiprocessing import Process, Pipe
+import time
 import numpy as np
 import logging
 import gym
 
 from environment import environment
+from environment import env_spec
+from environment.shared_obs import SharedObservation
+from environment import worker_timing
 
 logger = logging.getLogger('StRADRL.mujoco_env')
 
@@ -16,12 +20,16 @@ COMMAND_RESET     = 0
 COMMAND_ACTION    = 1
 COMMAND_TERMINATE = 2
 
-def worker(conn, render):
+def worker(conn, render, shared_obs, action_repeat, max_pool_frames, auto_reset, timing, preprocessing):
+    # observations are written to shared_obs, the pipe only carries control messages
+    timer = worker_timing.CommandTimer() if timing else None
     env = gym.make('Humanoid-v1')
     conn.send(COMMAND_RESET)
     
     while True:
         command, arg = conn.recv()
+        if timer:
+            timer.start()
 
         if command == COMMAND_RESET:
             obs = env.reset()
@@ -29,13 +37,29 @@ def worker(conn, render):
                 env.render()
             #logger.warn("episode was reset")
             #logger.debug("reset output:{}".format(obs))
-            conn.send(obs)
+            if preprocessing:
+                obs = preprocessing.process_obs(obs)
+            shared_obs.write(obs)
+            if timer:
+                timer.stop("reset")
+            conn.send(timer.flush() if timer else 0)
         elif command == COMMAND_ACTION:
             #logger.debug("action argument:".format(arg))
-            obs, reward, terminal, _ = env.step(arg)
+            obs, reward, terminal = environment.repeat_step(env, arg, action_repeat, max_pool_frames)
+            if terminal and auto_reset:
+                # start the next episode right away, the runner discards the terminal frame
+                obs = env.reset()
             if render:
                 env.render()
-            conn.send([obs, reward, terminal])
+            if preprocessing:
+                obs = preprocessing.process_obs(obs)
+                reward = preprocessing.process_reward(reward)
+            shared_obs.write(obs)
+            if timer:
+                timer.stop("step")
+                conn.send([reward, terminal, timer.flush()])
+            else:
+                conn.send([reward, terminal])
         elif command == COMMAND_TERMINATE:
             break
         else:
@@ -63,28 +87,47 @@ def worker(conn, render):
 
 class MujocoEnvironment(environment.Environment):
     @staticmethod
-    def get_action_size():
+    def probe_spec():
+        # action size, observation shape and dtype from a single throwaway env
         env = gym.make('Humanoid-v1')
         action_size = np.asarray(env.action_space.high).shape[0]
-        #logger.debug("acsize:{}".format(action_size))
+        obs = np.asarray(env.reset())
         logger.debug("action_size:{}".format(action_size))
         env.close()
-        return action_size
+        return action_size, obs.shape, obs.dtype
     
-    def __init__(self):
+    def __init__(self, action_repeat=1, max_pool_frames=False, auto_reset=False, timing=False,
+                 preprocessing=None):
         logger.warn("!! hardcoding set render to true here !!")
         render = True
     
         environment.Environment.__init__(self)
+        self.auto_reset = auto_reset
+        self.timing = timing
+        self._reset_state = None
+        spec = env_spec.get_env_spec('mujoco', '')
+        obs_shape, obs_dtype = spec.obs_shape, spec.obs_dtype
+        if preprocessing:
+            obs_shape, obs_dtype = preprocessing.output_spec(obs_shape, obs_dtype)
+        self.shared_obs = SharedObservation(obs_shape, obs_dtype)
         self.conn, child_conn = Pipe()
-        self.proc = Process(target=worker, args=(child_conn, render))
+        self.proc = Process(target=worker, args=(child_conn, render, self.shared_obs,
+                                                 action_repeat, max_pool_frames, auto_reset, timing,
+                                                 preprocessing))
         self.proc.start()
         self.conn.recv()
 
 
     def reset(self):
-        self.conn.send([COMMAND_RESET, 0])
-        obs = self.conn.recv()
+        if self._reset_state is not None:
+            # the worker already reset after the terminal step
+            obs, self._reset_state = self._reset_state, None
+        else:
+            self.conn.send([COMMAND_RESET, 0])
+            samples = self.conn.recv()
+            obs = self.shared_obs.read()
+            if self.timing:
+                worker_timing.record(samples)
         #logger.debug("obs: {}".format(obs))
         
         self.last_state = obs
@@ -104,18 +147,35 @@ class MujocoEnvironment(environment.Environment):
         logger.info("lab environment stopped")
     
     def process(self, action):
+        self.step_async(action)
+        return self.step_wait()
+    
+    def step_async(self, action):
+        # send the action without waiting for the worker to step the simulation
         real_action = -0.4 + 0.8*action
         #logger.debug(real_action)
+        if self.timing:
+            self._sent_time = time.time()
         self.conn.send([COMMAND_ACTION, real_action])
-        obs, reward, terminal = self.conn.recv()
+        self.last_action = action
+    
+    def step_wait(self):
+        reply = self.conn.recv()
+        reward, terminal = reply[0], reply[1]
+        if self.timing:
+            # round trip = simulation step + IPC + waiting for the worker
+            samples = reply[2]
+            samples["round_trip"] = [time.time() - self._sent_time]
+            worker_timing.record(samples)
         if not terminal:
-            state = obs
+            state = self.shared_obs.read()
         else:
+            if self.auto_reset:
+                self._reset_state = self.shared_obs.read()
             state = self.last_state
         
         pixel_change = [] #self._calc_pixel_change(state, self.last_state)
         self.last_state = state
-        self.last_action = action
         self.last_reward = reward
         return state, reward, terminal, pixel_change
         
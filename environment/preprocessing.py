@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Composable observation and reward preprocessing that runs inside the
+environment worker processes.
+A pipeline is declared with a spec string of comma separated steps with
+colon separated arguments, e.g.
+
+  "channels:0:1:2,resize:84:84,cast:float32:0.00392156,clip_reward:1"
+
+  channels:I:J:...      select channels of the last axis
+  resize:W:H            resize an image (cv2, area interpolation)
+  cast:DTYPE[:SCALE]    cast to DTYPE, optionally multiplied by SCALE
+  normalize[:CLIP]      running mean / std normalization, clipped to +-CLIP
+  clip_reward:LIMIT     clip rewards to [-LIMIT, LIMIT]
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import cv2
+
+
+class ChannelSelect(object):
+  def __init__(self, channels):
+    self.channels = list(channels)
+
+  def output_spec(self, shape, dtype):
+    return tuple(shape[:-1]) + (len(self.channels),), dtype
+
+  def __call__(self, obs):
+    return obs[..., self.channels]
+
+
+class Resize(object):
+  def __init__(self, width, height):
+    self.width = width
+    self.height = height
+
+  def output_spec(self, shape, dtype):
+    return (self.height, self.width) + tuple(shape[2:]), dtype
+
+  def __call__(self, obs):
+    resized = cv2.resize(obs, (self.width, self.height), interpolation=cv2.INTER_AREA)
+    # cv2 drops a single channel axis
+    return np.reshape(resized, (self.height, self.width) + obs.shape[2:])
+
+
+class Cast(object):
+  def __init__(self, dtype, scale=None):
+    self.dtype = np.dtype(dtype)
+    self.scale = scale
+
+  def output_spec(self, shape, dtype):
+    return shape, self.dtype
+
+  def __call__(self, obs):
+    if self.scale is not None and self.dtype.kind != 'f':
+      # an integer array can't be scaled in place by a float
+      return (obs * self.scale).astype(self.dtype)
+    obs = obs.astype(self.dtype)
+    if self.scale is not None:
+      obs *= self.scale
+    return obs
+
+
+class RunningNormalize(object):
+  """
+  (obs - mean) / std with mean and variance accumulated over all observations
+  seen by this worker (Welford's algorithm), e.g. for RAM observations.
+  """
+  def __init__(self, clip=5., epsilon=1e-8):
+    self.clip = clip
+    self.epsilon = epsilon
+    self.count = 0
+    self.mean = None
+    self.m2 = None
+
+  def output_spec(self, shape, dtype):
+    return shape, np.dtype(np.float32)
+
+  def __call__(self, obs):
+    obs = np.asarray(obs, dtype=np.float64)
+    if self.mean is None:
+      self.mean = np.zeros_like(obs)
+      self.m2 = np.zeros_like(obs)
+    self.count += 1
+    delta = obs - self.mean
+    self.mean += delta / self.count
+    self.m2 += delta * (obs - self.mean)
+    std = np.sqrt(self.m2 / self.count + self.epsilon)
+    return np.clip((obs - self.mean) / std, -self.clip, self.clip).astype(np.float32)
+
+
+class RewardClip(object):
+  def __init__(self, limit):
+    self.limit = limit
+
+  def clip(self, reward):
+    return float(np.clip(reward, -self.limit, self.limit))
+
+
+class Pipeline(object):
+  """
+  Observation steps applied in order and an optional reward clip.
+  """
+  def __init__(self, steps=(), reward_clip=None):
+    self.steps = list(steps)
+    self.reward_clip = reward_clip
+
+  @staticmethod
+  def parse(spec):
+    steps = []
+    reward_clip = None
+    for step in spec.split(","):
+      if not step.strip():
+        continue
+      args = step.strip().split(":")
+      name, args = args[0], args[1:]
+      if name == "channels":
+        steps.append(ChannelSelect([int(a) for a in args]))
+      elif name == "resize":
+        steps.append(Resize(int(args[0]), int(args[1])))
+      elif name == "cast":
+        steps.append(Cast(args[0], float(args[1]) if len(args) > 1 else None))
+      elif name == "normalize":
+        steps.append(RunningNormalize(float(args[0]) if args else 5.))
+      elif name == "clip_reward":
+        reward_clip = RewardClip(float(args[0]))
+      else:
+        raise ValueError("unknown preprocessing step: {}".format(name))
+    return Pipeline(steps, reward_clip)
+
+  def output_spec(self, shape, dtype):
+    """
+    observation shape and dtype after all steps
+    """
+    shape, dtype = tuple(shape), np.dtype(dtype)
+    for step in self.steps:
+      shape, dtype = step.output_spec(shape, dtype)
+    return shape, dtype
+
+  def process_obs(self, obs):
+    for step in self.steps:
+      obs = step(obs)
+    return obs
+
+  def process_reward(self, reward):
+    if self.reward_clip is None:
+      return reward
+    return self.reward_clip.clip(reward)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+from environment.preprocessing import Pipeline
+
+
+class TestPreprocessing(unittest.TestCase):
+  def test_parse_and_spec(self):
+    pipeline = Pipeline.parse("channels:0:1:2,cast:float32:0.5,clip_reward:1")
+    shape, dtype = pipeline.output_spec((10,12,4), np.uint8)
+    self.assertEqual( shape, (10,12,3) )
+    self.assertEqual( dtype, np.float32 )
+    obs = pipeline.process_obs(np.full((10,12,4), 4, dtype=np.uint8))
+    self.assertTrue( obs.shape == shape and obs.dtype == dtype )
+    self.assertTrue( np.all(obs == 2.) )
+    self.assertEqual( pipeline.process_reward(-3.), -1. )
+    self.assertEqual( pipeline.process_reward(0.5), 0.5 )
+
+  def test_integer_cast_with_scale(self):
+    pipeline = Pipeline.parse("cast:uint8:0.5")
+    obs = pipeline.process_obs(np.array([0, 4, 255], dtype=np.uint8))
+    self.assertEqual( obs.dtype, np.uint8 )
+    self.assertEqual( list(obs), [0, 2, 127] )
+
+  def test_normalize(self):
+    pipeline = Pipeline.parse("normalize:2")
+    random = np.random.RandomState(0)
+    for _ in range(1000):
+      obs = pipeline.process_obs(random.normal(10., 3., size=8))
+    self.assertTrue( obs.dtype == np.float32 )
+    self.assertTrue( np.all(np.abs(obs) <= 2.) )
+    self.assertTrue( np.allclose(pipeline.steps[0].mean, 10., atol=0.5) )
+
+  def test_unknown_step(self):
+    with self.assertRaises(ValueError):
+      Pipeline.parse("blur:3")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import logging
+import numpy as np
+
+from environment import environment
+
+logger = logging.getLogger("StRADRL.replay_environment")
+
+# action stored for frames returned by reset()
+RESET_ACTION = -1
+
+
+def _action_index(action):
+  # gym style envs are stepped with one-hot actions, the maze with indices
+  action = np.asarray(action)
+  return int(np.argmax(action)) if action.ndim > 0 else int(action)
+
+
+class RecordingEnvironment(environment.Environment):
+  """
+  Records the observation/action/reward stream of env.
+  Every frame returned by reset() or a step is kept in memory together with
+  the action that produced it (RESET_ACTION after a reset), the reward and
+  the terminal flag. The stream is written as a compressed npz file to path
+  on stop() and can be served back with ReplayEnvironment. Recording stops
+  after max_frames frames to bound the memory use.
+  """
+  def __init__(self, env, path, action_size, max_frames=1000000):
+    environment.Environment.__init__(self)
+    self.env = env
+    self.path = path
+    self.action_size = action_size
+    self.max_frames = max_frames
+    self._states = []
+    self._actions = []
+    self._rewards = []
+    self._terminals = []
+    self._pixel_change = False
+    self._pending_action = None
+
+  def _record(self, state, action, reward, terminal):
+    if len(self._states) >= self.max_frames:
+      return
+    self._states.append(np.array(state))
+    self._actions.append(action)
+    self._rewards.append(reward)
+    self._terminals.append(terminal)
+
+  def reset(self):
+    state, last_action_reward = self.env.reset()
+    self._record(state, RESET_ACTION, 0., False)
+    return state, last_action_reward
+
+  def process(self, action):
+    self.step_async(action)
+    return self.step_wait()
+
+  def step_async(self, action):
+    self._pending_action = action
+    self.env.step_async(action)
+
+  def step_wait(self):
+    state, reward, terminal, pixel_change = self.env.step_wait()
+    self._pixel_change = len(pixel_change) > 0
+    self._record(state, _action_index(self._pending_action), reward, terminal)
+    return state, reward, terminal, pixel_change
+
+  def render(self):
+    self.env.render()
+
+  def save(self):
+    if not self._states:
+      logger.warn("nothing recorded for {}".format(self.path))
+      return
+    path_dir = os.path.dirname(self.path)
+    if path_dir and not os.path.exists(path_dir):
+      os.makedirs(path_dir)
+    np.savez_compressed(self.path,
+                        states=np.stack(self._states),
+                        actions=np.array(self._actions, dtype=np.int32),
+                        rewards=np.array(self._rewards, dtype=np.float32),
+                        terminals=np.array(self._terminals, dtype=np.bool_),
+                        action_size=np.int32(self.action_size),
+                        pixel_change=np.bool_(self._pixel_change))
+    logger.info("recorded {} frames to {}".format(len(self._states), self.path))
+
+  def stop(self):
+    self.env.stop()
+    self.save()
+
+
+class ReplayEnvironment(environment.Environment):
+  """
+  Serves a stream recorded by RecordingEnvironment back from memory.
+  The actions passed to process() are ignored; every step returns the next
+  recorded frame, reward and terminal flag, so learner changes can be
+  benchmarked on identical input without emulator cost. An episode cut off
+  by the end of the recording ends with a terminal step. The stream restarts
+  at its first episode once it is exhausted.
+  """
+  @staticmethod
+  def probe_spec(path):
+    with np.load(path) as data:
+      return int(data["action_size"]), data["states"].shape[1:], data["states"].dtype
+
+  def __init__(self, path):
+    environment.Environment.__init__(self)
+    with np.load(path) as data:
+      self._states = data["states"]
+      self._actions = data["actions"]
+      self._rewards = data["rewards"]
+      self._terminals = data["terminals"]
+      self.action_size = int(data["action_size"])
+      self._pixel_change = bool(data["pixel_change"])
+    self._starts = np.flatnonzero(self._actions == RESET_ACTION)
+    if len(self._starts) == 0:
+      raise ValueError("recording {} contains no episode".format(path))
+    # the first reset() serves the first episode, until then its first
+    # frame is the current state
+    self._episode = -1
+    self._index = self._starts[0]
+    self.last_state = self._states[self._index]
+    self.last_action = 0
+    self.last_reward = 0
+
+  def reset(self):
+    self._episode += 1
+    if self._episode >= len(self._starts):
+      self._episode = 0
+    self._index = self._starts[self._episode]
+    self.last_state = self._states[self._index]
+    self.last_action = 0
+    self.last_reward = 0
+    return self.last_state, np.zeros([self.action_size+1])
+
+  def process(self, action):
+    index = self._index + 1
+    if index >= len(self._states) or self._actions[index] == RESET_ACTION:
+      # the recording stopped before the episode ended
+      return self.last_state, 0., True, []
+    self._index = index
+    state = self._states[index]
+    reward = float(self._rewards[index])
+    terminal = bool(self._terminals[index])
+    if self._pixel_change:
+      pixel_change = self._calc_pixel_change(state, self.last_state)
+    else:
+      pixel_change = []
+    self.last_state = state
+    self.last_action = self._actions[index]
+    self.last_reward = reward
+    return state, reward, terminal, pixel_change
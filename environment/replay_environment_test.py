@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from environment.synthetic_environment import SyntheticEnvironment
+from environment.replay_environment import RecordingEnvironment, ReplayEnvironment
+
+
+class TestReplayEnvironment(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_record_and_replay(self):
+    path = os.path.join(self.tmp_dir, "stream.npz")
+    env = RecordingEnvironment(SyntheticEnvironment(obs_size=8, episode_length=3, reward_prob=0.5, seed=0),
+                               path, 4)
+    recorded = []
+    for _ in range(2):
+      state, _ = env.reset()
+      recorded.append((state, 0., False))
+      terminal = False
+      while not terminal:
+        state, reward, terminal, _ = env.process(1)
+        recorded.append((state, reward, terminal))
+    # a cut off episode
+    state, _ = env.reset()
+    recorded.append((state, 0., False))
+    env.stop()
+
+    self.assertEqual( ReplayEnvironment.probe_spec(path)[:2], (4, (8,)) )
+    replay = ReplayEnvironment(path)
+    replayed = []
+    for _ in range(2):
+      state, _ = replay.reset()
+      replayed.append((state, 0., False))
+      terminal = False
+      while not terminal:
+        state, reward, terminal, _ = replay.process(0)
+        replayed.append((state, reward, terminal))
+    self.assertEqual( len(replayed), len(recorded) - 1 )
+    for (s0, r0, t0), (s1, r1, t1) in zip(recorded, replayed):
+      self.assertTrue( np.all(s0 == s1) )
+      self.assertEqual( r0, r1 )
+      self.assertEqual( t0, t1 )
+    # the cut off episode terminates, then the stream starts over
+    replay.reset()
+    self.assertTrue( replay.process(0)[2] )
+    state, _ = replay.reset()
+    self.assertTrue( np.all(state == recorded[0][0]) )
+
+  def test_first_reset_serves_first_episode(self):
+    path = os.path.join(self.tmp_dir, "stream.npz")
+    env = RecordingEnvironment(SyntheticEnvironment(obs_size=8, episode_length=3, seed=0), path, 4)
+    first_state, _ = env.reset()
+    recorded = []
+    terminal = False
+    while not terminal:
+      state, reward, terminal, _ = env.process(1)
+      recorded.append((state, reward, terminal))
+    # the second episode is cut off right after its reset
+    env.reset()
+    env.stop()
+    replay = ReplayEnvironment(path)
+    # the runner resets a new environment before its first step
+    state, _ = replay.reset()
+    self.assertTrue( np.all(state == first_state) )
+    for s0, r0, t0 in recorded:
+      s1, r1, t1, _ = replay.process(0)
+      self.assertTrue( np.all(s0 == s1) )
+      self.assertEqual( (r0, t0), (r1, t1) )
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ctypes
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+
+
+class SharedObservation(object):
+  """
+  Preallocated observation slot in shared memory.
+  The environment worker process writes every observation in place, so only a
+  small control message (reward, terminal) has to be sent over the pipe instead
+  of the pickled array.
+  """
+  def __init__(self, shape, dtype):
+    self.shape = tuple(shape)
+    self.dtype = np.dtype(dtype)
+    size = int(np.prod(self.shape)) * self.dtype.itemsize
+    self._buffer = RawArray(ctypes.c_byte, max(size, 1))
+    self._array = None
+
+  def __getstate__(self):
+    # the numpy view is recreated in the worker process
+    state = self.__dict__.copy()
+    state['_array'] = None
+    return state
+
+  @property
+  def array(self):
+    if self._array is None:
+      self._array = np.frombuffer(self._buffer, dtype=self.dtype,
+                                  count=int(np.prod(self.shape))).reshape(self.shape)
+    return self._array
+
+  def write(self, obs):
+    np.copyto(self.array, obs, casting='unsafe')
+
+  def read(self):
+    # copy, the slot is overwritten by the next step
+    return self.array.copy()
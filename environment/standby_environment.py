@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import logging
+
+from environment import environment
+
+logger = logging.getLogger("StRADRL.standby_environment")
+
+
+class StandbyEnvironment(environment.Environment):
+  """
+  Hides the reset latency of slow environments.
+  Two instances are created with create_env(). While the active one is
+  stepped, the spare one is reset in a background thread; reset() swaps the
+  pre-reset spare in and starts resetting the old instance, so the actor
+  does not stall on episode boundaries.
+  """
+  def __init__(self, create_env):
+    environment.Environment.__init__(self)
+    self.env = create_env()
+    self.spare = create_env()
+    self._start_spare_reset()
+
+  def _start_spare_reset(self):
+    self._spare_result = None
+    self._spare_error = None
+    self._spare_thread = threading.Thread(target=self._reset_spare)
+    self._spare_thread.daemon = True
+    self._spare_thread.start()
+
+  def _reset_spare(self):
+    # an exception would end the thread silently, reset() raises it instead
+    try:
+      self._spare_result = self.spare.reset()
+    except Exception as e:
+      self._spare_error = e
+
+  def reset(self):
+    # only blocks if the spare has not finished its previous reset yet
+    self._spare_thread.join()
+    if self._spare_error is not None:
+      error = self._spare_error
+      # the spare is reset again for the next call
+      self._start_spare_reset()
+      raise error
+    result = self._spare_result
+    self.env, self.spare = self.spare, self.env
+    self._start_spare_reset()
+    return result
+
+  def process(self, action):
+    return self.env.process(action)
+
+  def step_async(self, action):
+    self.env.step_async(action)
+
+  def step_wait(self):
+    return self.env.step_wait()
+
+  def render(self):
+    self.env.render()
+
+  def stop(self):
+    self._spare_thread.join()
+    self.env.stop()
+    self.spare.stop()
+    logger.info("standby environment stopped")
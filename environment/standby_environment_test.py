@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from environment.synthetic_environment import SyntheticEnvironment
+from environment.standby_environment import StandbyEnvironment
+
+
+class FailingResetEnvironment(SyntheticEnvironment):
+  def __init__(self, failures):
+    # the constructor resets once before the failures start
+    self.failures = 0
+    SyntheticEnvironment.__init__(self, obs_size=4)
+    self.failures = failures
+
+  def reset(self):
+    if self.failures > 0:
+      self.failures -= 1
+      raise RuntimeError("reset failed")
+    return SyntheticEnvironment.reset(self)
+
+
+class TestStandbyEnvironment(unittest.TestCase):
+  def test_spare_reset_error_is_raised(self):
+    envs = [FailingResetEnvironment(0), FailingResetEnvironment(1)]
+    env = StandbyEnvironment(lambda: envs.pop(0))
+    with self.assertRaises(RuntimeError):
+      env.reset()
+    # the failed spare is reset again for the next call
+    state, _ = env.reset()
+    self.assertEqual( state.shape, (4,) )
+    env.stop()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import numpy as np
+
+from environment import environment
+
+# number of precomputed observations that are cycled through
+OBS_POOL_SIZE = 1024
+
+
+def _busy_wait(seconds):
+  # spin instead of sleep to simulate emulator cpu load
+  end = time.time() + seconds
+  while time.time() < end:
+    pass
+
+
+class SyntheticBatchEnvironment(object):
+  """
+  Benchmark environment without emulator or gym dependency.
+  num_envs episodes of episode_length steps are stepped at once. The
+  observations are rows of a precomputed random pool (nothing is generated
+  per step), rewards are 1 with probability reward_prob and
+  step_cost seconds of busy-waiting per batched step simulate the emulator.
+  Implements the EnvGroup interface.
+  """
+  def __init__(self, num_envs, obs_size=64, action_size=4, episode_length=100, reward_prob=0.1,
+               step_cost=0., seed=None):
+    self.num_envs = num_envs
+    self.action_size = action_size
+    self.episode_length = episode_length
+    self.reward_prob = reward_prob
+    self.step_cost = step_cost
+    self._random = np.random.RandomState(seed)
+    self._obs_pool = self._random.random_sample([OBS_POOL_SIZE, obs_size]).astype(np.float32)
+    self._obs_pool.setflags(write=False)
+    self._t = np.zeros([num_envs], dtype=np.int64)
+    self._offset = self._random.randint(OBS_POOL_SIZE, size=num_envs)
+    self._pending_actions = None
+
+  @staticmethod
+  def probe_spec(obs_size=64, action_size=4):
+    return action_size, (obs_size,), np.float32
+
+  def __len__(self):
+    return self.num_envs
+
+  def _states(self):
+    return self._obs_pool[(self._offset + self._t) % OBS_POOL_SIZE]
+
+  def reset(self):
+    self._t[:] = 0
+    return self._states(), np.zeros([self.num_envs, self.action_size+1])
+
+  def reset_env(self, index):
+    self._t[index] = 0
+    return self._obs_pool[self._offset[index] % OBS_POOL_SIZE], np.zeros([self.action_size+1])
+
+  def step(self, actions):
+    if self.step_cost > 0.:
+      _busy_wait(self.step_cost)
+    self._t += 1
+    rewards = (self._random.random_sample(self.num_envs) < self.reward_prob).astype(np.float32)
+    terminals = self._t >= self.episode_length
+    return self._states(), rewards, terminals, [[]] * self.num_envs
+
+  def step_async(self, actions):
+    self._pending_actions = actions
+
+  def step_wait(self):
+    return self.step(self._pending_actions)
+
+  def stop(self):
+    pass
+
+
+class SyntheticEnvironment(environment.Environment):
+  """
+  Single environment version of SyntheticBatchEnvironment.
+  """
+  @staticmethod
+  def probe_spec(obs_size=64, action_size=4):
+    return SyntheticBatchEnvironment.probe_spec(obs_size, action_size)
+
+  def __init__(self, obs_size=64, action_size=4, episode_length=100, reward_prob=0.1, step_cost=0.,
+               seed=None):
+    environment.Environment.__init__(self)
+    self._batch = SyntheticBatchEnvironment(1, obs_size, action_size, episode_length, reward_prob,
+                                            step_cost, seed)
+    self.reset()
+
+  def reset(self):
+    states, last_action_rewards = self._batch.reset()
+    self.last_state = states[0]
+    self.last_action = 0
+    self.last_reward = 0
+    return self.last_state, last_action_rewards[0]
+
+  def process(self, action):
+    states, rewards, terminals, _ = self._batch.step([action])
+    self.last_state = states[0]
+    self.last_action = action
+    self.last_reward = rewards[0]
+    return states[0], rewards[0], terminals[0], []
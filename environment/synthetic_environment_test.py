@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import unittest
+import numpy as np
+
+from environment.synthetic_environment import SyntheticBatchEnvironment, SyntheticEnvironment
+
+
+class TestSyntheticEnvironment(unittest.TestCase):
+  def test_batch(self):
+    env = SyntheticBatchEnvironment(8, obs_size=16, action_size=3, episode_length=5, reward_prob=0.5, seed=0)
+    states, last_action_rewards = env.reset()
+    self.assertTrue( states.shape == (8,16) )
+    self.assertTrue( last_action_rewards.shape == (8,4) )
+    for i in range(5):
+      states, rewards, terminals, _ = env.step(np.zeros(8, dtype=np.int32))
+      self.assertTrue( np.all(terminals == (i == 4)) )
+    self.assertTrue( set(np.unique(rewards)) <= set([0., 1.]) )
+    state, _ = env.reset_env(3)
+    self.assertTrue( state.shape == (16,) )
+
+  def test_step_cost(self):
+    env = SyntheticEnvironment(step_cost=0.01)
+    start = time.time()
+    state, reward, terminal, _ = env.process(0)
+    self.assertTrue( time.time() - start >= 0.01 )
+    self.assertTrue( state.shape == (64,) )
+
+
+if __name__ == '__main__':
+  unittest.main()
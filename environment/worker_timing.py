@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import threading
+
+
+class CommandTimer(object):
+  """
+  Per-command latencies measured inside an environment worker process.
+  Samples are collected until the next reply and piggy-backed on it, so
+  timing adds no extra messages and workers without a timer pay nothing.
+  """
+  def __init__(self):
+    self._samples = {}
+    self._start = 0.
+
+  def start(self):
+    self._start = time.time()
+
+  def stop(self, command):
+    self._samples.setdefault(command, []).append(time.time() - self._start)
+
+  def flush(self):
+    samples, self._samples = self._samples, {}
+    return samples
+
+
+# latencies reported by all environments of this process, read by the trainer
+_latencies = {}
+_lock = threading.Lock()
+
+def record(samples):
+  with _lock:
+    for command, values in samples.items():
+      _latencies.setdefault(command, []).extend(values)
+
+def get_latencies():
+  """
+  return and clear the latencies (in seconds) recorded since the last call
+  """
+  global _latencies
+  with _lock:
+    latencies, _latencies = _latencies, {}
+  return latencies
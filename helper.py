@@ -2,6 +2,8 @@ import logging
 import sys
 import os
 import datetime
+import numpy as np
+import tensorflow as tf
 
 def logger_init(log_dir, id, loglevel='info', redirect_tf=True):
 
@@ -49,3 +51,25 @@ class Tee(object):
 
 def generate_id():
     return datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+
+def add_scalar_summaries(summary_writer, prefix, values, global_t):
+    """ Write a dict of python scalars to tensorboard without graph ops. """
+    summary = tf.Summary(value=[tf.Summary.Value(tag="{}/{}".format(prefix, name), simple_value=float(value))
+                                for name, value in sorted(values.items())])
+    summary_writer.add_summary(summary, global_t)
+
+def add_histogram_summary(summary_writer, tag, values, global_t, bins=30):
+    """ Write a histogram of python values to tensorboard without graph ops. """
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return
+    counts, edges = np.histogram(values, bins=bins)
+    histogram = tf.HistogramProto(min=float(values.min()),
+                                  max=float(values.max()),
+                                  num=int(values.size),
+                                  sum=float(values.sum()),
+                                  sum_squares=float(np.sum(values**2)))
+    histogram.bucket_limit.extend(edges[1:].tolist())
+    histogram.bucket.extend(counts.tolist())
+    summary = tf.Summary(value=[tf.Summary.Value(tag=tag, histo=histogram)])
+    summary_writer.add_summary(summary, global_t)
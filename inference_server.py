@@ -0,0 +1,178 @@
+import tensorflow as tf
+import numpy as np
+import time
+import threading
+import logging
+from collections import deque
+
+from model.fc_model import UnrealModel
+
+logger = logging.getLogger('StRADRL.inference_server')
+
+
+class InferenceFuture(object):
+    """
+    result of a pending inference request, filled in by the server thread.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise RuntimeError("inference request timed out")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class InferenceRequest(object):
+    def __init__(self, states, last_action_rewards, epsilon):
+        self.states = states
+        self.last_action_rewards = last_action_rewards
+        self.epsilon = epsilon
+        self.submit_time = time.time()
+        self.future = InferenceFuture()
+
+
+class InferenceServer(threading.Thread):
+    """
+    Central policy evaluation for many runners.
+    Pending (observation, last_action_reward) requests of all runners are
+    executed as one batch as soon as max_batch_size rows are waiting or the
+    oldest request waited max_latency seconds. Results are handed back through
+    futures.
+    The server has the same act/value interface as UnrealModel, so a runner
+    uses it in place of its own local policy network.
+    """
+    def __init__(self, global_net, action_size, obs_size, entropy_beta, device, max_batch_size, max_latency,
+                 hogwild=False):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.policy = UnrealModel(action_size,
+                                  obs_size,
+                                  0,
+                                  entropy_beta,
+                                  device,
+                                  inference_only=True,
+                                  flat_params=global_net.flat_params,
+                                  shared_network=global_net if hogwild else None)
+        self.sync = self.policy.sync_from(global_net, name="inference_server")
+        self.sess = None
+        self._requests = deque()
+        self._lock = threading.Lock()
+        self._has_requests = threading.Condition(self._lock)
+        # telemetry (rows per executed batch and per request latency in seconds)
+        self._batch_sizes = []
+        self._latencies = []
+
+    def start_server(self, sess):
+        logger.debug("starting inference server")
+        self.sess = sess
+        self.start()
+
+    def submit(self, states, last_action_rewards, epsilon=None):
+        request = InferenceRequest(states, last_action_rewards, epsilon)
+        with self._has_requests:
+            self._requests.append(request)
+            self._has_requests.notify()
+        return request.future
+
+    def run(self):
+        with self.sess.as_default():
+            while True:
+                self._execute(self._next_batch())
+
+    def _pending_rows(self):
+        return sum(len(request.states) for request in self._requests)
+
+    def _next_batch(self):
+        with self._has_requests:
+            while len(self._requests) == 0:
+                self._has_requests.wait()
+            # wait for more requests until the size or latency threshold is hit
+            deadline = self._requests[0].submit_time + self.max_latency
+            while self._pending_rows() < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._has_requests.wait(remaining)
+            # a batch is evaluated with one epsilon, so only requests with the epsilon of the oldest one are taken
+            epsilon = self._requests[0].epsilon
+            batch = []
+            rows = 0
+            remaining_requests = deque()
+            while len(self._requests) > 0 and rows < self.max_batch_size:
+                request = self._requests.popleft()
+                if request.epsilon == epsilon:
+                    batch.append(request)
+                    rows += len(request.states)
+                else:
+                    remaining_requests.append(request)
+            remaining_requests.extend(self._requests)
+            self._requests = remaining_requests
+        return batch
+
+    def _execute(self, batch):
+        states = [state for request in batch for state in request.states]
+        last_action_rewards = [lar for request in batch for lar in request.last_action_rewards]
+        try:
+            actions, values, probs = self.policy.run_base_actions_and_values(self.sess, states, last_action_rewards,
+                                                                             batch[0].epsilon)
+        except Exception as e:
+            logger.warn("inference failed: {}".format(e))
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        now = time.time()
+        start = 0
+        for request in batch:
+            end = start + len(request.states)
+            request.future.set_result((actions[start:end], values[start:end], probs[start:end]))
+            start = end
+        with self._lock:
+            self._batch_sizes.append(len(states))
+            self._latencies.extend([now - request.submit_time for request in batch])
+
+    def get_stats(self, reset=True):
+        """
+        batch sizes and request latencies since the last reset.
+        """
+        with self._lock:
+            batch_sizes, latencies = self._batch_sizes, self._latencies
+            if reset:
+                self._batch_sizes = []
+                self._latencies = []
+        return batch_sizes, latencies
+
+    # UnrealModel interface used by the runners
+    def run_base_actions_and_values(self, sess, states, last_action_rewards, epsilon=None):
+        return self.submit(states, last_action_rewards, epsilon).result()
+
+    def run_base_action_and_value(self, sess, s_t, last_action_reward, epsilon=None):
+        actions, values, probs = self.run_base_actions_and_values(sess, [s_t], [last_action_reward], epsilon)
+        return (actions[0], values[0], probs[0], [])
+
+    def run_base_value(self, sess, s_t, last_action_reward):
+        _, values, _ = self.run_base_actions_and_values(sess, [s_t], [last_action_reward], 0.)
+        return values[:1]
+
+    def get_initial_features(self):
+        return self.policy.get_initial_features()
+
+    def reset_state(self):
+        self.policy.reset_state()
@@ -17,6 +17,10 @@ import logging
 
 from helper import logger_init, generate_id
 from environment.environment import Environment
+from environment.env_group import EnvGroup
+from environment.standby_environment import StandbyEnvironment
+from environment.preprocessing import Pipeline
+from environment.replay_environment import RecordingEnvironment
 from model.fc_model import UnrealModel
 #from model.base import BaseModel
 from train.experience import Experience
@@ -24,7 +28,8 @@ from train.adam_applier import AdamApplier
 from train.rmsprop_applier import RMSPropApplier
 from train.base_trainer import BaseTrainer
 from train.aux_trainer import AuxTrainer
-from queuer import RunnerThread
+from queuer import RunnerThread, RolloutQueue
+from inference_server import InferenceServer
 from settings.options import get_options
 
 # get command line args
@@ -86,7 +91,8 @@ class Application(object):
             self.global_t += diff_global_t
         logger.warn("exiting training!")
         self.terminate_requested = True
-        self.environment.stop()
+        for environment in self.environments:
+            environment.stop()
         #sys.exit(0)
         time.sleep(1)
         os._exit(0)
@@ -130,8 +136,10 @@ class Application(object):
         self.stop_requested = False
         self.terminate_requested = False
         logger.debug("getting action size and observation size...")
-        action_size = Environment.get_action_size(flags.env_type, flags.env_name)
-        obs_size = Environment.get_obs_size(flags.env_type, flags.env_name)
+        action_size = Environment.get_action_size(flags.env_type, flags.env_name, **self._spec_kwargs())
+        # cached for the trainers, after the worker side preprocessing
+        obs_size = Environment.get_obs_size(flags.env_type, flags.env_name,
+                                            preprocessing=self._preprocessing(), **self._spec_kwargs())
         # Setup Global Network
         logger.debug("loading global model...")
         self.global_network = UnrealModel(action_size,
@@ -151,7 +159,9 @@ class Application(object):
                                           temporal_coherence_lambda=flags.temporal_coherence_lambda,
                                           proportionality_lambda=flags.proportionality_lambda,
                                           causality_lambda=flags.causality_lambda,
-                                          repeatability_lambda=flags.repeatability_lambda)
+                                          repeatability_lambda=flags.repeatability_lambda,
+                                          flat_params=flags.flat_params,
+                                          resource_variables=flags.hogwild)
         logger.debug("done loading global model")
         learning_rate_input = tf.placeholder("float")
         
@@ -168,20 +178,37 @@ class Application(object):
                                    clip_norm=flags.grad_norm_clip,
                                    device=device)
         """                    
-        # Start environment
-        self.environment = Environment.create_environment(flags.env_type,
-                                                      flags.env_name)
-        logger.debug("done loading environment")
+        # Setup inference server (batches the policy evaluation of all runners)
+        # (not with the in-graph maze, its runners roll out their own policy)
+        self.inference_server = None
+        if flags.use_inference_server and flags.env_type != 'tf_maze':
+            self.inference_server = InferenceServer(self.global_network,
+                                                    action_size,
+                                                    obs_size,
+                                                    flags.entropy_beta,
+                                                    device,
+                                                    flags.inference_batch_size,
+                                                    flags.inference_max_latency,
+                                                    flags.hogwild)
         
-        # Setup runner
-        self.runner = RunnerThread(flags,
-                                   self.environment,
-                                   self.global_network,
-                                   action_size,
-                                   obs_size,
-                                   device,
-                                   visualise)
-        logger.debug("done setting up RunnerTread")
+        # Setup runners with their environments (all runners fill the same queue)
+        self.environments = []
+        self.recordings = []
+        self.runners = []
+        rollout_queue = RolloutQueue(flags.queue_length)
+        for k in range(flags.num_runners):
+            self.runners.append(RunnerThread(flags,
+                                             self._create_runner_environment(),
+                                             self.global_network,
+                                             action_size,
+                                             obs_size,
+                                             device,
+                                             visualise,
+                                             runner_index=k,
+                                             rollout_queue=rollout_queue,
+                                             inference_server=self.inference_server))
+        self.runner = self.runners[0]
+        logger.debug("done setting up RunnerTreads")
         
         # Setup experience
         self.experience = Experience(flags.experience_history_size)
@@ -200,7 +227,13 @@ class Application(object):
                                         self.experience,
                                         flags.max_time_step,
                                         device,
-                                        flags.value_lambda)
+                                        flags.value_lambda,
+                                        flags.rollout_batch_length,
+                                        flags.rollout_batch_max_wait,
+                                        flags.use_vtrace,
+                                        flags.vtrace_clip_rho,
+                                        flags.vtrace_clip_c,
+                                        flags.hogwild)
         
         # Setup Aux Networks
         self.aux_trainers = []
@@ -234,7 +267,8 @@ class Application(object):
                                                 flags.gamma_pc,
                                                 self.experience,
                                                 flags.max_time_step,
-                                                device))
+                                                device,
+                                                flags.hogwild))
         
         # Start tensorflow session
         config = tf.ConfigProto(log_device_placement=False,
@@ -277,8 +311,11 @@ class Application(object):
 
         # set start time
         self.start_time = time.time() - self.wall_t
-        # Start runner
-        self.runner.start_runner(self.sess)
+        # Start runners
+        if self.inference_server is not None:
+            self.inference_server.start_server(self.sess)
+        for runner in self.runners:
+            runner.start_runner(self.sess)
         # Start base_network thread
         self.base_train_thread = threading.Thread(target=self.base_train_function, args=())
         self.base_train_thread.start()
@@ -295,6 +332,114 @@ class Application(object):
         signal.pause()
         
     
+    def _create_runner_environment(self):
+        # vectorized gym workers host several environments each
+        if flags.env_type == 'gym' and flags.gym_vec_workers > 0:
+            from environment.gym_vec_environment import GymVecEnvironment
+            groups = [GymVecEnvironment(flags.env_name, flags.gym_vec_workers, flags.gym_vec_envs_per_worker,
+                                        **self._env_kwargs())
+                      for _ in range(flags.env_groups)]
+            self.environments.extend(groups)
+            return groups
+        # the in-graph maze is built by the runner together with its policy
+        if flags.env_type == 'tf_maze':
+            if flags.maze_goals != 1:
+                raise ValueError("tf_maze samples a single goal per maze, got maze_goals={}".format(flags.maze_goals))
+            return None
+        # batched mazes, stepped with vectorized numpy operations
+        if flags.env_type == 'maze_batch':
+            from environment.maze_environment_batch import MazeBatchEnvironment
+            groups = [MazeBatchEnvironment(flags.envs_per_group, flags.maze_size, flags.maze_wall_density,
+                                           pixel_change=flags.use_pixel_change, seed=self._maze_seed())
+                      for _ in range(flags.env_groups)]
+            self.environments.extend(groups)
+            return groups
+        # batched synthetic benchmark environments
+        if flags.env_type == 'synthetic' and flags.env_groups > 1:
+            from environment.synthetic_environment import SyntheticBatchEnvironment
+            groups = [SyntheticBatchEnvironment(flags.envs_per_group, **self._synthetic_kwargs())
+                      for _ in range(flags.env_groups)]
+            self.environments.extend(groups)
+            return groups
+        # several groups of environments are stepped in a pipeline
+        if flags.env_groups > 1:
+            groups = [EnvGroup([self._create_environment() for _ in range(flags.envs_per_group)])
+                      for _ in range(flags.env_groups)]
+            self.environments.extend(groups)
+            return groups
+        environment = self._create_environment()
+        self.environments.append(environment)
+        return environment
+    
+    def _create_environment(self):
+        env = self._create_backend_environment()
+        if flags.env_record:
+            # every environment writes its own recording, numbered in creation order
+            path = "{}{}.npz".format(flags.env_record, len(self.recordings))
+            action_size = Environment.get_action_size(flags.env_type, flags.env_name, **self._spec_kwargs())
+            env = RecordingEnvironment(env, path, action_size, flags.env_record_frames)
+            self.recordings.append(env)
+        return env
+    
+    def _create_backend_environment(self):
+        if flags.env_type == 'maze':
+            kwargs = {"size": flags.maze_size,
+                      "wall_density": flags.maze_wall_density,
+                      "num_goals": flags.maze_goals,
+                      "seed": self._maze_seed()}
+            return Environment.create_environment(flags.env_type, flags.env_name, **kwargs)
+        if flags.env_type == 'synthetic':
+            return Environment.create_environment(flags.env_type, flags.env_name, **self._synthetic_kwargs())
+        if flags.env_type == 'replay':
+            return Environment.create_environment(flags.env_type, flags.env_name)
+        kwargs = self._env_kwargs()
+        kwargs["timing"] = flags.env_timing
+        if flags.env_type == 'gym':
+            # the gym backend replaces crashed or hung workers
+            kwargs["step_timeout"] = flags.env_step_timeout
+            kwargs["reset_timeout"] = flags.env_reset_timeout
+        if flags.standby_env:
+            # a pre-reset spare instance is swapped in at episode end
+            return StandbyEnvironment(lambda: Environment.create_environment(flags.env_type,
+                                                                             flags.env_name,
+                                                                             **kwargs))
+        return Environment.create_environment(flags.env_type,
+                                              flags.env_name,
+                                              **kwargs)
+    
+    def _maze_seed(self):
+        return None if flags.maze_seed < 0 else flags.maze_seed
+    
+    def _spec_kwargs(self):
+        # the observation shape of the maze env types depends on the maze size
+        if flags.env_type in ('maze', 'maze_batch', 'tf_maze'):
+            return {"size": flags.maze_size}
+        if flags.env_type == 'synthetic':
+            return {"obs_size": flags.synthetic_obs_size, "action_size": flags.synthetic_action_size}
+        return {}
+    
+    def _synthetic_kwargs(self):
+        return {"obs_size": flags.synthetic_obs_size,
+                "action_size": flags.synthetic_action_size,
+                "episode_length": flags.synthetic_episode_length,
+                "reward_prob": flags.synthetic_reward_prob,
+                "step_cost": flags.synthetic_step_cost}
+    
+    def _env_kwargs(self):
+        # worker side options; unset options keep the backend defaults
+        kwargs = {"max_pool_frames": flags.max_pool_frames,
+                  "auto_reset": flags.env_auto_reset}
+        if flags.action_repeat > 0:
+            kwargs["action_repeat"] = flags.action_repeat
+        if flags.obs_preprocessing:
+            kwargs["preprocessing"] = self._preprocessing()
+        return kwargs
+    
+    def _preprocessing(self):
+        if not flags.obs_preprocessing:
+            return None
+        return Pipeline.parse(flags.obs_preprocessing)
+    
     def init_tensorboard(self):
         # tensorboard summary for base 
         self.score_input = tf.placeholder(tf.int32)
@@ -6,6 +6,7 @@ from __future__ import print_function
 import tensorflow as tf
 import numpy as np
 import logging
+from tensorflow.python.ops import resource_variable_ops
 
 logger = logging.getLogger('StRADRL.model')
 
@@ -31,6 +32,22 @@ def conv_initializer(kernel_width, kernel_height, input_channels, dtype=tf.float
 class UnrealModel(object):
     """
     UNREAL algorithm network model.
+    The act and value methods use inference outputs without dropout that share
+    the base variables. With inference_only (actor copies) only those are
+    built: no dropout, no summaries, no aux networks and no losses.
+    With flat_params the parameters of each group ("base": trunk, policy and
+    value, "aux": aux heads) are views into one contiguous flat variable, so
+    get_vars() returns one variable per group and a sync is one assign per
+    group. Local copies have to use the same setting as the global network.
+    With resource_variables the parameters are resource variables; a read of
+    one is a snapshot that later updates don't change.
+    With shared_network (hogwild) no trainable variables are created: the
+    network reads the variables of shared_network, get_vars() returns the
+    shared variables it uses and sync_from() is a no-op. shared_network has to
+    be built with resource_variables. Every parameter is read once per run and
+    forward and backward pass use that read, so the gradients of a run are
+    computed on one consistent read of the parameters while other trainers
+    keep updating them.
     """
     def __init__(self,
                 action_size,
@@ -52,7 +69,11 @@ class UnrealModel(object):
                 causality_lambda=0.,
                 repeatability_lambda=0.,
                 for_display=False,
-                use_base=True):
+                use_base=True,
+                inference_only=False,
+                flat_params=False,
+                shared_network=None,
+                resource_variables=False):
         self._device = device
         self._action_size = action_size
         self._obs_size = obs_size
@@ -66,6 +87,12 @@ class UnrealModel(object):
         self._use_causality = use_causality
         self._use_repeatability = use_repeatability
         self._use_base = use_base
+        self._inference_only = inference_only
+        self.flat_params = flat_params
+        self.resource_variables = resource_variables
+        if shared_network is not None and not shared_network.resource_variables:
+            raise ValueError("hogwild reads need a shared_network built with resource_variables=True")
+        self._shared_network = shared_network
         self._pixel_change_lambda = pixel_change_lambda
         self._temporal_coherence_lambda = temporal_coherence_lambda
         self._proportionality_lambda = proportionality_lambda
@@ -89,46 +116,164 @@ class UnrealModel(object):
         logger.debug("creating network -- scope_name:{} -- device:{}".format(scope_name,self._device))
         logger.debug("base:{} -- pc:{} -- vr:{} -- rp:{} -- tc:{}".format(self._use_base,self._use_pixel_change,\
                             self._use_value_replay,self._use_reward_prediction,self._use_temporal_coherence))
-        with tf.device(self._device), tf.variable_scope(scope_name) as scope:
-            ## lstm
-            #self.lstm_cell = tf.contrib.rnn.BasicLSTMCell(256, state_is_tuple=True)
-              
-            # [base A3C network]
-            #if self._use_base:
-            self._create_base_network()
-
-            # [Pixel change network]
-            if self._use_pixel_change:
-                self._create_pc_network()
-                if for_display:
-                    self._create_pc_network_for_display()
-
-            # [Value replay network]
-            if self._use_value_replay:
-                self._create_vr_network()
-
-            # [Reward prediction network]
-            if self._use_reward_prediction:
-                self._create_rp_network()
-                
-            # [Temporal Coherence network]
-            if self._use_temporal_coherence:
-                self._create_tc_network()
+        self._custom_getter = None
+        if self._shared_network is not None:
+            self._shared_reads = {}
+            self._custom_getter = self._shared_param_getter
+        elif self.flat_params:
+            layout = self._param_layout(scope_name, for_display)
+            self._custom_getter = self._flat_param_getter
+        with tf.device(self._device), tf.variable_scope(scope_name, custom_getter=self._custom_getter,
+                                                        use_resource=self.resource_variables) as scope:
+            if self.flat_params and self._shared_network is None:
+                self._create_flat_params(layout)
             
-            # [Proportionality network]    
-            if self._use_proportionality:
-                self._create_prop_network()
-                
-            # [Causality network]    
-            if self._use_causality:
-                self._create_caus_network()
-                
-            if self._use_repeatability:
-                self._create_rep_network()
+            self._build_network(for_display)
             
             self.reset_state()
 
-            self.variables = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope_name)
+            if self._shared_network is not None:
+                # the shared variables that hold the parameters used, in the order of the shared network
+                used = set(self._shared_network._param_owner(name).op.name for name in self._shared_reads)
+                self.variables = [v for v in self._shared_network.get_vars() if v.op.name in used]
+            else:
+                self.variables = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope_name)
+            
+            # number of gradient updates applied to this network (used to tag rollouts with their policy lag)
+            self.param_version = tf.Variable(0, trainable=False, dtype=tf.int64, name="param_version")
+
+
+    def _build_network(self, for_display):
+        ## lstm
+        #self.lstm_cell = tf.contrib.rnn.BasicLSTMCell(256, state_is_tuple=True)
+          
+        # [base A3C network]
+        #if self._use_base:
+        self._create_base_network()
+
+        if not self._inference_only:
+            self._create_aux_networks(for_display)
+
+    def _param_layout(self, scope_name, for_display):
+        # (name, shape, initializer) of every variable in creation order, taken
+        # from a build of the network in a throwaway graph
+        layout = []
+        def record(getter, name, *args, **kwargs):
+            if name not in [entry[0] for entry in layout]:
+                layout.append((name, tf.TensorShape(kwargs["shape"]).as_list(), kwargs["initializer"]))
+            return getter(name, *args, **kwargs)
+        with tf.Graph().as_default(), tf.variable_scope(scope_name, custom_getter=record):
+            self._build_network(for_display)
+        self.reuse_lstm = False
+        self.reuse_value = False
+        self.reuse_policy = False
+        return layout
+
+    def _param_group(self, name):
+        # variables are named "net_{thread_index}/{layer scope}/{name}"
+        return "base" if name.split("/")[1].startswith("base_") else "aux"
+
+    def _create_flat_params(self, layout):
+        # One flat variable per parameter group, split into reshaped views once.
+        # The views are handed out by _flat_param_getter in place of variables.
+        self._flat_views = {}
+        self._flat_owners = {}
+        self.flat_variables = []
+        for group in ("base", "aux"):
+            entries = [entry for entry in layout if self._param_group(entry[0]) == group]
+            if not entries:
+                continue
+            initial_values = []
+            for _, shape, initializer in entries:
+                if initializer is None:
+                    initializer = tf.glorot_uniform_initializer()
+                initial_values.append(tf.reshape(initializer(shape, dtype=tf.float32), [-1]))
+            if self.resource_variables:
+                flat_variable = resource_variable_ops.ResourceVariable(tf.concat(initial_values, 0),
+                                                                       name="flat_{}".format(group))
+            else:
+                flat_variable = tf.Variable(tf.concat(initial_values, 0), name="flat_{}".format(group))
+            self.flat_variables.append(flat_variable)
+            parts = tf.split(flat_variable, [int(np.prod(shape)) for _, shape, _ in entries])
+            for (name, shape, _), part in zip(entries, parts):
+                self._flat_views[name] = tf.reshape(part, shape)
+                self._flat_owners[name] = flat_variable
+        
+        # all groups as one array, e.g. for process based actors
+        self.flat_params_input = tf.placeholder(tf.float32, [None], name="flat_params_input")
+        flat_inputs = tf.split(self.flat_params_input, [v.get_shape()[0].value for v in self.flat_variables])
+        self.set_flat_params_op = tf.group(*[tf.assign(v, flat_input)
+                                             for v, flat_input in zip(self.flat_variables, flat_inputs)])
+
+    def _flat_param_getter(self, getter, name, *args, **kwargs):
+        return self._flat_views[name]
+
+    def _param_owner(self, name):
+        # the variable holding parameter name (its flat variable with flat_params)
+        if self.flat_params:
+            return self._flat_owners[name]
+        return [v for v in self.variables if v.op.name == name][0]
+
+    def _shared_param_getter(self, getter, name, *args, **kwargs):
+        # "net_{thread_index}/..." is read from "net_{shared index}/...". Every
+        # parameter is read once and the read is reused, so forward and backward
+        # pass of one run see the same snapshot of the resource variable. The
+        # flat views are splits of one read of each group variable.
+        shared_name = "net_{}".format(self._shared_network._thread_index) + name[name.index("/"):]
+        if shared_name not in self._shared_reads:
+            if self._shared_network.flat_params:
+                self._shared_reads[shared_name] = self._shared_network._flat_views[shared_name]
+            else:
+                self._shared_reads[shared_name] = self._shared_network._param_owner(shared_name).read_value()
+        return self._shared_reads[shared_name]
+
+    def _create_aux_networks(self, for_display):
+        # [Pixel change network]
+        if self._use_pixel_change:
+            self._create_pc_network()
+            if for_display:
+                self._create_pc_network_for_display()
+
+        # Inputs of the aux networks below share one trunk evaluation
+        self._aux_trunk_inputs = []
+
+        # [Value replay network]
+        if self._use_value_replay:
+            self._create_vr_network()
+
+        # [Reward prediction network]
+        if self._use_reward_prediction:
+            self._create_rp_network()
+            
+        # [Temporal Coherence network]
+        if self._use_temporal_coherence:
+            self._create_tc_network()
+        
+        # [Proportionality network]    
+        if self._use_proportionality:
+            self._create_prop_network()
+            
+        # [Causality network]    
+        if self._use_causality:
+            self._create_caus_network()
+            
+        if self._use_repeatability:
+            self._create_rep_network()
+        
+        # [Aux heads] on the fc outputs of the shared trunk evaluation
+        aux_outputs = self._create_aux_trunk()
+        if self._use_value_replay:
+            self._create_vr_head(*aux_outputs["vr"])
+        if self._use_reward_prediction:
+            self._create_rp_head(*aux_outputs["rp"])
+        if self._use_temporal_coherence:
+            self._create_tc_head(*aux_outputs["tc"])
+        if self._use_proportionality:
+            self._create_prop_head(*aux_outputs["prop"])
+        if self._use_causality:
+            self._create_caus_head(*aux_outputs["caus"])
+        if self._use_repeatability:
+            self._create_rep_head(*aux_outputs["rep"])
 
 
     def _create_base_network(self):
@@ -139,9 +284,6 @@ class UnrealModel(object):
         # Last action and reward
         self.base_last_action_reward_input = tf.placeholder("float", [None, self._action_size+1])
         
-        # Fully connected layers (we "borrow" the reuse_lstm boolean)
-        self.base_fc_outputs = self._fc_layers(self.base_input, reuse=self.reuse_lstm)
-        
         ## Conv layers
         #base_conv_output = self._base_conv_layers(self.base_input, reuse=self.reuse_conv)
         
@@ -163,10 +305,43 @@ class UnrealModel(object):
         #                          self.base_initial_lstm_state,
         #                          reuse=self.reuse_lstm)
 
-        self.base_pi, self.base_pi_log, self.base_pi_linear = self._base_policy_layer(self.base_fc_outputs, reuse=self.reuse_policy) # policy output
-        self.base_v  = self._base_value_layer(self.base_fc_outputs, reuse=self.reuse_value)  # value output
-
-    def _fc_layers(self, state_input, reuse=False):
+        if not self._inference_only:
+            # Fully connected layers (we "borrow" the reuse_lstm boolean)
+            self.base_fc_outputs = self._fc_layers(self.base_input, reuse=self.reuse_lstm)
+            self.base_pi, self.base_pi_log, self.base_pi_linear = self._base_policy_layer(self.base_fc_outputs, reuse=self.reuse_policy) # policy output
+            self.base_v  = self._base_value_layer(self.base_fc_outputs, reuse=self.reuse_value)  # value output
+        
+        # Inference outputs for acting and bootstrap values (no dropout, no summaries)
+        inference_fc_outputs = self._fc_layers(self.base_input, reuse=self.reuse_lstm, dropout=False)
+        self.base_inference_pi, _, self.base_inference_pi_linear = self._base_policy_layer(inference_fc_outputs,
+                                                                                          reuse=self.reuse_policy,
+                                                                                          add_summaries=False)
+        self.base_inference_v = self._base_value_layer(inference_fc_outputs, reuse=self.reuse_value,
+                                                       add_summaries=False)
+        
+        # Fused act op (action is sampled in-graph)
+        self._create_base_act_ops()
+
+    def _create_base_act_ops(self):
+        # Exploration rate for epsilon-greedy sampling
+        self.base_epsilon_input = tf.placeholder_with_default(0.0, [], name="base_epsilon")
+        batch_size = tf.shape(self.base_inference_pi_linear)[0]
+        
+        # categorical (boltzmann) sampling from the policy logits
+        self.base_action_sample = tf.reshape(tf.multinomial(self.base_inference_pi_linear, 1), [-1])
+        
+        # epsilon-greedy sampling
+        greedy_action = tf.argmax(self.base_inference_pi_linear, axis=1)
+        random_action = tf.random_uniform([batch_size], maxval=self._action_size, dtype=tf.int64)
+        explore = tf.random_uniform([batch_size]) < self.base_epsilon_input
+        self.base_action_eps_greedy = tf.where(explore, random_action, greedy_action)
+        
+        # behaviour policy probability of the sampled actions (for off-policy correction)
+        self.base_action_sample_prob = tf.reduce_sum(self.base_inference_pi * tf.one_hot(self.base_action_sample, self._action_size), axis=1)
+        is_greedy = tf.cast(tf.equal(self.base_action_eps_greedy, greedy_action), tf.float32)
+        self.base_action_eps_greedy_prob = (1. - self.base_epsilon_input) * is_greedy + self.base_epsilon_input / self._action_size
+
+    def _fc_layers(self, state_input, reuse=False, dropout=True):
         with tf.variable_scope("base_fc", reuse=reuse) as scope:
             # Weight for policy output layer
             #logger.debug(state_input.shape[1])
@@ -177,8 +352,12 @@ class UnrealModel(object):
             #out_fc_1 = tf.nn.relu(tf.matmul(state_input, W_fc_1) + b_fc_1)     
             #out_fc_2 = tf.nn.relu(tf.matmul(out_fc_1, W_fc_2) + b_fc_2)
             
-            out_fc_1 = tf.nn.dropout(tf.nn.relu(tf.matmul(state_input, W_fc_1) + b_fc_1),0.5)     
-            out_fc_2 = tf.nn.dropout(tf.nn.relu(tf.matmul(out_fc_1, W_fc_2) + b_fc_2),0.5)
+            out_fc_1 = tf.nn.relu(tf.matmul(state_input, W_fc_1) + b_fc_1)
+            if dropout:
+                out_fc_1 = tf.nn.dropout(out_fc_1,0.5)
+            out_fc_2 = tf.nn.relu(tf.matmul(out_fc_1, W_fc_2) + b_fc_2)
+            if dropout:
+                out_fc_2 = tf.nn.dropout(out_fc_2,0.5)
             #out_fc_3 = tf.nn.dropout(tf.nn.relu(tf.matmul(out_fc_2, W_fc_3) + b_fc_3),0.5)
             
             self.reuse_lstm = True # "borrowed lstm reuse check"
@@ -186,13 +365,14 @@ class UnrealModel(object):
             return out_fc_2
         
 
-    def _base_policy_layer(self, lstm_outputs, reuse=False):
+    def _base_policy_layer(self, lstm_outputs, reuse=False, add_summaries=True):
         with tf.variable_scope("base_policy", reuse=reuse) as scope:
             # Weight for policy output layer
             W_fc_p, b_fc_p = self._fc_variable([64, self._action_size], "base_fc_p")
             
-            tf.summary.histogram("policyW", W_fc_p)
-            tf.summary.histogram("policyb", b_fc_p)
+            if add_summaries:
+                tf.summary.histogram("policyW", W_fc_p)
+                tf.summary.histogram("policyb", b_fc_p)
             
             # Policy (output)
             #logger.warn(" !! doing some tricks with the policy layer, have a look !!")
@@ -207,13 +387,14 @@ class UnrealModel(object):
             return base_pi, base_pi_log, base_pi_linear
 
 
-    def _base_value_layer(self, lstm_outputs, reuse=False):
+    def _base_value_layer(self, lstm_outputs, reuse=False, add_summaries=True):
         with tf.variable_scope("base_value", reuse=reuse) as scope:
             # Weight for value output layer
             W_fc_v, b_fc_v = self._fc_variable([64, 1], "base_fc_v")
             
-            tf.summary.histogram("valueW", W_fc_v)
-            tf.summary.histogram("valueb", b_fc_v)
+            if add_summaries:
+                tf.summary.histogram("valueW", W_fc_v)
+                tf.summary.histogram("valueb", b_fc_v)
             
             # Value (output)
             #logger.warn("!! ELU set for value !!")
@@ -228,28 +409,58 @@ class UnrealModel(object):
 
 
 
+    def base_policy_and_value(self, state_input):
+        # Base policy logits and value of an in-graph state tensor (e.g. inside a
+        # tf.while_loop). Reuses the base variables, no dropout and no summaries.
+        with tf.device(self._device), tf.variable_scope("net_{}".format(self._thread_index), reuse=True,
+                                                        custom_getter=self._custom_getter):
+            fc_outputs = self._fc_layers(state_input, reuse=True, dropout=False)
+            _, _, pi_linear = self._base_policy_layer(fc_outputs, reuse=True, add_summaries=False)
+            v = self._base_value_layer(fc_outputs, reuse=True, add_summaries=False)
+        return pi_linear, v
+
+    def _aux_trunk_input(self, head, name):
+        # Only the enabled heads create inputs. All of them go through the same
+        # trunk evaluation, so running any aux head needs all of them fed.
+        aux_input = tf.placeholder("float", self.input_shape, name=name)
+        self._aux_trunk_inputs.append((head, aux_input))
+        return aux_input
+
+    def _create_aux_trunk(self):
+        # Concatenates all aux inputs into one batch, runs the fc layers once and
+        # splits the outputs back out. Returns the outputs per head, in the order
+        # the inputs were created.
+        aux_outputs = {}
+        if not self._aux_trunk_inputs:
+            return aux_outputs
+        heads, inputs = zip(*self._aux_trunk_inputs)
+        batch_sizes = tf.stack([tf.shape(aux_input)[0] for aux_input in inputs])
+        trunk_outputs = self._fc_layers(tf.concat(inputs, 0), reuse=self.reuse_lstm)
+        for head, output in zip(heads, tf.split(trunk_outputs, batch_sizes, num=len(inputs))):
+            aux_outputs.setdefault(head, []).append(output)
+        return aux_outputs
+
     def _create_vr_network(self):
         # State (Image input)
-        self.vr_input = tf.placeholder("float", self.input_shape, name="vr_input")
+        self.vr_input = self._aux_trunk_input("vr", "vr_input")
 
         # Last action and reward
         self.vr_last_action_reward_input = tf.placeholder("float", [None, self._action_size+1])
         
-        vr_lstm_outputs = self._fc_layers(self.vr_input, reuse=self.reuse_lstm)
-        
+    def _create_vr_head(self, vr_lstm_outputs):
         # value output
         self.vr_v  = self._base_value_layer(vr_lstm_outputs, reuse=self.reuse_value)
 
     
     def _create_rp_network(self):
-        self.rp_input = tf.placeholder("float", self.input_shape)
+        self.rp_input = self._aux_trunk_input("rp", "rp_input")
         """
         # RP conv layers
         rp_conv_output = self._base_conv_layers(self.rp_input, reuse=self.reuse_conv)
         rp_conv_output_reshaped = tf.reshape(rp_conv_output, [1,9*9*32*3])
         """
-        rp_fc_output = self._fc_layers(self.rp_input, reuse=self.reuse_lstm)
         
+    def _create_rp_head(self, rp_fc_output):
         with tf.variable_scope("rp_fc") as scope:
             # Weights
             W_fc1, b_fc1 = self._fc_variable([64, 3], "rp_fc1")
@@ -261,32 +472,26 @@ class UnrealModel(object):
     # temporal coherence
     def _create_tc_network(self):
         # Observations (input)
-        self.tc_input1 = tf.placeholder("float", self.input_shape, name="tc_input1")
-        self.tc_input2 = tf.placeholder("float", self.input_shape, name="tc_input2")
+        self.tc_input1 = self._aux_trunk_input("tc", "tc_input1")
+        self.tc_input2 = self._aux_trunk_input("tc", "tc_input2")
 
+    def _create_tc_head(self, tc_output1, tc_output2):
         # fc output is our internal state s
-        tc_output1 = self._fc_layers(self.tc_input1, reuse=self.reuse_lstm)
-        tc_output2 = self._fc_layers(self.tc_input2, reuse=self.reuse_lstm)
-        
         # loss is norm of fc output difference
         self.tc_q = tf.reduce_mean(tf.norm(tc_output2-tc_output1))
         
     # proportionality
     def _create_prop_network(self):
         # Observations (input)
-        self.prop_input1_1 = tf.placeholder("float", self.input_shape, name="prop_input1_1")
-        self.prop_input1_2 = tf.placeholder("float", self.input_shape, name="prop_input1_2")
-        self.prop_input2_1 = tf.placeholder("float", self.input_shape, name="prop_input2_1")
-        self.prop_input2_2 = tf.placeholder("float", self.input_shape, name="prop_input2_2")
+        self.prop_input1_1 = self._aux_trunk_input("prop", "prop_input1_1")
+        self.prop_input1_2 = self._aux_trunk_input("prop", "prop_input1_2")
+        self.prop_input2_1 = self._aux_trunk_input("prop", "prop_input2_1")
+        self.prop_input2_2 = self._aux_trunk_input("prop", "prop_input2_2")
         # Boolean vector check for if actions 1 and 2 are equal
         self.prop_actioncheck = tf.placeholder("float", [None,], name="prop_actioncheck")
 
-        # get fc outputs (our internal state s)
-        prop_output1_1 = self._fc_layers(self.prop_input1_1, reuse=self.reuse_lstm)
-        prop_output1_2 = self._fc_layers(self.prop_input1_2, reuse=self.reuse_lstm)
-        prop_output2_1 = self._fc_layers(self.prop_input2_1, reuse=self.reuse_lstm)
-        prop_output2_2 = self._fc_layers(self.prop_input2_2, reuse=self.reuse_lstm)
-        
+    def _create_prop_head(self, prop_output1_1, prop_output1_2, prop_output2_1, prop_output2_2):
+        # fc outputs are our internal state s
         prop_ds1 = tf.norm(prop_output1_2-prop_output1_1,axis=1)
         prop_ds2 = tf.norm(prop_output2_2-prop_output2_1,axis=1)
         prop_statediff = tf.square(prop_ds2-prop_ds1)
@@ -295,16 +500,14 @@ class UnrealModel(object):
         
     def _create_caus_network(self):
         # Observations (input)
-        self.caus_input1 = tf.placeholder("float", self.input_shape, name="caus_input1")
-        self.caus_input2 = tf.placeholder("float", self.input_shape, name="caus_input2")
+        self.caus_input1 = self._aux_trunk_input("caus", "caus_input1")
+        self.caus_input2 = self._aux_trunk_input("caus", "caus_input2")
         # Boolean vector check for if actions 1 and 2 are equal
         self.caus_actioncheck = tf.placeholder("float", [None,], name="caus_actioncheck")
         # Boolean vector check for if reward 1 and 2 are different
         self.caus_rewardcheck = tf.placeholder("float", [None,], name="caus_rewardcheck")
         
-        caus_out1 = self._fc_layers(self.caus_input1, reuse=self.reuse_lstm)
-        caus_out2 = self._fc_layers(self.caus_input2, reuse=self.reuse_lstm)
-        
+    def _create_caus_head(self, caus_out1, caus_out2):
         caus_state_distance = tf.exp(-tf.norm(caus_out2-caus_out1,axis=1))
         
         self.caus_q = tf.reduce_mean(caus_state_distance*self.caus_actioncheck*self.caus_rewardcheck)
@@ -312,19 +515,15 @@ class UnrealModel(object):
         
     def _create_rep_network(self):
         # Observations (input)
-        self.rep_input1_1 = tf.placeholder("float", self.input_shape, name="rep_input1_1")
-        self.rep_input1_2 = tf.placeholder("float", self.input_shape, name="rep_input1_2")
-        self.rep_input2_1 = tf.placeholder("float", self.input_shape, name="rep_input2_1")
-        self.rep_input2_2 = tf.placeholder("float", self.input_shape, name="rep_input2_2")
+        self.rep_input1_1 = self._aux_trunk_input("rep", "rep_input1_1")
+        self.rep_input1_2 = self._aux_trunk_input("rep", "rep_input1_2")
+        self.rep_input2_1 = self._aux_trunk_input("rep", "rep_input2_1")
+        self.rep_input2_2 = self._aux_trunk_input("rep", "rep_input2_2")
         # Boolean vector check for if actions 1 and 2 are equal
         self.rep_actioncheck = tf.placeholder("float", [None,], name="rep_actioncheck")
 
-        # get fc outputs (our internal state s)
-        rep_out1_1 = self._fc_layers(self.rep_input1_1, reuse=self.reuse_lstm)
-        rep_out1_2 = self._fc_layers(self.rep_input1_2, reuse=self.reuse_lstm)
-        rep_out2_1 = self._fc_layers(self.rep_input2_1, reuse=self.reuse_lstm)
-        rep_out2_2 = self._fc_layers(self.rep_input2_2, reuse=self.reuse_lstm)
-        
+    def _create_rep_head(self, rep_out1_1, rep_out1_2, rep_out2_1, rep_out2_2):
+        # fc outputs are our internal state s
         rep_sq_diff_s_change = tf.norm((rep_out2_2-rep_out2_1)-(rep_out1_2-rep_out1_1),axis=1)
         
         rep_state_distance = tf.exp(-tf.norm(rep_out2_1-rep_out1_1,axis=1))
@@ -463,34 +662,79 @@ class UnrealModel(object):
     def run_base_policy_and_value(self, sess, s_t, last_action_reward):
         # This run_base_policy_and_value() is used when forward propagating.
         # so the step size is 1.
-        pi_out, v_out = sess.run( [self.base_pi, self.base_v],
+        pi_out, v_out = sess.run( [self.base_inference_pi, self.base_inference_v],
                                     feed_dict = {self.base_input : [s_t],
                                                  self.base_last_action_reward_input : [last_action_reward]} )
         # pi_out: (1,3), v_out: (1)
         return (pi_out[0], v_out[0], [])
   
+    def run_base_action_and_value(self, sess, s_t, last_action_reward, epsilon=None):
+        # Single step version of run_base_actions_and_values()
+        actions, values, probs = self.run_base_actions_and_values(sess, [s_t], [last_action_reward], epsilon)
+        return (actions[0], values[0], probs[0], [])
+
+    def run_base_actions_and_values(self, sess, states, last_action_rewards, epsilon=None):
+        # Samples the actions in-graph, so only action indices, values and the
+        # behaviour probabilities of the sampled actions are fetched.
+        # epsilon=None samples from the policy distribution (boltzmann),
+        # otherwise epsilon-greedy is used.
+        feed_dict = {self.base_input : states,
+                     self.base_last_action_reward_input : last_action_rewards}
+        if epsilon is None:
+            action_ops = [self.base_action_sample, self.base_action_sample_prob]
+        else:
+            action_ops = [self.base_action_eps_greedy, self.base_action_eps_greedy_prob]
+            feed_dict[self.base_epsilon_input] = epsilon
+        actions, probs, values = sess.run( action_ops + [self.base_inference_v], feed_dict = feed_dict )
+        # actions: (batch,), values: (batch,), probs: (batch,)
+        return actions, values, probs
+  
     def run_base_value(self, sess, s_t, last_action_reward):
         # This run_base_value() is used for calculating V for bootstrapping at the 
         # end of LOCAL_T_MAX time step sequence.
         # When the next sequence starts, V will be calculated again with the same state using updated network weights,
         # so we don't update LSTM state here.
-        v_out = sess.run( [self.base_v],
+        v_out = sess.run( [self.base_inference_v],
                              feed_dict = {self.base_input : [s_t],
                                           self.base_last_action_reward_input : [last_action_reward]} )
         return v_out[0]
   
+    def run_base_values(self, sess, states, last_action_rewards):
+        # values of a batch of states in one run (e.g. a whole replayed sequence)
+        v_out = sess.run( self.base_inference_v,
+                          feed_dict = {self.base_input : states,
+                                       self.base_last_action_reward_input : last_action_rewards} )
+        return v_out
+  
     def run_vr_value(self, sess, s_t, last_action_reward):
-        vr_v_out = sess.run( self.vr_v,
-                         feed_dict = {self.vr_input : [s_t],
-                                      self.vr_last_action_reward_input : [last_action_reward]} )
+        # the other aux heads get explicitly empty batches
+        feed_dict = dict((aux_input, np.zeros([0, self._obs_size])) for _, aux_input in self._aux_trunk_inputs)
+        feed_dict.update({self.vr_input : [s_t],
+                          self.vr_last_action_reward_input : [last_action_reward]})
+        vr_v_out = sess.run( self.vr_v, feed_dict = feed_dict )
         return vr_v_out[0]
 
   
     def get_vars(self):
         return self.variables
+    
+    def get_flat_params(self, sess):
+        # all parameters as one numpy array (flat_params only)
+        return np.concatenate(sess.run(self.flat_variables))
+    
+    def set_flat_params(self, sess, params):
+        sess.run(self.set_flat_params_op, feed_dict={self.flat_params_input: params})
+    
+    def count_update(self, apply_op):
+        # increments param_version once apply_op has been executed
+        with tf.control_dependencies([apply_op]):
+            return tf.assign_add(self.param_version, 1)
   
 
     def sync_from(self, src_netowrk, name=None):
+        if self._shared_network is not None:
+            # the parameters are read from the shared network directly
+            return tf.no_op(name=name)
         src_vars = src_netowrk.get_vars()
         dst_vars = self.get_vars()
 
@@ -3,6 +3,7 @@ import numpy as np
 import math
 import tensorflow as tf
 from model import UnrealModel
+from model.fc_model import UnrealModel as FcUnrealModel
 
 class TestUnrealModel(tf.test.TestCase):
   def test_unreal_variable_size(self):
@@ -76,6 +77,184 @@ class TestUnrealModel(tf.test.TestCase):
     self.assertEqual( len(variables), var_size )
 
 
+class TestFcUnrealModel(tf.test.TestCase):
+  action_size = 3
+  obs_size = 8
+
+  def _states(self, batch_size=5):
+    return np.random.RandomState(0).random_sample([batch_size, self.obs_size]).astype(np.float32)
+
+  def _last_action_rewards(self, batch_size=5):
+    return np.zeros([batch_size, self.action_size+1], dtype=np.float32)
+
+  def _params(self, sess, model):
+    # variable values by name, e.g. "W_base_fc_1"
+    return dict((v.op.name.split("/")[-1], sess.run(v)) for v in model.get_vars())
+
+  def _fc_reference(self, params, states):
+    # the fc trunk evaluated on its own, without dropout
+    hidden = np.maximum(states.dot(params["W_base_fc_1"]) + params["b_base_fc_1"], 0.)
+    return np.maximum(hidden.dot(params["W_base_fc_2"]) + params["b_base_fc_2"], 0.)
+
+  def test_aux_heads_share_one_trunk(self):
+    """ Check the aux heads get the outputs of separate trunk evaluations from the shared one """
+    with tf.Graph().as_default():
+      # without dropout the trunk outputs are deterministic
+      with tf.test.mock.patch.object(tf.nn, "dropout", lambda x, keep_prob: x):
+        model = FcUnrealModel(self.action_size, self.obs_size, 1, 0.001, "/cpu:0",
+                              use_value_replay=True, use_reward_prediction=True,
+                              use_temporal_coherence=True, use_proportionality=True,
+                              use_causality=True, use_repeatability=True)
+      # the fc layers are applied by the base, the inference and one aux trunk evaluation
+      W_fc_1 = [v for v in model.get_vars() if v.op.name.endswith("W_base_fc_1")][0]
+      self.assertEqual( len([op for op in W_fc_1.value().consumers() if op.type == "MatMul"]), 3 )
+
+      random = np.random.RandomState(1)
+      inputs = [model.vr_input, model.rp_input, model.tc_input1, model.tc_input2,
+                model.prop_input1_1, model.prop_input1_2, model.prop_input2_1, model.prop_input2_2,
+                model.caus_input1, model.caus_input2,
+                model.rep_input1_1, model.rep_input1_2, model.rep_input2_1, model.rep_input2_2]
+      sizes = [5, 3, 4, 4, 6, 6, 6, 6, 2, 2, 3, 3, 3, 3]
+      states = [random.random_sample([size, self.obs_size]).astype(np.float32) for size in sizes]
+      checks = dict((check, random.randint(2, size=size).astype(np.float32))
+                    for check, size in [(model.prop_actioncheck, 6), (model.caus_actioncheck, 2),
+                                        (model.caus_rewardcheck, 2), (model.rep_actioncheck, 3)])
+      feed_dict = dict(zip(inputs, states))
+      feed_dict.update(checks)
+      outputs = [model.vr_v, model.rp_c, model.tc_q, model.prop_q, model.caus_q, model.rep_q]
+
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        vr_v, rp_c, tc_q, prop_q, caus_q, rep_q = sess.run(outputs, feed_dict=feed_dict)
+        # a head run without the inputs of the other enabled heads fails loudly
+        with self.assertRaises(tf.errors.InvalidArgumentError):
+          sess.run(model.vr_v, feed_dict={model.vr_input: states[0]})
+        self.assertAllClose( model.run_vr_value(sess, states[0][0], np.zeros([self.action_size+1])), vr_v[0] )
+        params = self._params(sess, model)
+
+      fc = [self._fc_reference(params, state) for state in states]
+      norm = lambda x: np.linalg.norm(x, axis=1)
+      self.assertAllClose( vr_v, (fc[0].dot(params["W_base_fc_v"]) + params["b_base_fc_v"])[:, 0], atol=1e-5 )
+      logits = fc[1].dot(params["W_rp_fc1"]) + params["b_rp_fc1"]
+      self.assertAllClose( rp_c, np.exp(logits) / np.sum(np.exp(logits), axis=1, keepdims=True), atol=1e-5 )
+      self.assertAllClose( tc_q, np.linalg.norm(fc[3] - fc[2]), atol=1e-4 )
+      prop = np.square(norm(fc[7] - fc[6]) - norm(fc[5] - fc[4])) * checks[model.prop_actioncheck]
+      self.assertAllClose( prop_q, np.mean(prop), atol=1e-4 )
+      caus = np.exp(-norm(fc[9] - fc[8])) * checks[model.caus_actioncheck] * checks[model.caus_rewardcheck]
+      self.assertAllClose( caus_q, np.mean(caus), atol=1e-4 )
+      rep = np.exp(-norm(fc[12] - fc[10])) * norm((fc[13] - fc[12]) - (fc[11] - fc[10])) * checks[model.rep_actioncheck]
+      self.assertAllClose( rep_q, np.mean(rep), atol=1e-4 )
+
+  def test_aux_trunk_of_enabled_heads(self):
+    """ Check only the inputs of the enabled aux heads go through the trunk """
+    with tf.Graph().as_default():
+      model = FcUnrealModel(self.action_size, self.obs_size, 1, 0.001, "/cpu:0",
+                            use_value_replay=False, use_reward_prediction=True)
+      self.assertFalse( hasattr(model, "vr_input") )
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        rp_c = sess.run(model.rp_c, feed_dict={model.rp_input: np.zeros([3, self.obs_size])})
+        self.assertEqual( rp_c.shape, (3, 3) )
+
+  def test_inference_build(self):
+    """ Check the inference build has no dropout and no aux or loss variables and matches the training build """
+    with tf.Graph().as_default():
+      with tf.test.mock.patch.object(tf.nn, "dropout", lambda x, keep_prob: x):
+        train_net = FcUnrealModel(self.action_size, self.obs_size, "train", 0.001, "/cpu:0",
+                                  use_value_replay=True, use_reward_prediction=True)
+        train_net.prepare_loss()
+      inference_net = FcUnrealModel(self.action_size, self.obs_size, "inference", 0.001, "/cpu:0",
+                                    use_value_replay=True, use_reward_prediction=True,
+                                    inference_only=True)
+      graph = tf.get_default_graph()
+      ops = [op for op in graph.get_operations() if op.name.startswith("net_inference/")]
+      self.assertEqual( [op.name for op in ops if "dropout" in op.name], [] )
+      variable_names = [v.op.name for v in tf.global_variables() if v.op.name.startswith("net_inference/")]
+      for name in variable_names:
+        self.assertTrue( name.split("/")[1].startswith("base_") or name == "net_inference/param_version", name )
+      self.assertEqual( len(inference_net.get_vars()), 6 )
+      sync = inference_net.sync_from(train_net)
+
+      states = self._states()
+      last_action_rewards = self._last_action_rewards()
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        sess.run(sync)
+        train_pi, train_v = sess.run([train_net.base_pi, train_net.base_v],
+                                     feed_dict={train_net.base_input: states})
+        inference_pi, inference_v = sess.run([inference_net.base_inference_pi, inference_net.base_inference_v],
+                                             feed_dict={inference_net.base_input: states})
+      self.assertAllClose( inference_pi, train_pi )
+      self.assertAllClose( inference_v, train_v )
+
+  def test_flat_params(self):
+    """ Check the flat parameter views map to the variables of a regular build """
+    aux = dict(use_value_replay=True, use_reward_prediction=True)
+    with tf.Graph().as_default():
+      reference_net = FcUnrealModel(self.action_size, self.obs_size, "ref", 0.001, "/cpu:0", **aux)
+      flat_net = FcUnrealModel(self.action_size, self.obs_size, "flat", 0.001, "/cpu:0", flat_params=True, **aux)
+      self.assertEqual( [v.op.name for v in flat_net.get_vars()], ["net_flat/flat_base", "net_flat/flat_aux"] )
+
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        params = flat_net.get_flat_params(sess)
+        self.assertEqual( params.shape, (sum(int(np.prod(v.get_shape().as_list()))
+                                             for v in reference_net.get_vars()),) )
+        flat_net.set_flat_params(sess, params)
+        self.assertAllEqual( flat_net.get_flat_params(sess), params )
+
+        # the parameters of the regular build, group by group in creation order
+        reference_values = []
+        for group in ("base", "aux"):
+          for v in reference_net.get_vars():
+            if reference_net._param_group(v.op.name) == group:
+              reference_values.append((v.op.name, sess.run(v)))
+        flat_net.set_flat_params(sess, np.concatenate([value.reshape([-1]) for _, value in reference_values]))
+        for name, value in reference_values:
+          flat_name = "net_flat" + name[name.index("/"):]
+          self.assertAllEqual( sess.run(flat_net._flat_views[flat_name]), value )
+          self.assertEqual( flat_net._flat_owners[flat_name].op.name,
+                            "net_flat/flat_{}".format(flat_net._param_group(flat_name)) )
+        self.assertEqual( len(flat_net._flat_views), len(reference_values) )
+
+        states = self._states()
+        last_action_rewards = self._last_action_rewards()
+        self.assertAllClose( flat_net.run_base_values(sess, states, last_action_rewards),
+                             reference_net.run_base_values(sess, states, last_action_rewards) )
+
+  def test_hogwild_shares_variables(self):
+    """ Check a hogwild network creates no trainable variables and reads the shared ones """
+    with tf.Graph().as_default():
+      plain_net = FcUnrealModel(self.action_size, self.obs_size, -2, 0.001, "/cpu:0")
+      with self.assertRaises(ValueError):
+        FcUnrealModel(self.action_size, self.obs_size, 2, 0.001, "/cpu:0", shared_network=plain_net)
+      global_net = FcUnrealModel(self.action_size, self.obs_size, -1, 0.001, "/cpu:0",
+                                 resource_variables=True)
+      local_net = FcUnrealModel(self.action_size, self.obs_size, 1, 0.001, "/cpu:0",
+                                shared_network=global_net)
+      self.assertEqual( tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope="net_1/"), [] )
+      # one snapshot read per parameter, used by the forward and the backward pass
+      reads = [op for op in tf.get_default_graph().get_operations()
+               if op.type == "ReadVariableOp" and op.name.startswith("net_1/")]
+      self.assertEqual( len(reads), len(local_net.get_vars()) )
+      self.assertTrue( len(local_net.get_vars()) > 0 )
+      for variable in local_net.get_vars():
+        self.assertTrue( variable in global_net.get_vars() )
+      sync = local_net.sync_from(global_net)
+      self.assertEqual( sync.type, "NoOp" )
+
+      states = self._states()
+      last_action_rewards = self._last_action_rewards()
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        self.assertAllClose( local_net.run_base_values(sess, states, last_action_rewards),
+                             global_net.run_base_values(sess, states, last_action_rewards) )
+        # updates of the global variables are seen without a sync
+        sess.run([v.assign(v * 2.) for v in global_net.get_vars()])
+        self.assertAllClose( local_net.run_base_values(sess, states, last_action_rewards),
+                             global_net.run_base_values(sess, states, last_action_rewards) )
+
+
 if __name__ == "__main__":
   tf.test.main()
   
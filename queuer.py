@@ -6,9 +6,11 @@ import sys
 import threading
 import six.moves.queue as queue
 import logging
+from collections import deque
 
 from environment.environment import Environment
 from model.fc_model import UnrealModel
+from environment.maze_environment_tf import MazeRolloutGraph
 
 logger = logging.getLogger('StRADRL.queuer')
 
@@ -25,48 +27,230 @@ class PartialRollout(object):
         self.values = []
         self.r = 0.0
         self.terminal = False
+        # whether the episode ended with each step
+        self.dones = []
         self.features = []
         self.pixel_changes = []
+        # behaviour policy probability of each taken action
+        self.behaviour_probs = []
+        # version of the global parameters the rollout was generated with
+        self.param_version = None
+        # state to bootstrap the value from if the rollout did not terminate
+        self.bootstrap_state = None
+        # environment the rollout was collected from, only rollouts of the
+        # same source are merged into one sequence
+        self.source = None
 
-    def add(self, state, action, reward, value, terminal, features, pixel_change):
+    def add(self, state, action, reward, value, terminal, features, pixel_change, behaviour_prob=1.0):
         self.states += [state]
         self.actions += [action]
         self.rewards += [reward]
         self.values += [value]
         self.terminal = terminal
+        self.dones += [terminal]
         self.features += [features]
         self.pixel_changes += [pixel_change]
+        self.behaviour_probs += [behaviour_prob]
+
+    def get_dones(self):
+        # runners cut episodes at the step limit by setting terminal after add()
+        dones = list(self.dones)
+        if dones:
+            dones[-1] = self.terminal
+        return dones
 
     def extend(self, other):
-        assert not self.terminal
+        # other may start a new episode, the dones mark where this one ended
+        self.dones = self.get_dones()
         self.states.extend(other.states)
         self.actions.extend(other.actions)
         self.rewards.extend(other.rewards)
         self.values.extend(other.values)
+        self.dones.extend(other.dones)
         self.r = other.r
         self.terminal = other.terminal
         self.features.extend(other.features)
         self.pixel_changes.extend(other.pixel_changes)
+        self.behaviour_probs.extend(other.behaviour_probs)
+        self.bootstrap_state = other.bootstrap_state
+        # keep the oldest version to measure the worst policy lag
+        if self.param_version is None or (other.param_version is not None and other.param_version < self.param_version):
+            self.param_version = other.param_version
+
+class RolloutQueue(object):
+    """
+    bounded queue of rollouts between the runner and the learner.
+    Both ends block on condition variables instead of polling, and the learner
+    side can aggregate several rollouts into one batch with get_batch().
+    Every rollout is timestamped on put, so the queue keeps telemetry about
+    dwell time, depth and put/get blocking time (see get_stats()).
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._rollouts = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._reset_stats(time.time())
+
+    def _reset_stats(self, now):
+        self._stats_start = now
+        self._put_count = 0
+        self._get_count = 0
+        self._put_block_time = 0.
+        self._get_block_time = 0.
+        self._dwell_times = []
+        self._depths = []
+
+    def qsize(self):
+        with self._lock:
+            return len(self._rollouts)
+
+    def put(self, rollout, timeout=None):
+        start = time.time()
+        with self._not_full:
+            if not self._wait_for(self._not_full, lambda: len(self._rollouts) < self.maxsize, timeout):
+                self._put_block_time += time.time() - start
+                raise queue.Full
+            now = time.time()
+            self._rollouts.append((now, rollout))
+            self._put_block_time += now - start
+            self._put_count += 1
+            self._depths.append(len(self._rollouts))
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
+        start = time.time()
+        with self._not_empty:
+            if not self._wait_for(self._not_empty, lambda: len(self._rollouts) > 0, timeout):
+                self._get_block_time += time.time() - start
+                raise queue.Empty
+            put_time, rollout = self._rollouts.popleft()
+            now = time.time()
+            self._get_block_time += now - start
+            self._get_count += 1
+            self._dwell_times.append(now - put_time)
+            self._depths.append(len(self._rollouts))
+            self._not_full.notify()
+            return rollout
+
+    def get_stats(self, reset=True):
+        """
+        telemetry since the last reset: rollout time-in-queue, queue depth
+        (sampled at every put/get), put/get rates and the fraction of wall time
+        the producer and consumer spent blocked.
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = max(now - self._stats_start, 1e-6)
+            dwell = self._dwell_times if self._dwell_times else [0.]
+            depths = self._depths if self._depths else [len(self._rollouts)]
+            stats = {"dwell_mean": np.mean(dwell),
+                     "dwell_max": np.max(dwell),
+                     "depth_mean": np.mean(depths),
+                     "depth_max": np.max(depths),
+                     "put_rate": self._put_count / elapsed,
+                     "get_rate": self._get_count / elapsed,
+                     "put_block": self._put_block_time / elapsed,
+                     "get_block": self._get_block_time / elapsed}
+            if reset:
+                self._reset_stats(now)
+        return stats
+
+    def get_batch(self, target_length, max_wait, timeout=None):
+        """
+        block for one rollout, then keep taking queued rollouts until
+        target_length steps are collected or max_wait seconds passed.
+        Every rollout is appended to the earlier one of the same source
+        (environment), episodes that end inside are marked by its dones, so
+        rollouts of different environments are never merged. Returns one
+        rollout per source in the order they were first taken.
+        """
+        rollout = self.get(timeout=timeout)
+        sequences = {rollout.source: rollout}
+        order = [rollout.source]
+        length = len(rollout.rewards)
+        deadline = time.time() + max_wait
+        while length < target_length:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                rollout = self.get(timeout=remaining)
+            except queue.Empty:
+                break
+            length += len(rollout.rewards)
+            if rollout.source in sequences:
+                sequences[rollout.source].extend(rollout)
+            else:
+                sequences[rollout.source] = rollout
+                order.append(rollout.source)
+        return [sequences[source] for source in order]
+
+    def _wait_for(self, condition, predicate, timeout):
+        # same as Condition.wait_for (not available in python 2)
+        if timeout is not None:
+            endtime = time.time() + timeout
+        while not predicate():
+            if timeout is None:
+                condition.wait()
+            else:
+                remaining = endtime - time.time()
+                if remaining <= 0:
+                    return False
+                condition.wait(remaining)
+        return True
 
 class RunnerThread(threading.Thread):
-    def __init__(self, flags, env, global_net, action_size, obs_size, device, visualise):
+    def __init__(self, flags, env, global_net, action_size, obs_size, device, visualise,
+                 runner_index=0, rollout_queue=None, inference_server=None):
         threading.Thread.__init__(self)
-        self.queue = queue.Queue(flags.queue_length)        
+        # several runners share one rollout queue
+        if rollout_queue is None:
+            rollout_queue = RolloutQueue(flags.queue_length)
+        self.queue = rollout_queue
+        self.runner_index = runner_index
         self.num_local_steps = flags.local_t_max
         self.env = env
         self.last_features = None
-        self.policy = UnrealModel(action_size,
-                                  obs_size,
-                                  0,
-                                  flags.entropy_beta,
-                                  device)
+        self.inference_server = inference_server
         self.sess = None
         self.visualise = visualise
-        self.sync = self.policy.sync_from(global_net, name="env_runner")
+        if inference_server is not None:
+            # the server evaluates the policy for all runners in batches
+            self.policy = inference_server
+            self.sync = inference_server.sync
+        else:
+            thread_index = 0 if runner_index == 0 else "0_{}".format(runner_index)
+            self.policy = UnrealModel(action_size,
+                                      obs_size,
+                                      thread_index,
+                                      flags.entropy_beta,
+                                      device,
+                                      inference_only=True,
+                                      flat_params=global_net.flat_params,
+                                      shared_network=global_net if flags.hogwild else None)
+            self.sync = self.policy.sync_from(global_net, name="env_runner_{}".format(runner_index))
         self.global_net = global_net
         self.env_max_steps = flags.env_max_steps
         self.action_freq = flags.action_freq
         self.env_runner_sync = flags.env_runner_sync
+        self.action_size = action_size
+        # env is a list of EnvGroups (or vectorized envs) stepped in a pipeline
+        self.pipelined = isinstance(env, list)
+        # epsilon=None samples the action from the policy distribution
+        if flags.action_sampling == "boltzmann":
+            self.epsilon = None
+        else:
+            self.epsilon = flags.action_epsilon
+        # the in-graph maze is rolled out together with the runner's own policy
+        self.rollout_graph = None
+        if flags.env_type == 'tf_maze':
+            self.rollout_graph = MazeRolloutGraph(self.policy, flags.envs_per_group, self.num_local_steps,
+                                                  device, self.epsilon, size=flags.maze_size,
+                                                  wall_density=flags.maze_wall_density,
+                                                  seed=None if flags.maze_seed < 0 else flags.maze_seed,
+                                                  name="tf_maze_{}".format(runner_index))
     
     def start_runner(self, sess):
         logger.debug("starting runner")
@@ -79,32 +263,31 @@ class RunnerThread(threading.Thread):
     
     def _run(self):
         
-        rollout_provider = env_runner(self.env, self.sess, self.policy, self.num_local_steps, self.env_max_steps,\
-            self.action_freq, self.env_runner_sync, self.sync, self.global_net, self.visualise)
+        if self.rollout_graph is not None:
+            rollout_provider = tf_maze_env_runner(self.sess, self.rollout_graph, self.sync, self.global_net)
+        elif self.pipelined:
+            rollout_provider = pipelined_env_runner(self.env, self.sess, self.policy, self.num_local_steps,\
+                self.env_max_steps, self.sync, self.global_net, self.action_size, self.epsilon)
+        else:
+            rollout_provider = env_runner(self.env, self.sess, self.policy, self.num_local_steps, self.env_max_steps,\
+                self.action_freq, self.env_runner_sync, self.sync, self.global_net, self.visualise,\
+                self.action_size, self.epsilon)
             
         while True:
-            self.queue.put(next(rollout_provider), timeout=600.0)
+            rollout = next(rollout_provider)
+            # runners share the queue, the source is unique across all of them
+            rollout.source = (self.runner_index, rollout.source)
+            self.queue.put(rollout, timeout=600.0)
             #logger.debug("added rollout. Approx queue length:{}".format(self.queue.qsize()))
             
-def boltzmann(pi_values):
-    # take action with chance equal to distribution
-    return np.random.choice(range(len(pi_values)), p=pi_values)
-    
-    
-#@TODO implement
-def eps_greedy(pi_values, epsilon=0.1):
-    if np.random.random() < epsilon:
-        return np.random.choice(range(len(pi_values)))
-    else:
-        return np.argmax(pi_values)
-        
 def onehot(action, action_size, dtype="float32"):
     action_oh = np.zeros([action_size], dtype=dtype)
     action_oh[action] = 1.
     return action_oh
     
         
-def env_runner(env, sess, policy, num_local_steps, env_max_steps, action_freq, env_runner_sync, syncfunc, global_net, render):
+def env_runner(env, sess, policy, num_local_steps, env_max_steps, action_freq, env_runner_sync, syncfunc, global_net, render,
+               action_size, epsilon):
     """
     The logic of the thread runner.  In brief, it constantly keeps on running
     the policy, and as long as the rollout exceeds a certain length, the thread
@@ -112,7 +295,6 @@ def env_runner(env, sess, policy, num_local_steps, env_max_steps, action_freq, e
     """
     logger.debug("resetting env in session {}".format(sess))
     last_state, last_action_reward = env.reset()
-    sess.run(syncfunc)
     last_features = policy.get_initial_features()
     length = 0
     rewards = 0
@@ -120,22 +302,17 @@ def env_runner(env, sess, policy, num_local_steps, env_max_steps, action_freq, e
     
     while True:
         itercount += 1
-        sess.run(syncfunc)
+        _, param_version = sess.run([syncfunc, global_net.param_version])
         terminal_end = False
         rollout = PartialRollout()
+        rollout.param_version = param_version
         for _ in range(num_local_steps):
-            fetched = policy.run_base_policy_and_value(sess, last_state, last_action_reward)
-            pi, value_, features = fetched[0], fetched[1], fetched[2:]
+            # action is sampled in-graph (eps-greedy or boltzmann), only index and value are fetched
+            fetched = policy.run_base_action_and_value(sess, last_state, last_action_reward, epsilon)
+            chosenaction, value_, behaviour_prob, features = fetched[0], fetched[1], fetched[2], fetched[3:]
             
-            # give all actions, rescaled from 0.0/1.0 range to -0.4/0.4 range
-            #logger.debug("pi:{}".format(pi))
-            #logger.debug("action:{}".format(action))
-            
-            #@TODO decide if argmax or probability, if latter fix experience replay selection
-            #chosenaction = boltzmann(pi)
-            chosenaction = eps_greedy(pi, epsilon=0.05)
-            #chosenaction = np.argmax(pi)
-            action = onehot(chosenaction, len(pi), dtype="int32")
+            #logger.debug("action:{}".format(chosenaction))
+            action = onehot(chosenaction, action_size, dtype="int32")
             
             state, reward, terminal, pixel_change = env.process(action)
             if action_freq > 0.:
@@ -144,7 +321,7 @@ def env_runner(env, sess, policy, num_local_steps, env_max_steps, action_freq, e
                 env.render()
 
             # collect the experience
-            rollout.add(last_state, action, reward, value_, terminal, last_features, pixel_change)
+            rollout.add(last_state, action, reward, value_, terminal, last_features, pixel_change, behaviour_prob)
             length += 1
             rewards += reward
             
@@ -172,9 +349,106 @@ def env_runner(env, sess, policy, num_local_steps, env_max_steps, action_freq, e
                 
         if not terminal_end:
             rollout.r = policy.run_base_value(sess, last_state, last_action_reward)
+            rollout.bootstrap_state = last_state
         # once we have enough experience, yield it, and have the ThreadRunner place it on a queue
         yield rollout
-        
-       
+
+
+def pipelined_env_runner(groups, sess, policy, num_local_steps, env_max_steps, syncfunc, global_net, action_size, epsilon):
+    """
+    Runner logic for several environment groups kept in flight.
+    The actions of a group are sent with step_async() right after its inference,
+    so the policy for group A is evaluated while group B steps its emulators.
+    A rollout is yielded whenever one environment finished its episode or
+    collected num_local_steps steps; in the latter case the value of the next
+    inference for that environment is used for bootstrapping.
+    """
+    _, param_version = sess.run([syncfunc, global_net.param_version])
+    last_states = []
+    last_action_rewards = []
+    lengths = []
+    rollouts = []
+    pending = []
+    for g, group in enumerate(groups):
+        states, action_rewards = group.reset()
+        last_states.append(list(states))
+        last_action_rewards.append(list(action_rewards))
+        lengths.append([0] * len(group))
+        rollouts.append([_new_rollout(param_version, (g, i)) for i in range(len(group))])
+    
+    def act(g):
+        # batched inference for one group, then send its actions without waiting
+        actions, values, probs = policy.run_base_actions_and_values(sess, last_states[g],
+                                                                    last_action_rewards[g], epsilon)
+        actions = [onehot(a, action_size, dtype="int32") for a in actions]
+        groups[g].step_async(actions)
+        return actions, values, probs
+    
+    for g in range(len(groups)):
+        pending.append(act(g))
     
+    while True:
+        _, param_version = sess.run([syncfunc, global_net.param_version])
+        for g, group in enumerate(groups):
+            actions, values, probs = pending[g]
+            states, rewards, terminals, pixel_changes = group.step_wait()
+            finished = []
+            for i in range(len(group)):
+                rollout = rollouts[g][i]
+                rollout.add(last_states[g][i], actions[i], rewards[i], values[i], terminals[i], [],
+                            pixel_changes[i], probs[i])
+                lengths[g][i] += 1
+                if terminals[i] or lengths[g][i] >= env_max_steps:
+                    rollout.terminal = True
+                    last_states[g][i], last_action_rewards[g][i] = group.reset_env(i)
+                    lengths[g][i] = 0
+                    finished.append(rollout)
+                    rollouts[g][i] = _new_rollout(param_version, (g, i))
+                else:
+                    last_states[g][i] = states[i]
+                    last_action_rewards[g][i] = np.append(actions[i], rewards[i])
+            
+            pending[g] = act(g)
+            
+            # full rollouts bootstrap from the values of the inference above
+            _, next_values, _ = pending[g]
+            for i in range(len(group)):
+                rollout = rollouts[g][i]
+                if len(rollout.rewards) >= num_local_steps:
+                    rollout.r = next_values[i]
+                    rollout.bootstrap_state = last_states[g][i]
+                    finished.append(rollout)
+                    rollouts[g][i] = _new_rollout(param_version, (g, i))
+            for rollout in finished:
+                yield rollout
+
+def tf_maze_env_runner(sess, rollout_graph, syncfunc, global_net):
+    """
+    Runner logic for the in-graph maze. One sess.run produces num_local_steps
+    steps of all mazes; they are split into one rollout per maze and episode.
+    """
+    while True:
+        _, param_version = sess.run([syncfunc, global_net.param_version])
+        states, actions, rewards, values, terminals, probs, final_states, bootstrap_values = \
+            rollout_graph.run_rollout(sess)
+        num_steps, num_mazes = rewards.shape
+        for i in range(num_mazes):
+            rollout = _new_rollout(param_version, i)
+            for t in range(num_steps):
+                rollout.add(states[t, i], actions[t, i], rewards[t, i], values[t, i], terminals[t, i], [],
+                            [], probs[t, i])
+                if terminals[t, i]:
+                    rollout.terminal = True
+                    yield rollout
+                    rollout = _new_rollout(param_version, i)
+            if len(rollout.rewards) > 0:
+                rollout.r = bootstrap_values[i]
+                rollout.bootstrap_state = final_states[i]
+                yield rollout
+
+def _new_rollout(param_version, source=None):
+    rollout = PartialRollout()
+    rollout.param_version = param_version
+    rollout.source = source
+    return rollout
 
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from queuer import PartialRollout, RolloutQueue
+
+
+def _rollout(source, rewards, terminal=False):
+  rollout = PartialRollout()
+  for reward in rewards:
+    rollout.add(0, 0, reward, 0., False, [], [])
+  rollout.terminal = terminal
+  rollout.source = source
+  return rollout
+
+
+class TestRolloutQueue(unittest.TestCase):
+  def test_interleaved_sources_are_not_merged(self):
+    # two runners with one environment each put their rollouts in turn
+    rollout_queue = RolloutQueue(10)
+    for k in range(3):
+      rollout_queue.put(_rollout((0, None), [k, k]))
+      rollout_queue.put(_rollout((1, None), [10 + k, 10 + k]))
+    sequences = rollout_queue.get_batch(12, 0.1)
+    self.assertEqual( [sequence.source for sequence in sequences], [(0, None), (1, None)] )
+    self.assertEqual( sequences[0].rewards, [0, 0, 1, 1, 2, 2] )
+    self.assertEqual( sequences[1].rewards, [10, 10, 11, 11, 12, 12] )
+
+  def test_episode_ends_inside_sequence(self):
+    rollout_queue = RolloutQueue(10)
+    rollout_queue.put(_rollout((0, (0, 1)), [1], terminal=True))
+    rollout_queue.put(_rollout((0, (0, 0)), [2]))
+    rollout_queue.put(_rollout((0, (0, 1)), [3]))
+    rollout_queue.put(_rollout((0, (0, 0)), [4], terminal=True))
+    rollout_queue.put(_rollout((0, (0, 1)), [5]))
+    sequences = rollout_queue.get_batch(5, 0.1)
+    self.assertEqual( [sequence.rewards for sequence in sequences], [[1, 3, 5], [2, 4]] )
+    self.assertEqual( [sequence.get_dones() for sequence in sequences], [[True, False, False], [False, True]] )
+    self.assertEqual( [sequence.terminal for sequence in sequences], [False, True] )
+
+  def test_get_batch_stops_at_target_length(self):
+    rollout_queue = RolloutQueue(10)
+    for k in range(4):
+      rollout_queue.put(_rollout((0, None), [k, k]))
+    sequences = rollout_queue.get_batch(4, 0.1)
+    self.assertEqual( len(sequences), 1 )
+    self.assertEqual( sequences[0].rewards, [0, 0, 1, 1] )
+    self.assertEqual( rollout_queue.qsize(), 2 )
+
+
+if __name__ == '__main__':
+  unittest.main()
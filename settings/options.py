@@ -16,9 +16,18 @@ def get_options(option_type):
 
     
   # Common
-  tf.app.flags.DEFINE_string("env_type", "gym", "environment type (lab or gym or maze)")
-  tf.app.flags.DEFINE_string("env_name", "Pong-ram-v4",  "environment name (for lab)")
+  tf.app.flags.DEFINE_string("env_type", "gym", "environment type (lab or gym or maze or maze_batch or tf_maze or synthetic or replay)")
+  tf.app.flags.DEFINE_string("env_name", "Pong-ram-v4",  "environment name (for lab, recording path for replay)")
   tf.app.flags.DEFINE_integer("env_max_steps", 400000, "max number of steps in environment")
+  tf.app.flags.DEFINE_integer("maze_size", 7, "width and height of the generated maze (maze env types)")
+  tf.app.flags.DEFINE_float("maze_wall_density", 0., "probability of a maze cell being a wall")
+  tf.app.flags.DEFINE_integer("maze_goals", 1, "number of goals in the maze")
+  tf.app.flags.DEFINE_integer("maze_seed", -1, "seed of the maze layout and goals (-1 = random)")
+  tf.app.flags.DEFINE_integer("synthetic_obs_size", 64, "observation size of the synthetic benchmark env")
+  tf.app.flags.DEFINE_integer("synthetic_action_size", 4, "number of actions of the synthetic benchmark env")
+  tf.app.flags.DEFINE_integer("synthetic_episode_length", 100, "episode length of the synthetic benchmark env")
+  tf.app.flags.DEFINE_float("synthetic_reward_prob", 0.1, "probability of a reward of 1 per synthetic env step")
+  tf.app.flags.DEFINE_float("synthetic_step_cost", 0., "seconds of busy-waiting per synthetic env step")
   
   tf.app.flags.DEFINE_boolean("use_base", False, "whether to use base A3C for aux network")
   tf.app.flags.DEFINE_boolean("use_pixel_change", False, "whether to use pixel change")
@@ -44,6 +53,11 @@ def get_options(option_type):
     tf.app.flags.DEFINE_float("entropy_beta", 0.001, "entropy regurarlization constant")
     tf.app.flags.DEFINE_float("value_lambda", 0.001, "value ratio for base loss")
     tf.app.flags.DEFINE_float("base_lambda", 0.9, "generalized adv. est. lamba for short-long sight")
+    tf.app.flags.DEFINE_boolean("use_vtrace", False, "whether to correct stale rollouts with v-trace instead of GAE")
+    tf.app.flags.DEFINE_float("vtrace_clip_rho", 1.0, "v-trace importance weight clipping for the targets and advantages")
+    tf.app.flags.DEFINE_float("vtrace_clip_c", 1.0, "v-trace importance weight clipping for the trace")
+    tf.app.flags.DEFINE_boolean("flat_params", False, "whether each network keeps its parameters in one flat variable per group (single assign syncs)")
+    tf.app.flags.DEFINE_boolean("hogwild", False, "whether trainers and runners read and update the global variables directly instead of synced local copies")
     
     
     # auxiliary
@@ -62,8 +76,30 @@ def get_options(option_type):
     # queuer
     tf.app.flags.DEFINE_integer("local_t_max", 20, "repeat step size")
     tf.app.flags.DEFINE_integer("queue_length", 5, "max number of batches (of length local_t_max) in queue")
+    tf.app.flags.DEFINE_integer("rollout_batch_length", 100, "target number of steps the learner merges from queued rollouts")
+    tf.app.flags.DEFINE_float("rollout_batch_max_wait", 0.05, "max seconds the learner waits for more rollouts to fill a batch")
     tf.app.flags.DEFINE_integer("env_runner_sync", 1, "number of env episodes before sync to global")
     tf.app.flags.DEFINE_float("action_freq", 0,  "number of actions per second in env")
+    tf.app.flags.DEFINE_integer("action_repeat", 0, "emulator steps per action inside the env worker, rewards are summed (0 = backend default: 4 for lab, 1 otherwise)")
+    tf.app.flags.DEFINE_boolean("max_pool_frames", False, "whether the env worker max-pools the last two frames of a repeated action")
+    tf.app.flags.DEFINE_boolean("env_auto_reset", False, "whether env workers reset on terminal and send the next first frame with the terminal step")
+    tf.app.flags.DEFINE_boolean("standby_env", False, "whether each env keeps a pre-reset spare instance that is swapped in at episode end")
+    tf.app.flags.DEFINE_float("env_step_timeout", 60.0, "seconds before a hung gym worker is restarted (0 = only restart dead workers)")
+    tf.app.flags.DEFINE_float("env_reset_timeout", 300.0, "seconds a gym worker may take to start or reset before it is restarted (0 = no limit)")
+    tf.app.flags.DEFINE_boolean("env_timing", False, "whether env workers time each command and report latency histograms")
+    tf.app.flags.DEFINE_string("obs_preprocessing", "", "worker side preprocessing spec, e.g. \"resize:84:84,cast:float32:0.00392156,clip_reward:1\" (empty = backend default)")
+    tf.app.flags.DEFINE_string("env_record", "", "path prefix of npz recordings of the env streams (empty = no recording)")
+    tf.app.flags.DEFINE_integer("env_record_frames", 1000000, "max number of frames recorded per env")
+    tf.app.flags.DEFINE_string("action_sampling", "eps_greedy", "in-graph action sampling of the runner (eps_greedy or boltzmann)")
+    tf.app.flags.DEFINE_float("action_epsilon", 0.05, "exploration rate for eps_greedy action sampling")
+    tf.app.flags.DEFINE_integer("env_groups", 1, "number of environment groups kept in flight by the runner (>1 pipelines env steps with inference)")
+    tf.app.flags.DEFINE_integer("envs_per_group", 1, "number of environments per pipelined group")
+    tf.app.flags.DEFINE_integer("gym_vec_workers", 0, "worker processes of the vectorized gym backend per group (0 = one process per env)")
+    tf.app.flags.DEFINE_integer("gym_vec_envs_per_worker", 1, "gym environments hosted by each vectorized worker process")
+    tf.app.flags.DEFINE_integer("num_runners", 1, "number of runner threads filling the rollout queue")
+    tf.app.flags.DEFINE_boolean("use_inference_server", False, "whether runners share one batching inference server")
+    tf.app.flags.DEFINE_integer("inference_batch_size", 16, "number of requests the inference server waits for before running a batch")
+    tf.app.flags.DEFINE_float("inference_max_latency", 0.005, "max seconds a request waits for the inference batch to fill")
     
 
   # For display
@@ -8,9 +8,17 @@ import tensorflow as tf
 import numpy as np
 from tensorflow.python.training import training_ops
 from tensorflow.python.training import slot_creator
+from tensorflow.python.ops import resource_variable_ops
 
 logger = logging.getLogger("StRADRL.adam_applier")
 
+def _gradient_target(var):
+    # the gradient of a resource variable is taken at its handle, it
+    # collects the gradients of all reads of the variable
+    if isinstance(var, resource_variable_ops.ResourceVariable):
+        return var.handle
+    return var._ref()
+
 class AdamApplier(object):
 
     def __init__(self,
@@ -32,7 +40,7 @@ class AdamApplier(object):
         """
         with tf.device(self._device):
             logger.debug("appling grads")
-            var_refs = [v._ref() for v in local_var_list]
+            var_refs = [_gradient_target(v) for v in local_var_list]
             local_gradients = tf.gradients(loss, var_refs,
                                 gate_gradients=False,
                                 aggregation_method=None,
@@ -5,7 +5,6 @@ from __future__ import print_function
 
 import tensorflow as tf
 import numpy as np
-import scipy.signal
 import random
 import time
 import sys
@@ -16,6 +15,7 @@ from collections import namedtuple
 from environment.environment import Environment
 from model.fc_model import UnrealModel
 from train.experience import Experience, ExperienceFrame
+from train.returns import discounted_returns, returns_and_advantages
 
 logger = logging.getLogger("StRADRL.aux_trainer")
 
@@ -56,7 +56,8 @@ class AuxTrainer(object):
                 gamma_pc,
                 experience,
                 max_global_time_step,
-                device):
+                device,
+                hogwild=False):
                 
                 
         self.use_pixel_change = use_pixel_change   
@@ -101,16 +102,19 @@ class AuxTrainer(object):
                                          causality_lambda=causality_lambda,
                                          repeatability_lambda=repeatability_lambda,
                                          for_display=False,
-                                         use_base=use_base)
+                                         use_base=use_base,
+                                         flat_params=global_network.flat_params,
+                                         shared_network=global_network if hogwild else None)
                                          
         self.local_network.prepare_loss()
         self.global_network = global_network
         
         #logger.debug("ln.total_loss:{}".format(self.local_network.total_loss))
         
-        self.apply_gradients = grad_applier.minimize_local(self.local_network.total_loss,
-                                                           self.global_network.get_vars(),
-                                                           self.local_network.get_vars())
+        apply_gradients, grad_norm = grad_applier.minimize_local(self.local_network.total_loss,
+                                                                 self.global_network.get_vars(),
+                                                                 self.local_network.get_vars())
+        self.apply_gradients = [self.global_network.count_update(apply_gradients), grad_norm]
         self.sync = self.local_network.sync_from(self.global_network, name="aux_trainer_{}".format(self.thread_index))
         self.initial_learning_rate = initial_learning_rate
         self.episode_reward = 0
@@ -143,9 +147,6 @@ class AuxTrainer(object):
             learning_rate = 0.0
         return learning_rate
         
-    def discount(self, x, gamma):
-        return scipy.signal.lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
-        
     def _process_base(self, sess, policy, gamma, lambda_=1.0):
         # base A3C from experience replay
         experience_frames = self.experience.sample_sequence(self.local_t_max+1)
@@ -153,14 +154,13 @@ class AuxTrainer(object):
         batch_a = []
         rewards = []
         action_reward = []
-        batch_features = []
-        values = []
-        last_state = experience_frames[0].state
-        last_action_reward = experience_frames[0].concat_action_and_reward(experience_frames[0].action,
-                                                                        self.action_size,
-                                                                        experience_frames[0].reward)
         policy.set_state(np.asarray(experience_frames[0].features).reshape([2,1,-1]))
-            
+        
+        # states the values are evaluated on (each frame's predecessor, the last one for bootstrapping)
+        value_states = [experience_frames[0].state]
+        value_action_rewards = [experience_frames[0].concat_action_and_reward(experience_frames[0].action,
+                                                                              self.action_size,
+                                                                              experience_frames[0].reward)]
         
         for frame in range(1,len(experience_frames)):
             state = experience_frames[frame].state
@@ -172,96 +172,72 @@ class AuxTrainer(object):
             action_reward.append(a_r)
             batch_a.append(a_r[:-1])
             rewards.append(reward)
-            _, value, features = policy.run_base_policy_and_value(sess, last_state, last_action_reward)
-            batch_features.append(features)
-            values.append(value)
-            last_state = state
-            last_action_reward = action_reward[-1]
+            value_states.append(state)
+            value_action_rewards.append(a_r)
 
+        # all values in one run
+        values = policy.run_base_values(sess, value_states, value_action_rewards)
         if not experience_frames[-1].terminal:
-           r = policy.run_base_value(sess, last_state, last_action_reward)
+           r = values[-1]
         else:
            r = 0.
                 
-        vpred_t = np.asarray(values + [r])
-        rewards_plus_v = np.asarray(rewards + [r])
-        batch_r = self.discount(rewards_plus_v, gamma)[:-1]
-        delta_t = rewards + gamma * vpred_t[1:] - vpred_t[:-1]
         # this formula for the advantage comes "Generalized Advantage Estimation":
         # https://arxiv.org/abs/1506.02438
-        batch_adv = self.discount(delta_t, gamma * lambda_)
-
+        # the replayed sequence ends at the first terminal frame, dones mark it
+        dones = [frame.terminal for frame in experience_frames[1:]]
+        batch_r, batch_adv = returns_and_advantages([rewards], [values[:-1]], r, gamma, lambda_, [dones])
         
         start_features = []#batch_features[0]
 
-        return Batch(batch_si, batch_a, action_reward, batch_adv, batch_r, experience_frames[-1].terminal, start_features)
+        return Batch(batch_si, batch_a, action_reward, batch_adv[0], batch_r[0], experience_frames[-1].terminal, start_features)
         
     def _process_pc(self, sess):
         # [pixel change]
         # Sample 20+1 frame (+1 for last next state)
         pc_experience_frames = self.experience.sample_sequence(self.local_t_max+1)
-        # Revese sequence to calculate from the last
-        pc_experience_frames.reverse()
 
-        batch_pc_si = []
-        batch_pc_a = []
-        batch_pc_R = []
-        batch_pc_last_action_reward = []
-        
         pc_R = np.zeros([20,20], dtype=np.float32)
-        if not pc_experience_frames[0].terminal:
+        if not pc_experience_frames[-1].terminal:
             pc_R = self.local_network.run_pc_q_max(sess,
-                                                 pc_experience_frames[0].state,
-                                                 pc_experience_frames[0].get_last_action_reward(self.action_size))
+                                                 pc_experience_frames[-1].state,
+                                                 pc_experience_frames[-1].get_last_action_reward(self.action_size))
 
-        for frame in pc_experience_frames[1:]:
-            pc_R = frame.pixel_change + self.gamma_pc * pc_R
+        batch_pc_si = []
+        batch_pc_a = []
+        batch_pc_last_action_reward = []
+        pixel_changes = []
+        for frame in pc_experience_frames[:-1]:
             a = np.zeros([self.action_size])
             a[frame.action] = 1.0
-            last_action_reward = frame.get_last_action_reward(self.action_size)
-              
             batch_pc_si.append(frame.state)
             batch_pc_a.append(a)
-            batch_pc_R.append(pc_R)
-            batch_pc_last_action_reward.append(last_action_reward)
+            batch_pc_last_action_reward.append(frame.get_last_action_reward(self.action_size))
+            pixel_changes.append(frame.pixel_change)
 
-        batch_pc_si.reverse()
-        batch_pc_a.reverse()
-        batch_pc_R.reverse()
-        batch_pc_last_action_reward.reverse()
+        dones = [frame.terminal for frame in pc_experience_frames[:-1]]
+        batch_pc_R = discounted_returns([pixel_changes], [pc_R], self.gamma_pc, [dones])[0]
         
-        return batch_pc_si, batch_pc_last_action_reward, batch_pc_a, batch_pc_R
+        return batch_pc_si, batch_pc_last_action_reward, batch_pc_a, list(batch_pc_R)
         
     def _process_vr(self, sess):
         # [Value replay]
         # Sample 20+1 frame (+1 for last next state)
         vr_experience_frames = self.experience.sample_sequence(self.local_t_max+1)
-        # Revese sequence to calculate from the last
-        vr_experience_frames.reverse()
-
-        batch_vr_si = []
-        batch_vr_R = []
-        batch_vr_last_action_reward = []
 
         vr_R = 0.0
-        if not vr_experience_frames[0].terminal:
+        if not vr_experience_frames[-1].terminal:
             vr_R = self.local_network.run_vr_value(sess,
-                                                 vr_experience_frames[0].state,
-                                                 vr_experience_frames[0].get_last_action_reward(self.action_size))
+                                                 vr_experience_frames[-1].state,
+                                                 vr_experience_frames[-1].get_last_action_reward(self.action_size))
         
-        # t_max times loop
-        for frame in vr_experience_frames[1:]:
-            vr_R = frame.reward + self.gamma * vr_R
-            batch_vr_si.append(frame.state)
-            batch_vr_R.append(vr_R)
-            last_action_reward = frame.get_last_action_reward(self.action_size)
-            batch_vr_last_action_reward.append(last_action_reward)
-
-        batch_vr_si.reverse()
-        batch_vr_R.reverse()
-        batch_vr_last_action_reward.reverse()
+        batch_vr_si = [frame.state for frame in vr_experience_frames[:-1]]
+        batch_vr_last_action_reward = [frame.get_last_action_reward(self.action_size) for frame in vr_experience_frames[:-1]]
+        rewards = [frame.reward for frame in vr_experience_frames[:-1]]
+        dones = [frame.terminal for frame in vr_experience_frames[:-1]]
+        batch_vr_R = discounted_returns([rewards], [vr_R], self.gamma, [dones])[0]
 
-        return batch_vr_si, batch_vr_last_action_reward, batch_vr_R
+        return batch_vr_si, batch_vr_last_action_reward, list(batch_vr_R)
         
     def _process_rp(self):
         # [Reward prediction]
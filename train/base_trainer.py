@@ -5,7 +5,6 @@ from __future__ import print_function
 
 import tensorflow as tf
 import numpy as np
-import scipy.signal
 import random
 import time
 import sys
@@ -14,8 +13,11 @@ import six.moves.queue as queue
 from collections import namedtuple
 
 from environment.environment import Environment
+from environment import worker_timing
 from model.fc_model import UnrealModel
 from train.experience import Experience, ExperienceFrame
+from train.returns import returns_and_advantages, vtrace_returns_and_advantages
+from helper import add_scalar_summaries, add_histogram_summary
 
 logger = logging.getLogger("StRADRL.base_trainer")
 
@@ -24,29 +26,70 @@ PERFORMANCE_LOG_INTERVAL = 10000
 
 Batch = namedtuple("Batch", ["si", "a", "a_r", "adv", "r", "terminal", "features", "pc"])
 
-def process_rollout(rollout, gamma, lambda_=1.0):
+def _stack(sequences):
     """
-    given a rollout, compute its returns and the advantage
+    [B, T] array of per step values, zero padded after shorter sequences,
+    and the mask of the valid steps
     """
-    batch_si = np.asarray(rollout.states)
-    batch_a = np.asarray(rollout.actions)
-    rewards = np.asarray(rollout.rewards)
+    length = max(len(sequence) for sequence in sequences)
+    stacked = np.zeros([len(sequences), length], dtype=np.float32)
+    mask = np.zeros([len(sequences), length], dtype=np.float32)
+    for b, sequence in enumerate(sequences):
+        stacked[b, :len(sequence)] = sequence
+        mask[b, :len(sequence)] = 1.
+    return stacked, mask
+
+def _batch(rollouts, batch_adv, batch_r, dones):
+    # concatenate the steps of all rollouts in the order of the valid entries of the [B, T] arrays
+    batch_si = np.concatenate([np.asarray(rollout.states) for rollout in rollouts])
+    batch_a = np.concatenate([np.asarray(rollout.actions) for rollout in rollouts])
+    rewards = np.concatenate([np.asarray(rollout.rewards) for rollout in rollouts])
     action_reward = np.concatenate((batch_a,rewards[:,np.newaxis]), axis=1)
-    vpred_t = np.asarray(rollout.values + [rollout.r])
+    features = []
+    for rollout in rollouts:
+        features.extend(rollout.features)
+    batch_pc = np.concatenate([np.asarray(rollout.pixel_changes) for rollout in rollouts])
+    return Batch(batch_si, batch_a, action_reward, batch_adv, batch_r, dones, features, batch_pc)
+
+def _bootstrap_value(rollout):
+    # run_base_value returns the value as a [1] array
+    return 0. if rollout.terminal else float(np.reshape(rollout.r, [-1])[0])
+
+def process_rollouts(rollouts, gamma, lambda_=1.0):
+    """
+    given the rollouts of a training batch, compute their returns and the
+    advantages in one batched pass. Episodes that end inside a merged rollout
+    are not bootstrapped over (dones).
+    """
+    rewards, mask = _stack([rollout.rewards for rollout in rollouts])
+    values, _ = _stack([rollout.values for rollout in rollouts])
+    dones, _ = _stack([rollout.get_dones() for rollout in rollouts])
+    bootstrap_values = np.array([_bootstrap_value(rollout) for rollout in rollouts])
 
-    rewards_plus_v = np.asarray(rollout.rewards + [rollout.r])
-    batch_r = discount(rewards_plus_v, gamma)[:-1]
-    delta_t = rewards + gamma * vpred_t[1:] - vpred_t[:-1]
     # this formula for the advantage comes "Generalized Advantage Estimation":
     # https://arxiv.org/abs/1506.02438
-    batch_adv = discount(delta_t, gamma * lambda_)
+    batch_r, batch_adv = returns_and_advantages(rewards, values, bootstrap_values, gamma, lambda_, dones, mask)
 
-    features = rollout.features
-    batch_pc = np.asarray(rollout.pixel_changes)
-    return Batch(batch_si, batch_a, action_reward, batch_adv, batch_r, rollout.terminal, features, batch_pc)
+    valid = mask > 0
+    return _batch(rollouts, batch_adv[valid], batch_r[valid], dones[valid] > 0)
 
-def discount(x, gamma):
-    return scipy.signal.lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
+def process_rollouts_vtrace(rollouts, target_probs, values, bootstrap_values, gamma, clip_rho=1.0, clip_c=1.0):
+    """
+    given the rollouts of a training batch and the current policy's
+    probabilities of the taken actions and values of their states, compute
+    the V-trace targets and the importance weighted advantages in one batched
+    pass ("IMPALA": https://arxiv.org/abs/1802.01561)
+    """
+    rewards, mask = _stack([rollout.rewards for rollout in rollouts])
+    values, _ = _stack(values)
+    dones, _ = _stack([rollout.get_dones() for rollout in rollouts])
+    rhos, _ = _stack([np.asarray(probs) / np.asarray(rollout.behaviour_probs)
+                      for probs, rollout in zip(target_probs, rollouts)])
+    batch_r, batch_adv = vtrace_returns_and_advantages(rewards, values, np.asarray(bootstrap_values), rhos,
+                                                       gamma, clip_rho, clip_c, dones, mask)
+
+    valid = mask > 0
+    return _batch(rollouts, batch_adv[valid], batch_r[valid], dones[valid] > 0)
 
 class BaseTrainer(object):
     def __init__(self,
@@ -62,8 +105,19 @@ class BaseTrainer(object):
                experience,
                max_global_time_step,
                device,
-               value_lambda):
+               value_lambda,
+               rollout_batch_length=100,
+               rollout_batch_max_wait=0.05,
+               use_vtrace=False,
+               vtrace_clip_rho=1.0,
+               vtrace_clip_c=1.0,
+               hogwild=False):
         self.runner = runner
+        self.use_vtrace = use_vtrace
+        self.vtrace_clip_rho = vtrace_clip_rho
+        self.vtrace_clip_c = vtrace_clip_c
+        self.rollout_batch_length = rollout_batch_length
+        self.rollout_batch_max_wait = rollout_batch_max_wait
         self.learning_rate_input = learning_rate_input
         self.env_type = env_type
         self.env_name = env_name
@@ -77,29 +131,36 @@ class BaseTrainer(object):
                                          1,
                                          entropy_beta,
                                          device,
-                                         value_lambda=value_lambda)
+                                         value_lambda=value_lambda,
+                                         flat_params=global_network.flat_params,
+                                         shared_network=global_network if hogwild else None)
 
         self.local_network.prepare_loss()
         
-        self.apply_gradients = grad_applier.minimize_local(self.local_network.total_loss,
-                                                                    self.global_network.get_vars(),
-                                                                     self.local_network.get_vars())
+        apply_gradients, grad_norm = grad_applier.minimize_local(self.local_network.total_loss,
+                                                                 self.global_network.get_vars(),
+                                                                 self.local_network.get_vars())
+        self.apply_gradients = [self.global_network.count_update(apply_gradients), grad_norm]
         self.sync = self.local_network.sync_from(self.global_network, name="base_trainer")
         self.experience = experience
         self.local_t = 0
         self.next_log_t = 0
         self.next_performance_t = PERFORMANCE_LOG_INTERVAL
         self.initial_learning_rate = initial_learning_rate
-        self.episode_reward = 0
-        # trackers for the experience replay creation
-        self.last_state = None
+        # trackers for the experience replay creation, one
+        # (episode reward, last action, last reward) per rollout source
+        self.episode_trackers = {}
         self.last_action = 0
-        self.last_reward = 0
         self.ep_ploss = 0.
         self.ep_vloss = 0.
         self.ep_entr = []
         self.ep_grad = []
         self.ep_l = 0
+        # learner time spent waiting for rollouts vs. computing
+        self.wait_time = 0.
+        self.compute_time = 0.
+        # number of global updates between rollout generation and consumption
+        self.policy_lags = []
         
     
     def _anneal_learning_rate(self, global_time_step):
@@ -117,77 +178,126 @@ class BaseTrainer(object):
         
     def pull_batch_from_queue(self):
         """
-        take a rollout from the queue of the thread runner.
+        take rollouts from the queue of the thread runner.
+        Rollouts are taken until rollout_batch_length steps are collected or
+        rollout_batch_max_wait seconds have passed; the rollouts of one
+        environment are merged into one sequence.
         """
-        rollout_full = False
-        count = 0
-        while not rollout_full:
-            if count == 0:
-                rollout = self.runner.queue.get(timeout=600.0)
-                count += 1
-            else:
-                try:
-                    rollout.extend(self.runner.queue.get_nowait())
-                    count += 1
-                except queue.Empty:
-                    #logger.warn("!!! queue was empty !!!")
-                    continue
-            if count == 5 or rollout.terminal:
-                rollout_full = True
-        #logger.debug("pulled batch from rollout, length:{}".format(len(rollout.rewards)))
-        return rollout
+        rollouts = self.runner.queue.get_batch(self.rollout_batch_length,
+                                               self.rollout_batch_max_wait,
+                                               timeout=600.0)
+        #logger.debug("pulled {} sequences from the queue".format(len(rollouts)))
+        return rollouts
         
     def _print_log(self, global_t):
             elapsed_time = time.time() - self.start_time
             steps_per_sec = global_t / elapsed_time
             logger.info("Performance : {} STEPS in {:.0f} sec. {:.0f} STEPS/sec. {:.2f}M STEPS/hour".format(
             global_t,  elapsed_time, steps_per_sec, steps_per_sec * 3600 / 1000000.))
+            busy_time = self.wait_time + self.compute_time
+            if busy_time > 0:
+                logger.info("Learner : {:.0f} sec waiting for data ({:.1f}%), {:.0f} sec computing ({:.1f}%)".format(
+                self.wait_time, 100. * self.wait_time / busy_time, self.compute_time, 100. * self.compute_time / busy_time))
     
-    def _add_batch_to_exp(self, batch):
-        # if we just started, copy the first state as last state
-        if self.last_state is None:
-                self.last_state = batch.si[0]
-        #logger.debug("adding batch to exp. len:{}".format(len(batch.si)))
-        for k in range(len(batch.si)):
-            state = batch.si[k]
-            action = batch.a[k]#np.argmax(batch.a[k])
-            reward = batch.a_r[k][-1]
-
-            self.episode_reward += reward
-            features = batch.features[k]
-            pixel_change = batch.pc[k]
-            #logger.debug("k = {} of {} -- terminal = {}".format(k,len(batch.si), batch.terminal))
-            if k == len(batch.si)-1 and batch.terminal:
-                terminal = True
+    def _print_queue_log(self, summary_writer, global_t):
+            stats = self.runner.queue.get_stats()
+            if len(self.policy_lags) > 0:
+                stats["policy_lag"] = np.mean(self.policy_lags)
+                stats["policy_lag_max"] = np.max(self.policy_lags)
+                logger.info("Policy lag : {:.1f} updates (max {})".format(stats["policy_lag"], stats["policy_lag_max"]))
+                self.policy_lags = []
+            logger.info("Queue : depth {:.1f} (max {}), dwell {:.3f} sec (max {:.3f}), put {:.1f}/sec blocked {:.1f}%, get {:.1f}/sec blocked {:.1f}%".format(
+            stats["depth_mean"], stats["depth_max"], stats["dwell_mean"], stats["dwell_max"],
+            stats["put_rate"], 100. * stats["put_block"], stats["get_rate"], 100. * stats["get_block"]))
+            add_scalar_summaries(summary_writer, "queue", stats, global_t)
+            if Environment.worker_restarts > 0:
+                logger.warn("Env workers restarted : {}".format(Environment.worker_restarts))
+            add_scalar_summaries(summary_writer, "env", {"worker_restarts": Environment.worker_restarts}, global_t)
+            for command, latencies in sorted(worker_timing.get_latencies().items()):
+                logger.info("Env {} : {} calls, {:.4f} sec (max {:.4f})".format(
+                command, len(latencies), np.mean(latencies), np.max(latencies)))
+                add_histogram_summary(summary_writer, "env/{}_latency".format(command), latencies, global_t)
+            if self.runner.inference_server is not None:
+                batch_sizes, latencies = self.runner.inference_server.get_stats()
+                if len(batch_sizes) > 0:
+                    logger.info("Inference : {} batches, size {:.1f} (max {}), latency {:.4f} sec (max {:.4f})".format(
+                    len(batch_sizes), np.mean(batch_sizes), np.max(batch_sizes), np.mean(latencies), np.max(latencies)))
+                add_histogram_summary(summary_writer, "inference/batch_size", batch_sizes, global_t)
+                add_histogram_summary(summary_writer, "inference/latency", latencies, global_t)
+    
+    def _add_rollouts_to_exp(self, rollouts):
+        """
+        add the steps of every rollout to the experience replay and return the
+        rewards of the episodes that ended in them
+        """
+        episode_rewards = []
+        for rollout in rollouts:
+            episode_reward, last_action, last_reward = self.episode_trackers.get(rollout.source, (0, 0, 0))
+            dones = rollout.get_dones()
+            for k in range(len(rollout.states)):
+                action = rollout.actions[k]
+                reward = rollout.rewards[k]
+                episode_reward += reward
+                frame = ExperienceFrame(rollout.states[k], reward, action, dones[k], rollout.features[k],
+                                        rollout.pixel_changes[k], last_action, last_reward)
+                self.experience.add_frame(frame)
+                last_action = action
+                last_reward = reward
+                if dones[k]:
+                    episode_rewards.append(episode_reward)
+                    episode_reward = 0
+            self.episode_trackers[rollout.source] = (episode_reward, last_action, last_reward)
+            self.last_action = last_action
+        return episode_rewards
+    
+    def _process_rollouts_vtrace(self, sess, rollouts, gamma):
+        # evaluate the (stale) rollouts under the current parameters in one run,
+        # every unfinished rollout is followed by its bootstrap state
+        states = []
+        for rollout in rollouts:
+            states.extend(rollout.states)
+            if not rollout.terminal:
+                states.append(rollout.bootstrap_state)
+        pi, values = sess.run([self.local_network.base_inference_pi, self.local_network.base_inference_v],
+                              feed_dict={self.local_network.base_input: states})
+        target_probs = []
+        rollout_values = []
+        bootstrap_values = []
+        start = 0
+        for rollout in rollouts:
+            end = start + len(rollout.states)
+            actions = np.argmax(rollout.actions, axis=1)
+            target_probs.append(pi[np.arange(start, end), actions])
+            rollout_values.append(values[start:end])
+            if rollout.terminal:
+                bootstrap_values.append(0.)
+                start = end
             else:
-                terminal = False
-            frame = ExperienceFrame(state, reward, action, terminal, features, pixel_change,
-
-                            self.last_action, self.last_reward)
-            self.experience.add_frame(frame)
-            self.last_state = state
-            self.last_action = action
-            self.last_reward = reward
-            
-        if terminal:
-            total_ep_reward = self.episode_reward
-            self.episode_reward = 0
-            return total_ep_reward
-        else:
-            return None
-            
+                bootstrap_values.append(values[end])
+                start = end + 1
+        return process_rollouts_vtrace(rollouts, target_probs, rollout_values, bootstrap_values, gamma,
+                                       self.vtrace_clip_rho, self.vtrace_clip_c)
     
     def process(self, sess, global_t, summary_writer, summary_op, summary_values, base_lambda):
-        sess.run(self.sync)
+        _, param_version = sess.run([self.sync, self.global_network.param_version])
         cur_learning_rate = self._anneal_learning_rate(global_t)
         # Copy weights from shared to local
         #logger.debug("Syncing to global net -- current learning rate:{}".format(cur_learning_rate))
         #logger.debug("local_t:{} - global_t:{}".format(self.local_t,global_t))
 
 
-        # get batch from process_rollout
-        rollout = self.pull_batch_from_queue()
-        batch = process_rollout(rollout, gamma=0.99, lambda_=base_lambda)
+        # get batch from process_rollouts
+        wait_start = time.time()
+        rollouts = self.pull_batch_from_queue()
+        compute_start = time.time()
+        self.wait_time += compute_start - wait_start
+        for rollout in rollouts:
+            if rollout.param_version is not None:
+                self.policy_lags.append(param_version - rollout.param_version)
+        if self.use_vtrace:
+            batch = self._process_rollouts_vtrace(sess, rollouts, gamma=0.99)
+        else:
+            batch = process_rollouts(rollouts, gamma=0.99, lambda_=base_lambda)
         self.local_t += len(batch.si)
 
 
@@ -221,22 +331,24 @@ class BaseTrainer(object):
 
         self.ep_grad.append(grad)
         # add batch to experience replay
-        total_ep_reward = self._add_batch_to_exp(batch)
-        if total_ep_reward is not None:
+        episode_rewards = self._add_rollouts_to_exp(rollouts)
+        if len(episode_rewards) > 0:
             laststate = baseinput[np.newaxis,-1,...]
-            summary_str = sess.run(summary_op, feed_dict={summary_values[0]: total_ep_reward,
-                                                          summary_values[1]: self.ep_l,
-                                                          summary_values[2]: self.ep_ploss/self.ep_l,
-                                                          summary_values[3]: self.ep_vloss/self.ep_l,
-                                                          summary_values[4]: np.mean(self.ep_entr),
-                                                          summary_values[5]: np.mean(self.ep_grad),
-                                                          summary_values[6]: cur_learning_rate})#,
-                                                          #summary_values[7]: laststate})
-            summary_writer.add_summary(summary_str, global_t)
+            for total_ep_reward in episode_rewards:
+                summary_str = sess.run(summary_op, feed_dict={summary_values[0]: total_ep_reward,
+                                                              summary_values[1]: self.ep_l,
+                                                              summary_values[2]: self.ep_ploss/self.ep_l,
+                                                              summary_values[3]: self.ep_vloss/self.ep_l,
+                                                              summary_values[4]: np.mean(self.ep_entr),
+                                                              summary_values[5]: np.mean(self.ep_grad),
+                                                              summary_values[6]: cur_learning_rate})#,
+                                                              #summary_values[7]: laststate})
+                summary_writer.add_summary(summary_str, global_t)
             summary_writer.flush()
                     
             if self.local_t > self.next_performance_t:
                 self._print_log(global_t)
+                self._print_queue_log(summary_writer, global_t)
                 self.next_performance_t += PERFORMANCE_LOG_INTERVAL
                     
             if self.local_t >= self.next_log_t:
@@ -257,6 +369,7 @@ class BaseTrainer(object):
             self.ep_entr = []
             self.ep_grad = []
             
+        self.compute_time += time.time() - compute_start
         # Return advanced local step size
         diff_global_t = self.local_t - global_t
         return diff_global_t
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+from queuer import PartialRollout
+from train.base_trainer import process_rollouts
+from train.returns import returns_and_advantages
+
+
+def _rollout(rewards, terminal, r):
+  rollout = PartialRollout()
+  for k, reward in enumerate(rewards):
+    rollout.add(np.zeros(2), np.eye(3)[0], reward, 0.1 * k, False, [], [])
+  rollout.terminal = terminal
+  # the runners store the bootstrap value as returned by run_base_value, a [1] array
+  rollout.r = np.array([r], dtype=np.float32)
+  return rollout
+
+
+class TestProcessRollouts(unittest.TestCase):
+  def test_array_bootstrap_values(self):
+    gamma = 0.9
+    for terminals in [(False, False), (True, False)]:
+      rollouts = [_rollout([1., 0., 1.], terminals[0], 2.), _rollout([0.5], terminals[1], 3.)]
+      batch = process_rollouts(rollouts, gamma)
+      expected = []
+      for rollout in rollouts:
+        bootstrap = 0. if rollout.terminal else rollout.r[0]
+        returns, _ = returns_and_advantages([rollout.rewards], [rollout.values], bootstrap, gamma)
+        expected.append(returns[0])
+      self.assertTrue( np.allclose(batch.r, np.concatenate(expected)) )
+      self.assertEqual( list(batch.terminal), [False, False, terminals[0], terminals[1]] )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Batched return and advantage computation.
+All functions take [B, T] rewards and compute the targets of all B sequences
+in one backward pass over T with vectorized operations. discounted_returns()
+also accepts trailing reward dimensions (e.g. [B, T, 20, 20] pixel changes).
+
+dones[b, t] = 1 marks that the episode terminated with step t, so nothing is
+bootstrapped over that boundary. mask[b, t] = 0 marks padding steps after the
+end of a shorter sequence; the bootstrap value is carried over them to the
+last valid step.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def _expand(x, ndim):
+    # append axes to a [B] array so it broadcasts against [B, ...]
+    return np.reshape(x, x.shape + (1,) * (ndim - x.ndim))
+
+def _prepare(rewards, bootstrap_values, dones, mask):
+    rewards = np.asarray(rewards, dtype=np.float32)
+    batch_size, length = rewards.shape[:2]
+    bootstrap_values = np.broadcast_to(np.asarray(bootstrap_values, dtype=np.float32),
+                                       (batch_size,) + rewards.shape[2:])
+    if dones is None:
+        dones = np.zeros([batch_size, length], dtype=np.float32)
+    if mask is None:
+        mask = np.ones([batch_size, length], dtype=np.float32)
+    return rewards, bootstrap_values, np.asarray(dones, dtype=np.float32), np.asarray(mask, dtype=np.float32)
+
+def discounted_returns(rewards, bootstrap_values, gamma, dones=None, mask=None):
+    """
+    n-step discounted returns R_t = r_t + gamma * R_t+1, bootstrapped from
+    bootstrap_values after the last step of each sequence.
+    """
+    rewards, bootstrap_values, dones, mask = _prepare(rewards, bootstrap_values, dones, mask)
+    ndim = rewards.ndim - 1
+    returns = np.zeros_like(rewards)
+    acc = bootstrap_values
+    for t in reversed(range(rewards.shape[1])):
+        valid = _expand(mask[:, t], ndim)
+        discount = gamma * (1. - _expand(dones[:, t], ndim))
+        # padding steps pass the bootstrap value through unchanged
+        acc = valid * (rewards[:, t] + discount * acc) + (1. - valid) * acc
+        returns[:, t] = acc
+    return returns * _expand(mask, rewards.ndim)
+
+def returns_and_advantages(rewards, values, bootstrap_values, gamma, lambda_=1.0, dones=None, mask=None):
+    """
+    discounted returns and generalized advantage estimates
+    ("Generalized Advantage Estimation": https://arxiv.org/abs/1506.02438)
+    for [B, T] rewards and values.
+    """
+    rewards, bootstrap_values, dones, mask = _prepare(rewards, bootstrap_values, dones, mask)
+    values = np.asarray(values, dtype=np.float32)
+    returns = np.zeros_like(rewards)
+    advantages = np.zeros_like(rewards)
+    acc_return = bootstrap_values
+    acc_adv = np.zeros_like(bootstrap_values)
+    next_values = bootstrap_values
+    for t in reversed(range(rewards.shape[1])):
+        valid = mask[:, t]
+        not_done = 1. - dones[:, t]
+        acc_return = np.where(valid > 0, rewards[:, t] + gamma * not_done * acc_return, acc_return)
+        delta = rewards[:, t] + gamma * not_done * next_values - values[:, t]
+        acc_adv = np.where(valid > 0, delta + gamma * lambda_ * not_done * acc_adv, acc_adv)
+        next_values = np.where(valid > 0, values[:, t], next_values)
+        returns[:, t] = acc_return
+        advantages[:, t] = acc_adv
+    return returns * mask, advantages * mask
+
+def vtrace_returns_and_advantages(rewards, values, bootstrap_values, rhos, gamma, clip_rho=1.0, clip_c=1.0,
+                                  dones=None, mask=None):
+    """
+    V-trace targets and importance weighted policy gradient advantages
+    ("IMPALA": https://arxiv.org/abs/1802.01561) where rhos are the ratios
+    pi(a_t|x_t) / mu(a_t|x_t) of the target and behaviour policy.
+    """
+    rewards, bootstrap_values, dones, mask = _prepare(rewards, bootstrap_values, dones, mask)
+    values = np.asarray(values, dtype=np.float32)
+    rhos = np.asarray(rhos, dtype=np.float32)
+    clipped_rhos = np.minimum(clip_rho, rhos)
+    cs = np.minimum(clip_c, rhos)
+    vs = np.zeros_like(rewards)
+    advantages = np.zeros_like(rewards)
+    acc = np.zeros_like(bootstrap_values)
+    next_values = bootstrap_values
+    next_vs = bootstrap_values
+    for t in reversed(range(rewards.shape[1])):
+        valid = mask[:, t]
+        not_done = 1. - dones[:, t]
+        delta = clipped_rhos[:, t] * (rewards[:, t] + gamma * not_done * next_values - values[:, t])
+        acc = np.where(valid > 0, delta + gamma * not_done * cs[:, t] * acc, acc)
+        vs_t = values[:, t] + acc
+        advantages[:, t] = clipped_rhos[:, t] * (rewards[:, t] + gamma * not_done * next_vs - values[:, t])
+        vs[:, t] = vs_t
+        next_values = np.where(valid > 0, values[:, t], next_values)
+        next_vs = np.where(valid > 0, vs_t, next_vs)
+    return vs * mask, advantages * mask
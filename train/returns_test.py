@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+import numpy as np
+import scipy.signal
+
+from train.returns import discounted_returns, returns_and_advantages, vtrace_returns_and_advantages
+
+
+def discount(x, gamma):
+  return scipy.signal.lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
+
+
+class TestReturns(unittest.TestCase):
+  def setUp(self):
+    random = np.random.RandomState(0)
+    self.rewards = random.rand(3, 10)
+    self.values = random.rand(3, 10)
+    self.bootstrap = random.rand(3)
+    self.gamma = 0.9
+    self.lambda_ = 0.8
+
+  def _reference(self, rewards, values, bootstrap):
+    # single sequence computation with lfilter (the former process_rollout)
+    vpred_t = np.append(values, bootstrap)
+    returns = discount(np.append(rewards, bootstrap), self.gamma)[:-1]
+    delta_t = rewards + self.gamma * vpred_t[1:] - vpred_t[:-1]
+    advantages = discount(delta_t, self.gamma * self.lambda_)
+    return returns, advantages
+
+  def test_batch_matches_single_sequences(self):
+    returns, advantages = returns_and_advantages(self.rewards, self.values, self.bootstrap,
+                                                 self.gamma, self.lambda_)
+    for b in range(3):
+      ref_returns, ref_advantages = self._reference(self.rewards[b], self.values[b], self.bootstrap[b])
+      self.assertTrue( np.allclose(returns[b], ref_returns, atol=1e-5) )
+      self.assertTrue( np.allclose(advantages[b], ref_advantages, atol=1e-5) )
+      self.assertTrue( np.allclose(discounted_returns(self.rewards, self.bootstrap, self.gamma)[b],
+                                   ref_returns, atol=1e-5) )
+
+  def test_episode_boundary(self):
+    dones = np.zeros([3, 10])
+    dones[0, 4] = 1.
+    returns, advantages = returns_and_advantages(self.rewards, self.values, self.bootstrap,
+                                                 self.gamma, self.lambda_, dones=dones)
+    # steps up to the terminal step don't see anything after it
+    ref_returns, ref_advantages = self._reference(self.rewards[0, :5], self.values[0, :5], 0.)
+    self.assertTrue( np.allclose(returns[0, :5], ref_returns, atol=1e-5) )
+    self.assertTrue( np.allclose(advantages[0, :5], ref_advantages, atol=1e-5) )
+    ref_returns, ref_advantages = self._reference(self.rewards[0, 5:], self.values[0, 5:], self.bootstrap[0])
+    self.assertTrue( np.allclose(returns[0, 5:], ref_returns, atol=1e-5) )
+    self.assertTrue( np.allclose(advantages[0, 5:], ref_advantages, atol=1e-5) )
+
+  def test_padding_mask(self):
+    mask = np.ones([3, 10])
+    mask[1, 6:] = 0.
+    returns, advantages = returns_and_advantages(self.rewards, self.values, self.bootstrap,
+                                                 self.gamma, self.lambda_, mask=mask)
+    ref_returns, ref_advantages = self._reference(self.rewards[1, :6], self.values[1, :6], self.bootstrap[1])
+    self.assertTrue( np.allclose(returns[1, :6], ref_returns, atol=1e-5) )
+    self.assertTrue( np.allclose(advantages[1, :6], ref_advantages, atol=1e-5) )
+    self.assertTrue( np.all(returns[1, 6:] == 0.) )
+
+  def test_trailing_dimensions(self):
+    rewards = np.random.rand(2, 5, 4, 4)
+    bootstrap = np.random.rand(2, 4, 4)
+    returns = discounted_returns(rewards, bootstrap, self.gamma)
+    ref = discount(np.concatenate([rewards[1], bootstrap[1][np.newaxis]]), self.gamma)[:-1]
+    self.assertTrue( np.allclose(returns[1], ref, atol=1e-5) )
+
+  def test_vtrace_on_policy(self):
+    # with pi == mu and no clipping v-trace reduces to n-step returns and lambda=1 advantages
+    rhos = np.ones([3, 10])
+    vs, advantages = vtrace_returns_and_advantages(self.rewards, self.values, self.bootstrap, rhos, self.gamma)
+    returns, gae = returns_and_advantages(self.rewards, self.values, self.bootstrap, self.gamma, 1.0)
+    self.assertTrue( np.allclose(vs, returns, atol=1e-5) )
+    self.assertTrue( np.allclose(advantages, gae, atol=1e-5) )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -7,9 +7,17 @@ import logging
 import tensorflow as tf
 from tensorflow.python.training import training_ops
 from tensorflow.python.training import slot_creator
+from tensorflow.python.ops import resource_variable_ops
 
 logger = logging.getLogger("StRADRL.rmsprop_applier")
 
+def _gradient_target(var):
+  # the gradient of a resource variable is taken at its handle, it
+  # collects the gradients of all reads of the variable
+  if isinstance(var, resource_variable_ops.ResourceVariable):
+    return var.handle
+  return var._ref()
+
 class RMSPropApplier(object):
 
   def __init__(self,
@@ -85,6 +93,15 @@ class RMSPropApplier(object):
   def _apply_dense(self, grad, var):
     rms = self.get_slot(var, "rms")
     mom = self.get_slot(var, "momentum")
+    if isinstance(var, resource_variable_ops.ResourceVariable):
+      return training_ops.resource_apply_rms_prop(
+        var.handle, rms.handle, mom.handle,
+        self._learning_rate_tensor,
+        self._decay_tensor,
+        self._momentum_tensor,
+        self._epsilon_tensor,
+        grad,
+        use_locking=False)
     return training_ops.apply_rms_prop(
       var, rms, mom,
       self._learning_rate_tensor,
@@ -104,7 +121,7 @@ class RMSPropApplier(object):
     minimize loss and apply gradients to global vars.
     """
     with tf.device(self._device):
-      var_refs = [v._ref() for v in local_var_list]
+      var_refs = [_gradient_target(v) for v in local_var_list]
       local_gradients = tf.gradients(
         loss, var_refs,
         gate_gradients=False,